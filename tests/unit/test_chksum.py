@@ -3,6 +3,8 @@
 udocker unit tests: ChkSUM
 """
 
+import os
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch
 from udocker.utils.chksum import ChkSUM
@@ -92,6 +94,37 @@ class ChkSUMTestCase(TestCase):
     #         status = cksum.hash("filename", "sha512")
     #         self.assertEqual(status, sha512sum)
 
+    def test_11_hasher(self):
+        """Test11 ChkSUM().hasher()."""
+        hasher = ChkSUM().hasher("sha256")
+        hasher.update(b"abc")
+        self.assertEqual(hasher.hexdigest(), "ba7816bf8f01cfea414140de5dae2223"
+                         "b00361a396177a9cb410ff61f20015ad")
+        self.assertIsNone(ChkSUM().hasher("md5"))
+
+    def test_12_hash_many(self):
+        """Test12 ChkSUM().hash_many()."""
+        tmpdir = tempfile.mkdtemp()
+        filenames = []
+        for (num, data) in enumerate((b"abc", b"", b"x" * 3000000)):
+            filenames.append(tmpdir + "/file%d" % num)
+            with open(filenames[-1], "wb") as filep:
+                filep.write(data)
+        chksum = ChkSUM()
+        status = chksum.hash_many(filenames + [tmpdir + "/none"], "sha256",
+                                  workers=2)
+        for filename in filenames:
+            self.assertEqual(status[filename],
+                             chksum.hash(filename, "sha256"))
+        self.assertEqual(status[filenames[0]],
+                         "ba7816bf8f01cfea414140de5dae2223"
+                         "b00361a396177a9cb410ff61f20015ad")
+        self.assertEqual(status[tmpdir + "/none"], "")
+        self.assertEqual(chksum.hash_many([], "sha256"), {})
+        for filename in filenames:
+            os.remove(filename)
+        os.rmdir(tmpdir)
+
 
 if __name__ == '__main__':
     main()
@@ -840,24 +840,32 @@ class UdockerCLITestCase(TestCase):
         status = udoc.do_images(cmdp)
         self.assertEqual(status, 1)
 
-        argv = ["udocker", "images", "-l"]
+        argv = ["udocker", "images", "-l", "-p"]
         cmdp = CmdParser()
         cmdp.parse(argv)
-        self.local.get_imagerepos.return_value = [("img1", "tag1")]
-        self.local.isprotected_imagerepo.return_value = False
-        self.local.cd_imagerepo.return_value = "/img1"
-        self.local.get_layers.return_value = [("l1", 1024)]
+        self.local.reposdir = "/repos"
+        self.local.get_images_index.return_value = [
+            ("img1", "tag1", {"protected": False, "platform": "linux/amd64",
+                              "layers": [["l1", 1024]]})]
         udoc = UdockerCLI(self.local)
         status = udoc.do_images(cmdp)
         self.assertEqual(status, 0)
-        self.assertTrue(self.local.get_imagerepos.called)
-        self.assertTrue(self.local.isprotected_imagerepo.called)
-        self.assertTrue(self.local.cd_imagerepo.called)
-        self.assertTrue(self.local.get_layers.called)
+        self.assertTrue(self.local.get_images_index.called)
+        self.assertFalse(self.local.reindex_images.called)
+
+        argv = ["udocker", "images", "--reindex"]
+        cmdp = CmdParser()
+        cmdp.parse(argv)
+        udoc = UdockerCLI(self.local)
+        status = udoc.do_images(cmdp)
+        self.assertEqual(status, 0)
+        self.assertTrue(self.local.reindex_images.called)
+        self.assertTrue(self.local.rebuild_layer_refs.called)
 
     @patch('udocker.cli.DockerIoAPI')
+    @patch('udocker.cli.ContainerStructure')
     @patch('udocker.cli.ExecutionMode')
-    def test_25_do_ps(self, mock_exec, mock_dockerio):
+    def test_25_do_ps(self, mock_exec, mock_cstruct, mock_dockerio):
         """Test25 UdockerCLI().do_ps()."""
         argv = ["udocker", "-h"]
         cmdp = CmdParser()
@@ -871,18 +879,33 @@ class UdockerCLITestCase(TestCase):
         mock_proot = Mock()
         proot.return_value = mock_proot
         cdir = "/home/u1/.udocker/containers"
-        argv = ["udocker", "ps", "-m", "-s"]
+        argv = ["udocker", "ps", "-m", "-s", "-p"]
         cmdp = CmdParser()
         cmdp.parse(argv)
         self.local.get_containers_list.return_value = [[cdir, "/", "a"]]
         mock_exec.return_value.get_engine.return_value = proot
+        mock_cstruct.return_value.get_container_platform_fmt.return_value = \
+            "linux/amd64"
         self.local.isprotected_container.return_value = False
         self.local.iswriteable_container.return_value = True
         self.local.get_size.return_value = 1024
+        self.local.get_containers_index.return_value = {}
         udoc = UdockerCLI(self.local)
         status = udoc.do_ps(cmdp)
-        self.assertEqual(status, 0)
         exeng_patch.stop()
+        self.assertEqual(status, 0)
+        self.assertTrue(self.local.get_size.called)
+        self.local.update_containers_index.assert_called_once_with(
+            {cdir: {"platform": "linux/amd64"}})
+
+        mock_cstruct.reset_mock()
+        self.local.update_containers_index.reset_mock()
+        self.local.get_containers_index.return_value = {
+            cdir: {"platform": "linux/amd64"}}
+        status = udoc.do_ps(cmdp)
+        self.assertEqual(status, 0)
+        self.assertFalse(mock_cstruct.called)
+        self.assertFalse(self.local.update_containers_index.called)
 
     @patch('udocker.cli.DockerIoAPI')
     @patch('udocker.cli.Msg')
@@ -1566,6 +1589,45 @@ class UdockerCLITestCase(TestCase):
         self.assertEqual(status, 0)
         self.assertTrue(mock_msg.return_value.out.called)
 
+    @patch('udocker.cli.RepositoryGC')
+    @patch('udocker.cli.DockerIoAPI')
+    @patch('udocker.cli.Msg')
+    def test_40_do_gc(self, mock_msg, mock_dockerio, mock_gc):
+        """Test40 UdockerCLI().do_gc()."""
+        mock_msg.level = 0
+        argv = ["udocker", "gc", "--age=x"]
+        cmdp = CmdParser()
+        cmdp.parse(argv)
+        udoc = UdockerCLI(self.local)
+        status = udoc.do_gc(cmdp)
+        self.assertEqual(status, 1)
+        self.assertFalse(mock_gc.called)
+
+        argv = ["udocker", "gc", "--dry-run", "--age=2h"]
+        cmdp = CmdParser()
+        cmdp.parse(argv)
+        mock_gc.return_value.collect.return_value = \
+            ([("layer", "/l/sha256:aa", 1024)], [])
+        udoc = UdockerCLI(self.local)
+        status = udoc.do_gc(cmdp)
+        self.assertEqual(status, 0)
+        mock_gc.assert_called_with(self.local, 7200)
+        mock_gc.return_value.collect.assert_called_with(True)
+
+        self.assertFalse(self.local.migrate_layers.called)
+
+        argv = ["udocker", "gc", "--migrate"]
+        cmdp = CmdParser()
+        cmdp.parse(argv)
+        mock_gc.return_value.collect.return_value = \
+            ([("layer", "/l/sha256:aa", 1024)], ["/l/sha256:aa"])
+        udoc = UdockerCLI(self.local)
+        status = udoc.do_gc(cmdp)
+        self.assertEqual(status, 1)
+        self.assertTrue(self.local.migrate_layers.called)
+        mock_gc.assert_called_with(self.local, 86400)
+        mock_gc.return_value.collect.assert_called_with(False)
+
 
 if __name__ == '__main__':
     main()
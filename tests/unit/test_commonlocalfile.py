@@ -132,8 +132,11 @@ class CommonLocalFileApiTestCase(TestCase):
         mock_version.return_value = "8"
         mock_size.return_value = 125
         mock_chksum.return_value = 'abc123'
+        self.local.layersdir = "/home/.udocker/layers"
         clfapi = CommonLocalFileApi(self.local)
         status = clfapi.create_container_meta(layer_id, comment)
+        self.local.set_layer_digest.assert_called_once_with(
+            "/home/.udocker/layers/12345.layer", "sha256", "abc123")
         self.assertEqual(status["id"], layer_id)
         self.assertEqual(status["comment"], comment)
         self.assertEqual(status["rootfs"]["diff_ids"], ["sha256:" + 'abc123', ])
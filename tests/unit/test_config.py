@@ -86,6 +86,17 @@ class ConfigTestCase(TestCase):
         config.container()
         self.assertTrue(mock_fileover.called)
 
+    @patch('udocker.config.Msg')
+    @patch('udocker.config.os.getenv')
+    def test_06__env_override_invalid(self, mock_env, mock_msg):
+        """Test06 Config()._env_override with invalid number"""
+        mock_env.side_effect = lambda key, default=None: \
+            "big" if key == "UDOCKER_ROOTFS_CACHE_SIZE" else default
+        Config.conf['rootfs_cache_size'] = 1024
+        Config()._env_override()
+        self.assertEqual(Config.conf['rootfs_cache_size'], 1024)
+        self.assertTrue(mock_msg.return_value.err.called)
+
 
 if __name__ == '__main__':
     main()
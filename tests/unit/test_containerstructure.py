@@ -5,9 +5,15 @@
 udocker unit tests: ContainerStructure
 """
 
+import os
+import json
+import shutil
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch, Mock
 from udocker.container.structure import ContainerStructure
+from udocker.container.localrepo import LocalRepository
+from udocker.utils.fileutil import FileUtil
 from udocker.config import Config
 import collections
 
@@ -296,36 +302,23 @@ class ContainerStructureTestCase(TestCase):
 
     @patch('udocker.container.structure.os.listdir')
     @patch('udocker.container.structure.os.path.isdir')
-    @patch('udocker.container.structure.os.path.dirname')
-    @patch('udocker.container.structure.os.path.basename')
-    @patch('udocker.container.structure.Uprocess.get_output')
-    @patch('udocker.container.structure.HostInfo.cmd_has_option')
     @patch('udocker.container.structure.FileUtil.remove')
-    def test_10__apply_whiteouts(self, mock_furm, mock_hinfocmd,
-                                 mock_uprocget, mock_base, mock_dir,
-                                 mock_isdir, mock_lsdir):
+    def test_10__apply_whiteouts(self, mock_furm, mock_isdir, mock_lsdir):
         """Test10 ContainerStructure()._apply_whiteouts()."""
-        mock_hinfocmd.return_value = False
-        mock_uprocget.return_value = ""
+        self.local.get_layer_whiteouts.return_value = []
         prex = ContainerStructure(self.local)
         prex._apply_whiteouts("tarball", "/tmp")
-        self.assertTrue(mock_hinfocmd.called)
-        self.assertTrue(mock_uprocget.called)
-
-        mock_hinfocmd.return_value = False
-        mock_uprocget.return_value = "/d1/.wh.aa\n/d1/.wh.bb\n"
-        mock_base.side_effect = [".wh.aa", ".wh.bb", ".wh.aa", ".wh.bb"]
-        mock_dir.side_effect = ["/d1", "/d2"]
-        mock_isdir.side_effect = [True, True]
-        mock_lsdir.side_effect = [".wh.aa", ".wh.bb"]
-        mock_furm.side_effect = [None, None]
+        self.local.get_layer_whiteouts.assert_called_with("tarball")
+        self.assertFalse(mock_furm.called)
+
+        self.local.get_layer_whiteouts.return_value = \
+            ["d1/.wh.aa", "d2/.wh..wh..opq"]
+        mock_isdir.return_value = True
+        mock_lsdir.return_value = ["bb", "cc"]
+        mock_furm.return_value = True
         prex = ContainerStructure(self.local)
         prex._apply_whiteouts("tarball", "/tmp")
-        self.assertTrue(mock_hinfocmd.called)
-        self.assertTrue(mock_uprocget.called)
-        self.assertTrue(mock_base.called)
-        self.assertTrue(mock_dir.called)
-        self.assertTrue(mock_furm.called)
+        self.assertEqual(mock_furm.call_count, 3)
 
     @patch('udocker.container.structure.HostInfo')
     @patch('udocker.container.structure.subprocess.call')
@@ -436,6 +429,133 @@ class ContainerStructureTestCase(TestCase):
         status = prex.clone()
         self.assertEqual(status, "123456")
 
+    @patch.object(ContainerStructure, '_untar_layers_tar')
+    @patch('udocker.container.structure.LayerExtractor')
+    @patch('udocker.container.structure.Msg')
+    def test_15__untar_layers_python(self, mock_msg, mock_lext,
+                                     mock_untartar):
+        """Test15 ContainerStructure()._untar_layers() python engine."""
+        mock_msg.level = 0
+        mock_msg.VER = 3
+        Config().conf['untar_engine'] = "python"
+        mock_lext.return_value.is_supported.side_effect = \
+            lambda tarf: tarf != "c.tar.zst"
+        mock_lext.return_value.extract.return_value = True
+        mock_untartar.return_value = True
+        prex = ContainerStructure(self.local)
+        status = prex._untar_layers(["a.tar", "c.tar.zst", "b.tar"], "/tmp")
+        self.assertTrue(status)
+        self.assertEqual(mock_lext.return_value.extract.call_count, 2)
+        mock_untartar.assert_called_once_with(["c.tar.zst", ], "/tmp")
+
+        mock_lext.return_value.extract.return_value = False
+        status = prex._untar_layers(["a.tar"], "/tmp")
+        self.assertFalse(status)
+        Config().conf['untar_engine'] = "tar"
+
+    @patch.object(ContainerStructure, '_apply_whiteouts')
+    @patch.object(ContainerStructure, '_untar_layers')
+    @patch('udocker.container.structure.LayerCache')
+    @patch('udocker.container.structure.Msg')
+    def test_16__assemble_from_layers(self, mock_msg, mock_lcache,
+                                      mock_untar, mock_appwhite):
+        """Test16 ContainerStructure()._assemble_from_layers()."""
+        mock_msg.level = 0
+        mock_lcache.return_value.is_enabled.return_value = False
+        mock_untar.return_value = True
+        prex = ContainerStructure(self.local)
+        status = prex._assemble_from_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        mock_untar.assert_called_once_with(["a.tar", "b.tar"], "/ROOT")
+
+        mock_untar.reset_mock()
+        mock_lcache.return_value.is_enabled.return_value = True
+        mock_lcache.return_value.get.side_effect = \
+            lambda tarf, extract: "" if tarf == "b.tar" else "/c/" + tarf
+        mock_lcache.return_value.copy_tree.return_value = True
+        self.local.get_layer_dirs.return_value = ["d"]
+        status = prex._assemble_from_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        mock_untar.assert_called_once_with(["b.tar", ], "/ROOT")
+        mock_appwhite.assert_called_once_with("a.tar", "/ROOT")
+        self.local.get_layer_dirs.assert_called_once_with("a.tar")
+        mock_lcache.return_value.copy_tree.assert_called_once_with(
+            "/c/a.tar", "/ROOT", ["d"])
+
+        mock_lcache.return_value.copy_tree.return_value = False
+        status = prex._assemble_from_layers(["a.tar"], "/ROOT")
+        self.assertFalse(status)
+
+    @patch.object(ContainerStructure, '_assemble_from_layers')
+    @patch('udocker.container.structure.RootfsCache')
+    @patch('udocker.container.structure.Msg')
+    def test_17__assemble_layers(self, mock_msg, mock_rcache, mock_fromlay):
+        """Test17 ContainerStructure()._assemble_layers()."""
+        mock_msg.level = 0
+        mock_rcache.return_value.is_enabled.return_value = False
+        mock_fromlay.return_value = True
+        prex = ContainerStructure(self.local)
+        status = prex._assemble_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        self.assertFalse(mock_rcache.return_value.put_rootfs.called)
+
+        mock_rcache.return_value.is_enabled.return_value = True
+        mock_rcache.return_value.get_rootfs.return_value = ""
+        status = prex._assemble_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        mock_rcache.return_value.put_rootfs.assert_called_once_with(
+            ["a.tar", "b.tar"], "/ROOT")
+
+        mock_fromlay.reset_mock()
+        mock_rcache.return_value.get_rootfs.return_value = "/snap/ROOT"
+        mock_rcache.return_value.copy_tree.return_value = True
+        with patch('udocker.container.structure.os.path.isdir') as mock_dir:
+            mock_dir.return_value = True
+            status = prex._assemble_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        self.assertFalse(mock_fromlay.called)
+        mock_rcache.return_value.copy_tree.assert_called_once_with(
+            "/snap/ROOT", "/ROOT")
+        mock_rcache.return_value.lock_rootfs.assert_called_with(
+            "/snap/ROOT", shared=True)
+
+        mock_rcache.return_value.copy_tree.reset_mock()
+        status = prex._assemble_layers(["a.tar", "b.tar"], "/ROOT")
+        self.assertTrue(status)
+        self.assertTrue(mock_fromlay.called)
+        self.assertFalse(mock_rcache.return_value.copy_tree.called)
+
+    @patch('udocker.container.structure.OSInfo')
+    def test_18_get_container_platform(self, mock_osinfo):
+        """Test18 ContainerStructure().get_container_platform() cached."""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        with open(tmpdir + "/container.json", "w") as filep:
+            json.dump({"os": "linux", "architecture": "arm",
+                       "variant": "v7"}, filep)
+        self.local.cd_container.return_value = tmpdir
+        self.local.load_json.side_effect = \
+            LocalRepository(tmpdir).load_json
+        self.local.save_json.side_effect = \
+            LocalRepository(tmpdir).save_json
+        mock_osinfo.return_value.arch.side_effect = \
+            lambda target: {"UDOCKER": "armhf", "qemu": "arm"}[target]
+        prex = ContainerStructure(self.local, "123")
+        self.assertEqual(prex.get_container_platform_fmt(), "linux/arm/v7")
+        self.assertEqual(prex.get_container_arch("qemu"), "arm")
+        self.assertEqual(prex.get_container_arch(), "armhf")
+        self.assertEqual(mock_osinfo.return_value.arch.call_count, 2)
+        mock_osinfo.assert_called_once_with(tmpdir + "/ROOT")
+        with open(tmpdir + "/platform.json") as filep:
+            self.assertEqual(json.load(filep)["UDOCKER"], "armhf")
+
+        FileUtil.safe_prefixes = [tmpdir + "/"]
+        self.assertTrue(prex.clear_container_platform())
+        self.assertFalse(os.path.exists(tmpdir + "/platform.json"))
+        self.assertTrue(prex.clear_container_platform())
+        self.assertEqual(prex.get_container_arch(), "armhf")
+        self.assertEqual(mock_osinfo.return_value.arch.call_count, 4)
+        shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     main()
@@ -12,6 +12,7 @@ from udocker.utils.curl import CurlHeader
 from udocker.utils.curl import GetURL
 from udocker.utils.curl import GetURLpyCurl
 from udocker.utils.curl import GetURLexeCurl
+from udocker.utils.curl import GetURLhttpClient
 from udocker.config import Config
 import collections
 
@@ -99,13 +100,15 @@ class GetURLTestCase(TestCase):
         """Mock for pycurl.get."""
         return args[0]
 
+    @patch.object(GetURLhttpClient, 'is_available')
     @patch.object(GetURLexeCurl, '_select_implementation')
     @patch.object(GetURLexeCurl, 'is_available')
     @patch.object(GetURLpyCurl, 'is_available')
     @patch('udocker.utils.curl.Msg')
     def test_01_init(self, mock_msg, mock_gupycurl,
-                     mock_guexecurl, mock_select):
+                     mock_guexecurl, mock_select, mock_guhttp):
         """Test01 GetURL() constructor."""
+        mock_guhttp.return_value = False
         mock_msg.level = 0
         mock_gupycurl.return_value = False
         mock_guexecurl.return_value = True
@@ -116,12 +119,14 @@ class GetURLTestCase(TestCase):
         self.assertFalse(geturl.cache_support)
 
     @patch('udocker.utils.curl.Msg')
+    @patch.object(GetURLhttpClient, 'is_available')
     @patch.object(GetURLexeCurl, 'is_available')
     @patch.object(GetURLpyCurl, 'is_available')
     def test_02__select_implementation(self, mock_gupycurl,
-                                       mock_guexecurl, mock_msg):
+                                       mock_guexecurl, mock_guhttp, mock_msg):
         """Test02 GetURL()._select_implementation()."""
         mock_msg.level = 0
+        mock_guhttp.return_value = False
         mock_gupycurl.return_value = True
         geturl = GetURL()
         geturl._select_implementation()
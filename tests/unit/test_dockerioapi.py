@@ -5,6 +5,7 @@
 udocker unit tests: DockerIoAPI
 """
 
+import time
 from unittest import TestCase, main
 from unittest.mock import Mock, patch
 from io import BytesIO as strio
@@ -571,15 +572,30 @@ class DockerIoAPITestCase(TestCase):
         doia.registry_url = "https://registry-1.docker.io"
 
         mock_dgf.return_value = True
+        Config.conf['untar_engine'] = "tar"
+        self.local.find_shared_layer.return_value = ""
         doia = DockerIoAPI(self.local)
         out = doia.get_v2_image_layer(imagerepo, layer_id)
         self.assertTrue(out)
+        self.assertTrue(self.local.get_layer_whiteouts.called)
 
         mock_dgf.return_value = False
         doia = DockerIoAPI(self.local)
         out = doia.get_v2_image_layer(imagerepo, layer_id)
         self.assertFalse(out)
 
+        mock_dgf.reset_mock()
+        self.local.find_shared_layer.return_value = "/shared/LAYERID"
+        out = doia.get_v2_image_layer(imagerepo, layer_id)
+        self.assertTrue(out)
+        self.assertFalse(mock_dgf.called)
+        self.local.add_image_layer.assert_called_with("/shared/LAYERID")
+
+        self.local.add_image_layer.return_value = False
+        out = doia.get_v2_image_layer(imagerepo, layer_id)
+        self.assertFalse(out)
+        self.local.add_image_layer.return_value = True
+
     @patch.object(GetURLpyCurl, 'is_available')
     @patch('udocker.docker.Msg')
     @patch.object(DockerIoAPI, 'get_v2_image_layer')
@@ -924,6 +940,136 @@ class DockerIoAPITestCase(TestCase):
         out = doia.search_get_page("SOMETHING")
         self.assertEqual(out, {"page": 1, "num_pages": 1})
 
+    @patch.object(GetURLpyCurl, 'is_available')
+    def test_39_set_parallel_layers(self, mock_gupycurl):
+        """Test39 DockerIoAPI().set_parallel_layers"""
+        mock_gupycurl.return_value = True
+        doia = DockerIoAPI(self.local)
+        doia.set_parallel_layers("4")
+        self.assertEqual(doia.parallel_layers, 4)
+        doia.set_parallel_layers(0)
+        self.assertEqual(doia.parallel_layers, 1)
+        doia.set_parallel_layers("xx")
+        self.assertEqual(doia.parallel_layers, 1)
+
+    @patch.object(GetURLpyCurl, 'is_available')
+    @patch('udocker.docker.Msg')
+    @patch.object(DockerIoAPI, '_clone')
+    def test_40__get_v2_layers_parallel(self, mock_clone, mock_msg,
+                                        mock_gupycurl):
+        """Test40 DockerIoAPI()._get_v2_layers_parallel"""
+        mock_gupycurl.return_value = True
+        mock_msg.level = 0
+        mock_worker = Mock()
+
+        def _get_file(repo, blob):
+            """Finish the first layers last"""
+            if blob == "sha256:aa":
+                time.sleep(0.1)
+            return "/layers/" + blob
+        mock_worker._get_v2_image_layer_file.side_effect = _get_file
+        mock_clone.return_value = mock_worker
+        doia = DockerIoAPI(self.local)
+        doia.localrepo = Mock()
+        doia.set_parallel_layers(3)
+        blobs = ["sha256:aa", "sha256:bb", "sha256:aa", "sha256:cc"]
+        out = doia.get_v2_layers_all("REPO", [{"digest": blob}
+                                              for blob in reversed(blobs)])
+        self.assertEqual(out, blobs)
+        self.assertEqual(
+            mock_worker._get_v2_image_layer_file.call_count, 3)
+        linked = [call[0][0] for call in
+                  doia.localrepo.add_image_layer.call_args_list]
+        self.assertEqual(linked, ["/layers/" + blob for blob in blobs])
+        self.assertEqual([call[0][0] for call in
+                          doia.localrepo.lock_layer.call_args_list],
+                         ["sha256:aa", "sha256:bb", "sha256:cc"])
+        lock = doia.localrepo.lock_layer.return_value
+        self.assertEqual(lock.acquire.call_count, 3)
+        self.assertEqual(lock.release.call_count, 3)
+
+        mock_worker._get_v2_image_layer_file.side_effect = \
+            lambda repo, blob: "" if blob == "sha256:bb" else "/l/" + blob
+        doia.localrepo = Mock()
+        out = doia.get_v2_layers_all("REPO", [{"digest": blob}
+                                              for blob in reversed(blobs)])
+        self.assertEqual(out, [])
+        self.assertEqual(
+            doia.localrepo.lock_layer.return_value.release.call_count, 3)
+
+        mock_worker._get_v2_image_layer_file.side_effect = \
+            lambda repo, blob: "/l/" + blob
+        doia.localrepo = Mock()
+        doia.localrepo.add_image_layer.return_value = False
+        out = doia.get_v2_layers_all("REPO", [{"digest": blob}
+                                              for blob in reversed(blobs)])
+        self.assertEqual(out, [])
+
+    @patch.object(GetURLpyCurl, 'is_available')
+    @patch.object(DockerIoAPI, '_get_url')
+    @patch('udocker.utils.curl.CurlHeader')
+    def test_41__get_v2_cached_auth(self, mock_hdr, mock_dgu,
+                                    mock_gupycurl):
+        """Test41 DockerIoAPI()._get_v2_cached_auth"""
+        mock_gupycurl.return_value = True
+        www_authenticate = 'Bearer realm="https://auth/token",' \
+            'service="registry",scope="repository:library/a:pull"'
+        mock_dgu.return_value = \
+            (mock_hdr, strio(b'{"token": "YYY", "expires_in": 300}'))
+        doia = DockerIoAPI(self.local)
+        doia.registry_url = "https://registry"
+        url = "https://registry/v2/library/a/manifests/latest"
+        self.assertEqual(doia._get_v2_cached_auth(url), "")
+        out = doia._get_v2_auth(www_authenticate, 3)
+        self.assertEqual(out, "Authorization: Bearer YYY")
+        self.assertEqual(doia._get_v2_cached_auth(url),
+                         "Authorization: Bearer YYY")
+        self.assertEqual(doia._get_v2_cached_auth(
+            "https://registry/v2/library/b/blobs/sha256:aa"), "")
+        self.assertEqual(doia._get_v2_cached_auth(
+            "https://other/v2/library/a/manifests/latest"), "")
+        out = doia._get_v2_auth(www_authenticate, 3)
+        self.assertEqual(mock_dgu.call_count, 1)
+
+        mock_dgu.return_value = (mock_hdr, strio(b'{"token": "ZZZ"}'))
+        out = doia._get_v2_auth(www_authenticate, 3,
+                                "Authorization: Bearer YYY")
+        self.assertEqual(out, "Authorization: Bearer ZZZ")
+        self.assertEqual(mock_dgu.call_count, 2)
+
+    @patch.object(GetURLpyCurl, 'is_available')
+    @patch('udocker.docker.Msg')
+    @patch('udocker.docker.FileUtil')
+    @patch('udocker.docker.ChkSUM.hash')
+    @patch.object(DockerIoAPI, '_get_url')
+    def test_42__get_file_digest(self, mock_dgu, mock_hash, mock_fu,
+                                 mock_msg, mock_gupycurl):
+        """Test42 DockerIoAPI()._get_file() streamed digest"""
+        mock_gupycurl.return_value = True
+        mock_hash.return_value = ""
+        mock_fu.return_value.size.return_value = 3
+        hdr = Mock()
+        hdr.data = {"X-ND-HTTPSTATUS": "HTTP/1.1 200 OK",
+                    "X-ND-CURLSTATUS": 0, "content-length": "3",
+                    "X-ND-DIGEST": "sha256:aa"}
+        mock_dgu.return_value = (hdr, strio())
+        doia = DockerIoAPI(self.local)
+        doia.localrepo = Mock()
+        doia.localrepo.get_layer_digest.return_value = ""
+        self.assertTrue(doia._get_file("http://r/blob", "/l/sha256:aa", 3))
+        self.assertEqual(mock_dgu.call_args[1]["digest"], "sha256")
+        doia.localrepo.set_layer_digest.assert_called_with(
+            "/l/sha256:aa", "sha256", "aa")
+
+        hdr.data["X-ND-DIGEST"] = "sha256:bb"
+        self.assertFalse(doia._get_file("http://r/blob", "/l/sha256:aa", 3))
+        self.assertTrue(mock_fu.return_value.remove.called)
+
+        mock_dgu.reset_mock()
+        doia.localrepo.get_layer_digest.return_value = "aa"
+        self.assertTrue(doia._get_file("http://r/blob", "/l/sha256:aa", 3))
+        self.assertFalse(mock_dgu.called)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: ElfHeader
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+from unittest import TestCase, main
+from udocker.helper.elfheader import ElfHeader
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+def make_elf(interpreter=b"", dynamic=True, elf_type=3, order="<",
+             rpath=b""):
+    """Build a minimal ELF64 file with its program headers, a dynamic
+    section and a string table
+    """
+    data_offset = 64 + 56 * 3
+    data = interpreter + b"\x00"
+    dyn_offset = data_offset + len(data)
+    strtab = b"\x00" + rpath + b"\x00"
+    entries = [(5, dyn_offset + 16 * 3), (29, 1), (0, 0)]
+    dyn_data = b"".join([struct.pack(order + "qQ", d_tag, d_val)
+                         for (d_tag, d_val) in entries])
+    p_headers = [(1, 0, 0, dyn_offset + len(dyn_data) + len(strtab))]
+    if interpreter:
+        p_headers.append((3, data_offset, 0, len(data)))
+    if dynamic:
+        p_headers.append((2, dyn_offset, 0, len(dyn_data)))
+    header = b"\x7fELF" + struct.pack("BBB", 2, (1, 2)[order == ">"], 1)
+    header += b"\x00" * 9
+    header += struct.pack(order + "HHIQQQIHHHHHH", elf_type, 62, 1, 0,
+                          64, 0, 0, 64, 56, len(p_headers), 64, 0, 0)
+    for (p_type, p_offset, p_vaddr, p_filesz) in p_headers:
+        header += struct.pack(order + "IIQQQQQQ", p_type, 0, p_offset,
+                              p_vaddr, 0, p_filesz, p_filesz, 0)
+    header += b"\x00" * 56 * (3 - len(p_headers))
+    return header + data + dyn_data + strtab
+
+
+class ElfHeaderTestCase(TestCase):
+    """Test ElfHeader() reading ELF headers in process."""
+
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.elf = self.tmpdir + "/elf"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _putfile(self, data):
+        """Write the file to be read"""
+        with open(self.elf, "wb") as filep:
+            filep.write(data)
+
+    def test_01_read(self):
+        """Test01 ElfHeader().read()."""
+        self._putfile(make_elf(b"/lib64/ld-linux-x86-64.so.2",
+                               rpath=b"/opt/lib:$ORIGIN"))
+        self.assertEqual(ElfHeader(self.elf).read(),
+                         {"class": 64, "endian": "little", "type": 3,
+                          "osabi": 0, "machine": 62, "flags": 0,
+                          "interpreter": "/lib64/ld-linux-x86-64.so.2",
+                          "rpath": "/opt/lib:$ORIGIN", "dynamic": True})
+
+        self._putfile(make_elf(b"/lib/ld64.so.1", False, 2, ">"))
+        elf = ElfHeader(self.elf).read()
+        self.assertEqual(elf["endian"], "big")
+        self.assertEqual(elf["type"], 2)
+        self.assertEqual(elf["interpreter"], "/lib/ld64.so.1")
+        self.assertFalse(elf["dynamic"])
+        self.assertEqual(elf["rpath"], "")
+
+        self._putfile(b"#!/bin/sh\necho\n")
+        self.assertIsNone(ElfHeader(self.elf).read())
+        self._putfile(make_elf()[0:40])
+        self.assertIsNone(ElfHeader(self.elf).read())
+        self.assertIsNone(ElfHeader(self.tmpdir + "/missing").read())
+
+    def test_02_is_dynamic(self):
+        """Test02 ElfHeader().is_dynamic()."""
+        self._putfile(make_elf())
+        self.assertTrue(ElfHeader(self.elf).is_dynamic())
+        self._putfile(make_elf(dynamic=False, elf_type=2))
+        self.assertFalse(ElfHeader(self.elf).is_dynamic())
+        self._putfile(make_elf(elf_type=1))
+        self.assertFalse(ElfHeader(self.elf).is_dynamic())
+        self._putfile(b"text")
+        self.assertFalse(ElfHeader(self.elf).is_dynamic())
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,13 @@
 udocker unit tests: ElfPatcher
 """
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch, Mock
 from udocker.helper.elfpatcher import ElfPatcher
+from udocker.utils.fileutil import FileUtil
 from udocker.config import Config
 import collections
 
@@ -104,52 +108,50 @@ class ElfPatcherTestCase(TestCase):
         output = elfp._replace(cmd, path)
         self.assertEqual(output, ["/bin/", "ls"])
 
-    # Needs reviewing
-    @patch('udocker.helper.elfpatcher.Uprocess.get_output')
+    @patch('udocker.helper.elfpatcher.ElfHeader')
     @patch('udocker.helper.elfpatcher.os.path.islink')
     @patch('udocker.helper.elfpatcher.os.stat')
     @patch('udocker.helper.elfpatcher.os.walk')
     @patch('udocker.helper.elfpatcher.os.access')
     @patch('udocker.helper.elfpatcher.os.path.realpath')
-    def test_04__walk_fs(self, mock_path, mock_access, mock_walk,
-                         mock_stat, mock_islink, mock_uprocout):
-        """Test04 ElfPatcher()._walk_fs()."""
+    def test_04__find_elf_files(self, mock_path, mock_access, mock_walk,
+                                mock_stat, mock_islink, mock_elfh):
+        """Test04 ElfPatcher()._find_elf_files()."""
         mock_path.return_value = "/some_contdir"
-        mock_walk.return_value = [("/tmp", ["dir"], ["file"]), ]
+        mock_walk.return_value = [("/tmp", ["dir"], ["file", "libx.so.1"]), ]
         mock_islink.return_value = False
         mock_access.return_value = False
         mock_stat.return_value.st_uid = 1000
+        mock_elfh.return_value.is_dynamic.return_value = True
         elfp = ElfPatcher(self.local, self.contid)
         elfp._uid = 0
-        status = elfp._walk_fs("cmd", "/tmp", elfp.ABORT_ON_ERROR)
-        self.assertEqual(status, "")
+        files = list(elfp._find_elf_files("/tmp", elfp.BIN | elfp.LIB))
+        self.assertEqual(files, [])
 
-        mock_path.return_value = "/some_contdir"
-        mock_walk.return_value = [("/tmp", ["dir"], ["file"]), ]
-        mock_islink.return_value = False
-        mock_access.return_value = True
         mock_stat.return_value.st_uid = 0
-        mock_uprocout.return_value = "some output"
-        elfp = ElfPatcher(self.local, self.contid)
-        elfp._uid = 0
-        status = elfp._walk_fs("cmd", "/tmp", elfp.BIN)
-        self.assertTrue(mock_uprocout.called)
-        self.assertEqual(status, "some output")
+        files = list(elfp._find_elf_files("/tmp", elfp.BIN | elfp.LIB))
+        self.assertEqual(files, ["/tmp/libx.so.1"])
+
+        mock_access.return_value = True
+        files = list(elfp._find_elf_files("/tmp", elfp.BIN))
+        self.assertEqual(files, ["/tmp/file", "/tmp/libx.so.1"])
+
+        mock_elfh.return_value.is_dynamic.return_value = False
+        files = list(elfp._find_elf_files("/tmp", elfp.BIN))
+        self.assertEqual(files, [])
 
+    @patch('udocker.helper.elfpatcher.ElfHeader')
     @patch('udocker.helper.elfpatcher.os.path.realpath')
-    @patch.object(ElfPatcher, '_walk_fs')
-    @patch.object(ElfPatcher, 'select_patchelf')
-    def test_05_guess_elf_loader(self, mock_spelf, mock_walk,
-                                 mock_path):
+    @patch.object(ElfPatcher, '_find_elf_files')
+    def test_05_guess_elf_loader(self, mock_find, mock_path, mock_elfh):
         """Test05 ElfPatcher().guess_elf_loader()."""
-        mock_spelf.return_value = "ld.so"
-        mock_walk.return_value = ""
+        mock_find.return_value = []
         mock_path.return_value = "/some_contdir"
         elfp = ElfPatcher(self.local, self.contid)
         self.assertEqual(elfp.guess_elf_loader(), "")
 
-        mock_walk.return_value = "ld.so"
-        mock_path.return_value = "/some_contdir"
+        mock_find.return_value = ["/bin/ls"]
+        mock_elfh.return_value.read.return_value = {"interpreter": "ld.so"}
         elfp = ElfPatcher(self.local, self.contid)
         self.assertEqual(elfp.guess_elf_loader(), "ld.so")
 
@@ -232,18 +234,21 @@ class ElfPatcherTestCase(TestCase):
     @patch('udocker.helper.elfpatcher.os.path.realpath')
     @patch('udocker.helper.elfpatcher.os.path.exists')
     @patch('udocker.helper.elfpatcher.FileUtil.putdata')
-    @patch.object(ElfPatcher, '_walk_fs')
+    @patch.object(ElfPatcher, '_save_patch_index')
+    @patch.object(ElfPatcher, '_index_files')
+    @patch.object(ElfPatcher, '_run_files')
     @patch.object(ElfPatcher, 'guess_elf_loader')
     @patch.object(ElfPatcher, 'select_patchelf')
     @patch.object(ElfPatcher, 'get_container_loader')
     @patch.object(ElfPatcher, 'check_container_path')
     def test_11_patch_binaries(self, mock_chkcont, mock_gcl, mock_select,
-                               mock_guess, mock_walk, mock_putdata,
-                               mock_exists, mock_path):
+                               mock_guess, mock_run, mock_find, mock_save,
+                               mock_putdata, mock_exists, mock_path):
         """Test11 ElfPatcher().patch_binaries()."""
         mock_exists.return_value = True
         mock_chkcont.return_value = True
-        mock_walk.return_value = True
+        mock_find.return_value = [("/tmp/ROOT/bin/ls", {})]
+        mock_run.return_value = ["/tmp/ROOT/bin/ls"]
         mock_gcl.return_value = "/usr/bin/ld"
         mock_select.return_value = "runc-arm"
         mock_putdata.side_effect = ["10", "/tmp"]
@@ -252,22 +257,28 @@ class ElfPatcherTestCase(TestCase):
         elfp = ElfPatcher(self.local, self.contid)
         elfp._container_root = "/tmp/ROOT"
         self.assertTrue(elfp.patch_binaries())
+        mock_run.assert_called_with(["runc-arm", "--set-root-prefix",
+                                     "/tmp/ROOT", "#f"], ["/tmp/ROOT/bin/ls"])
+        self.assertEqual(mock_save.call_args[0][0], {})
 
     @patch('udocker.helper.elfpatcher.os.path.realpath')
     @patch('udocker.helper.elfpatcher.FileUtil.remove')
     @patch.object(ElfPatcher, 'guess_elf_loader')
-    @patch.object(ElfPatcher, '_walk_fs')
+    @patch.object(ElfPatcher, '_load_patch_index')
+    @patch.object(ElfPatcher, '_find_elf_files')
+    @patch.object(ElfPatcher, '_run_files')
     @patch.object(ElfPatcher, 'get_patch_last_path')
     @patch.object(ElfPatcher, 'get_original_loader')
     @patch.object(ElfPatcher, 'select_patchelf')
     def test_12_restore_binaries(self, mock_select, mock_gol,
-                                 mock_lpath, mock_walk, mock_guess,
-                                 mock_rm, mock_path):
+                                 mock_lpath, mock_run, mock_find, mock_load,
+                                 mock_guess, mock_rm, mock_path):
         """Test12 ElfPatcher().restore_binaries()."""
         mock_select.return_value = "runc-arm"
         mock_gol.return_value = "ld.so"
         mock_lpath.return_value = "xxx"
-        mock_walk.return_value = ""
+        mock_load.return_value = None
+        mock_find.return_value = ["/tmp/ROOT/bin/ls"]
         mock_guess.return_value = "ld.so"
         mock_rm.return_value = True
         mock_path.return_value = "/some_contdir"
@@ -275,6 +286,13 @@ class ElfPatcherTestCase(TestCase):
         elfp._container_root = "/tmp/ROOT"
         self.assertTrue(elfp.restore_binaries())
         self.assertTrue(mock_rm.called)
+        mock_run.assert_called_with(["runc-arm", "--restore-root-prefix",
+                                     "xxx/ROOT", "#f"], ["/tmp/ROOT/bin/ls"])
+
+        mock_load.return_value = {}
+        self.assertTrue(elfp.restore_binaries())
+        mock_run.assert_called_with(["runc-arm", "--restore-root-prefix",
+                                     "xxx/ROOT", "#f"], [])
 
     @patch.object(ElfPatcher, 'get_container_loader')
     @patch('udocker.helper.elfpatcher.os.path.realpath')
@@ -415,6 +433,102 @@ class ElfPatcherTestCase(TestCase):
         status = elfp.get_ld_library_path()
         self.assertEqual(status, "/lib:/usr/lib:.")
 
+    @patch('udocker.helper.elfpatcher.Uprocess.get_output')
+    @patch('udocker.helper.elfpatcher.os.path.realpath')
+    def test_19__run_files(self, mock_path, mock_uprocout):
+        """Test19 ElfPatcher()._run_files()."""
+        mock_path.return_value = "/some_contdir"
+        mock_uprocout.side_effect = \
+            lambda cmd: None if cmd[1] == "/f2" else ""
+        Config.conf['patchelf_workers'] = 2
+        elfp = ElfPatcher(self.local, self.contid)
+        files = elfp._run_files(["patchelf", "#f"], ["/f1", "/f2", "/f3"])
+        self.assertEqual(sorted(files), ["/f1", "/f3"])
+        self.assertEqual(mock_uprocout.call_count, 3)
+        self.assertEqual(elfp._run_files(["patchelf", "#f"], []), [])
+
+    @patch('udocker.helper.elfpatcher.ElfHeader')
+    @patch.object(ElfPatcher, '_run_files')
+    @patch.object(ElfPatcher, 'guess_elf_loader')
+    @patch.object(ElfPatcher, 'get_original_loader')
+    @patch.object(ElfPatcher, 'get_container_loader')
+    @patch.object(ElfPatcher, 'select_patchelf')
+    def test_20_patch_index(self, mock_select, mock_gcl, mock_gol,
+                            mock_guess, mock_run, mock_elfh):
+        """Test20 ElfPatcher().patch_binaries() incremental from index."""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        root = tmpdir + "/ROOT"
+
+        def _putfile(f_name, interpreter):
+            """Create an executable with the loader as content"""
+            with open(root + f_name, "w") as filep:
+                filep.write(interpreter)
+            os.chmod(root + f_name, 0o755)
+
+        def _read(f_path):
+            """Read the loader from the file content"""
+            elf = Mock()
+            elf.read.return_value = None
+            if os.path.exists(f_path):
+                with open(f_path) as filep:
+                    elf.read.return_value = {"interpreter": filep.read(),
+                                             "rpath": ""}
+            return elf
+
+        def _patchelf(cmd, files):
+            """Add or remove the prefix from the file content"""
+            for f_path in files:
+                interpreter = _read(f_path).read()["interpreter"]
+                if cmd[1] == "--set-root-prefix":
+                    interpreter = cmd[2] + interpreter
+                else:
+                    interpreter = interpreter.replace(cmd[2], "")
+                _putfile(f_path[len(root):], interpreter)
+            return list(files)
+
+        os.makedirs(root + "/bin")
+        FileUtil.safe_prefixes = [tmpdir + "/"]
+        _putfile("/bin/ls", "/lib/ld.so")
+        _putfile("/bin/cat", "/lib/ld.so")
+        self.local.cd_container.return_value = tmpdir
+        mock_select.return_value = "patchelf"
+        mock_gcl.return_value = root + "/lib/ld.so"
+        mock_gol.return_value = "/lib/ld.so"
+        mock_guess.side_effect = [root + "/lib/ld.so"] * 3 + ["/lib/ld.so"]
+        mock_elfh.side_effect = _read
+        mock_run.side_effect = _patchelf
+        elfp = ElfPatcher(self.local, self.contid)
+        self.assertIsNone(elfp._load_patch_index())
+        self.assertTrue(elfp.patch_binaries())
+        self.assertEqual(sorted(mock_run.call_args[0][1]),
+                         [root + "/bin/cat", root + "/bin/ls"])
+        index = elfp._load_patch_index()
+        self.assertEqual(sorted(index), ["/bin/cat", "/bin/ls"])
+        self.assertEqual(index["/bin/ls"]["interpreter"], "/lib/ld.so")
+        self.assertEqual(index["/bin/ls"]["ino"],
+                         os.stat(root + "/bin/ls").st_ino)
+
+        _putfile("/bin/new", "/lib/ld.so")
+        _putfile("/bin/f4", root + "/lib/ld.so")
+        self.assertTrue(elfp.patch_binaries())
+        self.assertEqual(mock_run.call_args[0][1], [root + "/bin/new"])
+        index = elfp._load_patch_index()
+        self.assertEqual(sorted(index),
+                         ["/bin/cat", "/bin/f4", "/bin/ls", "/bin/new"])
+        self.assertEqual(index["/bin/f4"]["interpreter"], "/lib/ld.so")
+
+        self.assertTrue(elfp.patch_binaries())
+        self.assertEqual(mock_run.call_args[0][1], [])
+
+        os.remove(root + "/bin/cat")
+        self.assertTrue(elfp.restore_binaries())
+        self.assertEqual(mock_run.call_args[0][1],
+                         [root + "/bin/f4", root + "/bin/ls",
+                          root + "/bin/new"])
+        self.assertIsNone(elfp._load_patch_index())
+        with open(root + "/bin/ls") as filep:
+            self.assertEqual(filep.read(), "/lib/ld.so")
+        shutil.rmtree(tmpdir)
 
 if __name__ == '__main__':
     main()
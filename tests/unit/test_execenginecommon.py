@@ -866,6 +866,51 @@ class ExecutionEngineCommonTestCase(TestCase):
         self.assertEqual(status, "/bin/ls")
         self.assertTrue(mock_chkexec.called)
 
+    @patch('udocker.engine.base.Msg')
+    @patch('udocker.engine.base.OSInfo')
+    @patch('udocker.engine.base.ContainerStructure')
+    def test_28__check_arch(self, mock_cstruct, mock_osinfo, mock_msg):
+        """Test28 ExecutionEngineCommon()._check_arch()."""
+        mock_msg.level = 0
+        mock_cstruct.return_value.get_container_arch.return_value = "arm64"
+        mock_osinfo.return_value.arch.return_value = "x86_64"
+        ex_eng = ExecutionEngineCommon(self.local, self.xmode)
+        ex_eng.container_id = "123"
+        ex_eng.container_dir = "/cont/123"
+        self.assertTrue(ex_eng._check_arch())
+        self.assertFalse(ex_eng._check_arch(fail=True))
+        mock_cstruct.return_value.get_container_arch.assert_called_with(
+            "UDOCKER", "/cont/123")
+        mock_osinfo.assert_called_with("/")
+
+        mock_cstruct.return_value.get_container_arch.return_value = "x86_64"
+        self.assertTrue(ex_eng._check_arch(fail=True))
+
+        mock_cstruct.reset_mock()
+        Config.conf['location'] = "/tree"
+        ex_eng.container_root = "/tree"
+        self.assertTrue(ex_eng._check_arch(fail=True))
+        self.assertFalse(mock_cstruct.called)
+        mock_osinfo.assert_any_call("/tree")
+
+    @patch('udocker.engine.base.FileUtil.find_exec')
+    @patch('udocker.engine.base.HostInfo.arch')
+    @patch('udocker.engine.base.ContainerStructure')
+    def test_29__get_qemu(self, mock_cstruct, mock_harch, mock_findexec):
+        """Test29 ExecutionEngineCommon()._get_qemu()."""
+        mock_cstruct.return_value.get_container_arch.return_value = "x86_64"
+        mock_harch.return_value = "x86_64"
+        ex_eng = ExecutionEngineCommon(self.local, self.xmode)
+        ex_eng.container_dir = "/cont/123"
+        self.assertEqual(ex_eng._get_qemu(), "")
+        mock_cstruct.return_value.get_container_arch.assert_called_with(
+            "qemu", "/cont/123")
+
+        mock_cstruct.return_value.get_container_arch.return_value = "aarch64"
+        mock_findexec.return_value = "/usr/bin/qemu-aarch64"
+        self.assertEqual(ex_eng._get_qemu(), "qemu-aarch64")
+        self.assertEqual(ex_eng._get_qemu(True), "/usr/bin/qemu-aarch64")
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: FileLock
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import subprocess
+from unittest import TestCase, main
+from udocker.utils.filelock import FileLock
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+LOCK_PROBE = """
+import fcntl, sys
+with open(sys.argv[1], "a+") as filep:
+    try:
+        fcntl.lockf(filep.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        sys.exit(1)
+"""
+
+
+class FileLockTestCase(TestCase):
+    """Test FileLock() advisory locking between processes."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.lockfile = self.tmpdir + "/.locks/name.lock"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _is_locked(self):
+        """Try to get the lock from another process"""
+        return subprocess.call([sys.executable, "-c", LOCK_PROBE,
+                                self.lockfile]) != 0
+
+    def test_01_init(self):
+        """Test01 FileLock() constructor."""
+        lock = FileLock(self.lockfile)
+        self.assertEqual(lock.lockfile, self.lockfile)
+        self.assertFalse(lock.shared)
+        self.assertIs(lock._entry, FileLock(self.lockfile)._entry)
+
+    def test_02_acquire_release(self):
+        """Test02 FileLock().acquire() and release() reentrant."""
+        with FileLock(self.lockfile):
+            self.assertTrue(os.path.exists(self.lockfile))
+            self.assertTrue(self._is_locked())
+            with FileLock(self.lockfile):
+                self.assertTrue(self._is_locked())
+            self.assertTrue(self._is_locked())
+        self.assertFalse(self._is_locked())
+
+    def test_03_threads(self):
+        """Test03 FileLock() serializes threads of the process."""
+        events = []
+        lock = FileLock(self.lockfile)
+        lock.acquire()
+
+        def _locker():
+            """Take the lock in another thread"""
+            with FileLock(self.lockfile):
+                events.append("thread")
+
+        thread = threading.Thread(target=_locker)
+        thread.start()
+        thread.join(0.2)
+        events.append("main")
+        lock.release()
+        thread.join()
+        self.assertEqual(events, ["main", "thread"])
+
+    def test_04_unwritable(self):
+        """Test04 FileLock() without a lock file."""
+        lock = FileLock("/proc/udocker/missing.lock")
+        with lock:
+            self.assertIsNone(lock._entry[1])
+        self.assertEqual(lock._entry[2], 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ udocker unit tests: FileUtil
 
 import os
 import sys
+import shutil
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch, mock_open
 from udocker.utils.fileutil import FileUtil
@@ -1098,6 +1100,20 @@ class FileUtilTestCase(TestCase):
         status = futil.match()
         self.assertEqual(status, ["/con/filename1", "/con/filename2"])
 
+    def test_43_disk_usage(self):
+        """Test43 FileUtil().disk_usage()."""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(tmpdir + "/d1/d2")
+        with open(tmpdir + "/d1/d2/f", "wb") as filep:
+            filep.write(b"f" * 100000)
+        os.link(tmpdir + "/d1/d2/f", tmpdir + "/hl")
+        os.symlink("/usr", tmpdir + "/d1/usr")
+        usage = FileUtil(tmpdir).disk_usage()
+        self.assertTrue(100000 <= usage < 200000)
+        self.assertEqual(FileUtil(tmpdir).disk_usage(4), usage)
+        self.assertEqual(FileUtil(tmpdir + "/missing").disk_usage(), -1)
+        shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     main()
@@ -10,6 +10,7 @@ from unittest.mock import patch
 from udocker.utils.curl import GetURL
 from udocker.utils.curl import GetURLpyCurl
 from udocker.utils.curl import GetURLexeCurl
+from udocker.utils.curl import GetURLhttpClient
 from udocker.config import Config
 import collections
 
@@ -37,13 +38,15 @@ class GetURLTestCase(TestCase):
         """Mock for pycurl.get."""
         return args[0]
 
+    @patch.object(GetURLhttpClient, 'is_available')
     @patch.object(GetURLexeCurl, '_select_implementation')
     @patch.object(GetURLexeCurl, 'is_available')
     @patch.object(GetURLpyCurl, 'is_available')
     @patch('udocker.utils.curl.Msg')
     def test_01_init(self, mock_msg, mock_gupycurl,
-                     mock_guexecurl, mock_select):
+                     mock_guexecurl, mock_select, mock_guhttp):
         """Test01 GetURL() constructor."""
+        mock_guhttp.return_value = False
         mock_gupycurl.return_value = False
         mock_guexecurl.return_value = True
         mock_msg.level = 0
@@ -54,12 +57,14 @@ class GetURLTestCase(TestCase):
         self.assertFalse(geturl.cache_support)
 
     @patch('udocker.utils.curl.Msg')
+    @patch.object(GetURLhttpClient, 'is_available')
     @patch.object(GetURLexeCurl, 'is_available')
     @patch.object(GetURLpyCurl, 'is_available')
     def test_02__select_implementation(self, mock_gupycurl,
-                                       mock_guexecurl, mock_msg):
+                                       mock_guexecurl, mock_guhttp, mock_msg):
         """Test02 GetURL()._select_implementation()."""
         mock_gupycurl.return_value = True
+        mock_guhttp.return_value = False
         mock_msg.level = 0
         geturl = GetURL()
         geturl._select_implementation()
@@ -67,6 +72,14 @@ class GetURLTestCase(TestCase):
         self.assertTrue(mock_gupycurl.called)
 
         mock_gupycurl.return_value = False
+        mock_guhttp.return_value = True
+        geturl = GetURL()
+        geturl._select_implementation()
+        self.assertTrue(geturl.cache_support)
+        self.assertIsInstance(geturl._geturl, GetURLhttpClient)
+
+        mock_gupycurl.return_value = False
+        mock_guhttp.return_value = False
         geturl = GetURL()
         geturl._select_implementation()
         self.assertFalse(geturl.cache_support)
@@ -113,6 +126,22 @@ class GetURLTestCase(TestCase):
         geturl.set_proxy("http://host")
         self.assertEqual(geturl.http_proxy, "http://host")
 
+    @patch.object(GetURLexeCurl, 'is_available')
+    @patch.object(GetURLhttpClient, 'is_available')
+    @patch.object(GetURLpyCurl, 'is_available')
+    def test_05a_set_proxy_socks(self, mock_gupycurl, mock_guhttp,
+                                 mock_guexecurl):
+        """Test05a GetURL().set_proxy() socks without pycurl."""
+        mock_gupycurl.return_value = False
+        mock_guhttp.return_value = True
+        mock_guexecurl.return_value = True
+        geturl = GetURL()
+        geturl.set_proxy("http://host:3128")
+        self.assertIsInstance(geturl._geturl, GetURLhttpClient)
+        geturl.set_proxy("socks5://host:1080")
+        self.assertIsInstance(geturl._geturl, GetURLexeCurl)
+        self.assertFalse(geturl.cache_support)
+
     @patch.object(GetURLpyCurl, 'is_available')
     def test_06_get(self, mock_gupycurl):
         """Test06 GetURL().get()."""
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+# -*- coding: utf-8 -*-
+"""
+udocker unit tests: GetURLhttpClient
+"""
+
+import os
+import socket
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import patch, Mock
+from udocker.utils.curl import GetURLhttpClient
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+class GetURLhttpClientTestCase(TestCase):
+    """GetURLhttpClient TestCase."""
+
+    def setUp(self):
+        Config().getconf()
+        Config().conf['timeout'] = 1
+        Config().conf['ctimeout'] = 1
+        Config().conf['download_timeout'] = 1
+        Config().conf['http_agent'] = ""
+        Config().conf['http_proxy'] = ""
+        Config().conf['http_insecure'] = 0
+
+    def tearDown(self):
+        pass
+
+    def _response(self, status, body_chunks, headers=None):
+        """Build a mock http.client response"""
+        response = Mock()
+        response.status = status
+        response.reason = "REASON"
+        response.version = 11
+        response.getheaders.return_value = headers if headers else []
+        response.getheader.side_effect = \
+            lambda key: dict(headers if headers else []).get(key)
+        response.read.side_effect = body_chunks + [b""]
+        return response
+
+    def _conn(self, responses):
+        """Build a mock http.client connection"""
+        conn = Mock()
+        conn.sock = None
+
+        def _connect():
+            conn.sock = Mock()
+        conn.connect.side_effect = _connect
+        conn.getresponse.side_effect = responses
+        return conn
+
+    def test_01_init(self):
+        """Test01 GetURLhttpClient() constructor."""
+        geturl = GetURLhttpClient()
+        self.assertEqual(geturl._url, None)
+        self.assertEqual(geturl._conns, {})
+
+    def test_02_is_available(self):
+        """Test02 GetURLhttpClient().is_available()."""
+        geturl = GetURLhttpClient()
+        self.assertTrue(geturl.is_available())
+        geturl.http_proxy = "socks5://host:1080"
+        self.assertFalse(geturl.is_available())
+        self.assertTrue(geturl.is_proxy_supported("http://host:3128"))
+        self.assertTrue(geturl.is_proxy_supported(""))
+
+    def test_03__mkheaders(self):
+        """Test03 GetURLhttpClient()._mkheaders()."""
+        geturl = GetURLhttpClient()
+        headers = geturl._mkheaders(
+            "https://host/v2/x", header=["Accept: a", "Accept: b",
+                                         "Authorization: Bearer tok"])
+        self.assertEqual(headers["Accept"], "a, b")
+        self.assertEqual(headers["Authorization"], "Bearer tok")
+        headers = geturl._mkheaders(
+            "https://host/v2/x?Signature=1",
+            header=["Authorization: Bearer tok"])
+        self.assertNotIn("Authorization", headers)
+
+    @patch('udocker.utils.curl.httpclient.HTTPSConnection')
+    def test_04_get(self, mock_https):
+        """Test04 GetURLhttpClient().get() into buffer and reuse."""
+        conn = self._conn([
+            self._response(200, [b"hel", b"lo"], [("Content-Length", "5")]),
+            self._response(401, [b"{}"], [("Www-Authenticate", "Bearer")]),
+        ])
+        mock_https.return_value = conn
+        geturl = GetURLhttpClient()
+        (hdr, buf) = geturl.get("https://host/v2/", header=["Accept: x"])
+        self.assertEqual(buf.getvalue(), b"hello")
+        self.assertEqual(hdr.data["X-ND-HTTPSTATUS"], "HTTP/1.1 200 REASON")
+        self.assertEqual(hdr.data["content-length"], "5")
+        self.assertEqual(hdr.data["X-ND-CURLSTATUS"], 0)
+        self.assertEqual(hdr.data["X-ND-HEADERS"], ["Accept: x"])
+        (hdr, buf) = geturl.get("https://host/v2/other")
+        self.assertEqual(hdr.data["www-authenticate"], "Bearer")
+        self.assertEqual(mock_https.call_count, 1)
+        self.assertEqual(conn.connect.call_count, 1)
+
+    @patch('udocker.utils.curl.httpclient.HTTPSConnection')
+    def test_05_get_ofile(self, mock_https):
+        """Test05 GetURLhttpClient().get() into file with resume."""
+        tmpdir = tempfile.mkdtemp()
+        ofile = tmpdir + "/sha256:1234"
+        with open(ofile, "wb") as filep:
+            filep.write(b"abc")
+        conn = self._conn([self._response(206, [b"def"])])
+        mock_https.return_value = conn
+        geturl = GetURLhttpClient()
+        (hdr, dummy) = geturl.get("https://host/blob", ofile=ofile,
+                                  resume=True, digest="sha256")
+        self.assertEqual(hdr.data["X-ND-HTTPSTATUS"], "HTTP/1.1 206 REASON")
+        self.assertEqual(hdr.data["X-ND-DIGEST"], "sha256:"
+                         "bef57ec7f53a6d40beb640a780a639c8"
+                         "3bc29ac8a9816f1fc6c5c6dcd93c4721")
+        headers = conn.request.call_args[0][3]
+        self.assertEqual(headers["Range"], "bytes=3-")
+        with open(ofile, "rb") as filep:
+            self.assertEqual(filep.read(), b"abcdef")
+        os.remove(ofile)
+        os.rmdir(tmpdir)
+
+    @patch('udocker.utils.curl.Msg')
+    @patch('udocker.utils.curl.httpclient.HTTPSConnection')
+    def test_06_get_error(self, mock_https, mock_msg):
+        """Test06 GetURLhttpClient().get() connection errors."""
+        mock_msg.level = 0
+        mock_msg.VER = 4
+        conn = self._conn([])
+        conn.connect.side_effect = socket.timeout("timed out")
+        mock_https.return_value = conn
+        geturl = GetURLhttpClient()
+        (hdr, dummy) = geturl.get("https://host/v2/")
+        self.assertEqual(hdr.data["X-ND-CURLSTATUS"], 28)
+        self.assertEqual(geturl._conns, {})
+
+        conn.connect.side_effect = socket.gaierror("unknown host")
+        (hdr, dummy) = geturl.get("https://host/v2/")
+        self.assertEqual(hdr.data["X-ND-CURLSTATUS"], 6)
+
+    @patch.object(GetURLhttpClient, '_copy')
+    @patch('udocker.utils.curl.httpclient.HTTPSConnection')
+    def test_07_get_timeout(self, mock_https, mock_copy):
+        """Test07 GetURLhttpClient().get() body read with timeout."""
+        conn = self._conn([self._response(200, []), self._response(200, [])])
+        mock_https.return_value = conn
+        geturl = GetURLhttpClient()
+        geturl.get("https://host/v2/", timeout=7)
+        self.assertEqual(mock_copy.call_args[0][2], 7)
+        geturl.get("https://host/v2/")
+        self.assertEqual(mock_copy.call_args[0][2], geturl.timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,9 @@ udocker unit tests: GetURLpyCurl
 """
 
 from unittest import TestCase, main
-from unittest.mock import patch
-# from unittest.mock import patch, Mock
-# from io import BytesIO as strio
-from udocker.utils.curl import GetURLpyCurl
+from unittest.mock import patch, Mock
+from io import BytesIO as strio
+from udocker.utils.curl import GetURLpyCurl, CurlMultiEngine, DigestWriter
 from udocker.config import Config
 import collections
 
@@ -139,5 +138,77 @@ class GetURLpyCurlTestCase(TestCase):
         self.assertEqual(status, "http://host")
 
 
+class CurlMultiEngineTestCase(TestCase):
+    """CurlMultiEngine TestCase."""
+
+    @patch('udocker.utils.curl.pycurl', create=True)
+    def test_01_acquire_release(self, mock_pycurl):
+        """Test01 CurlMultiEngine().acquire() and release()."""
+        mock_pyc = Mock()
+        mock_pycurl.Curl.return_value = mock_pyc
+        engine = CurlMultiEngine(pool_size=1)
+        pyc = engine.acquire()
+        self.assertEqual(pyc, mock_pyc)
+        engine.release(pyc)
+        self.assertTrue(mock_pyc.reset.called)
+        self.assertEqual(engine.acquire(), mock_pyc)
+        self.assertEqual(mock_pycurl.Curl.call_count, 1)
+        engine.release(Mock())
+        other_pyc = Mock()
+        engine.release(other_pyc)
+        self.assertTrue(other_pyc.close.called)
+
+    @patch('udocker.utils.curl.pycurl', create=True)
+    def test_02_perform(self, mock_pycurl):
+        """Test02 CurlMultiEngine().perform()."""
+        pyc_ok = Mock()
+        pyc_err = Mock()
+        mock_pycurl.E_CALL_MULTI_PERFORM = -1
+        mock_multi = mock_pycurl.CurlMulti.return_value
+        mock_multi.perform.side_effect = [(0, 1), (0, 0)]
+        mock_multi.info_read.side_effect = [
+            (0, [pyc_ok], []), (0, [], [(pyc_err, 7, "refused")]),
+            (0, [], [])]
+        engine = CurlMultiEngine()
+        status = engine.perform([pyc_ok, pyc_err])
+        self.assertEqual(status, [(0, ""), (7, "refused")])
+        self.assertEqual(mock_multi.add_handle.call_count, 2)
+        self.assertEqual(mock_multi.remove_handle.call_count, 2)
+        self.assertTrue(mock_multi.select.called)
+
+
+class DigestWriterTestCase(TestCase):
+    """DigestWriter TestCase."""
+
+    def test_01_write(self):
+        """Test01 DigestWriter().write() and digest()."""
+        buf = strio()
+        writer = DigestWriter(buf, "sha256")
+        writer.write(b"ab")
+        writer.write(b"c")
+        self.assertEqual(buf.getvalue(), b"abc")
+        self.assertEqual(writer.digest(), "sha256:"
+                         "ba7816bf8f01cfea414140de5dae2223"
+                         "b00361a396177a9cb410ff61f20015ad")
+        writer = DigestWriter(buf, "md5")
+        writer.write(b"abc")
+        self.assertEqual(writer.digest(), "")
+
+    @patch('udocker.utils.curl.open', create=True)
+    def test_02_seed(self, mock_open):
+        """Test02 DigestWriter().seed()."""
+        mock_open.return_value.__enter__.return_value.read.side_effect = \
+            [b"ab", b""]
+        writer = DigestWriter(strio(), "sha256")
+        writer.seed("file")
+        writer.write(b"c")
+        self.assertEqual(writer.digest(), "sha256:"
+                         "ba7816bf8f01cfea414140de5dae2223"
+                         "b00361a396177a9cb410ff61f20015ad")
+        mock_open.side_effect = OSError("fail")
+        writer.seed("file")
+        self.assertEqual(writer.digest(), "")
+
+
 if __name__ == '__main__':
     main()
@@ -5,10 +5,15 @@
 udocker unit tests: HostInfo
 """
 
+import os
 import pwd
+import json
+import shutil
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch
 from udocker.helper.hostinfo import HostInfo
+from udocker.config import Config
 import collections
 
 collections.Callable = collections.abc.Callable
@@ -17,6 +22,16 @@ collections.Callable = collections.abc.Callable
 class HostInfoTestCase(TestCase):
     """Test HostInfo"""
 
+    def setUp(self):
+        Config().getconf()
+        Config.conf['hostinfo_cache'] = ""
+        HostInfo._facts = {}
+        HostInfo._facts_file = None
+
+    def tearDown(self):
+        HostInfo._facts = {}
+        HostInfo._facts_file = None
+
     @patch('udocker.helper.hostinfo.os.getgid')
     @patch('udocker.helper.hostinfo.os.getuid')
     @patch('udocker.helper.hostinfo.pwd.getpwuid')
@@ -41,14 +56,17 @@ class HostInfoTestCase(TestCase):
         result = HostInfo().arch("docker")
         self.assertEqual(result, "amd64")
 
+        HostInfo._facts = {}
         mock_mach.return_value = "i386"
         result = HostInfo().arch()
         self.assertEqual(result, "x86")
 
+        HostInfo._facts = {}
         mock_mach.return_value = "aarch64"
         result = HostInfo().arch()
         self.assertEqual(result, "arm64")
 
+        HostInfo._facts = {}
         mock_mach.return_value = "aarch64"
         result = HostInfo().arch("docker")
         self.assertEqual(result, "arm64")
@@ -82,13 +100,33 @@ class HostInfoTestCase(TestCase):
         status = HostInfo().oskernel_isgreater([1, 1, 1])
         self.assertFalse(status)
 
-    # def test_06_cmd_has_option(self):
-    #     """Test06 HostInfo().cmd_has_option."""
-    #     status = HostInfo().cmd_has_option("ls", "-a")
-    #     self.assertTrue(status)
-    #
-    #     status = HostInfo().cmd_has_option("ls", "-z")
-    #     self.assertFalse(status)
+    @patch('udocker.helper.hostinfo.Uprocess.get_output')
+    def test_06_cmd_has_option(self, mock_out):
+        """Test06 HostInfo().cmd_has_option."""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tar = tmpdir + "/tar"
+        with open(tar, "w") as filep:
+            filep.write("#!/bin/sh\n")
+        mock_out.return_value = "Usage: tar [OPTION...]\n  --xattrs, -a"
+        self.assertTrue(HostInfo().cmd_has_option(tar, "--xattrs"))
+        self.assertTrue(HostInfo().cmd_has_option(tar, "-a"))
+        self.assertFalse(HostInfo().cmd_has_option(tar, "-z"))
+        self.assertFalse(HostInfo().cmd_has_option("", "-a"))
+        self.assertFalse(HostInfo().cmd_has_option(tmpdir + "/none", "-a"))
+        mock_out.assert_called_once_with([tar, "--help"])
+
+        with open(tar, "w") as filep:
+            filep.write("#!/bin/sh\n# new version\n")
+        mock_out.return_value = "Usage: tar -z"
+        self.assertTrue(HostInfo().cmd_has_option(tar, "-z"))
+        self.assertEqual(mock_out.call_count, 2)
+
+        mock_out.return_value = None
+        self.assertFalse(HostInfo().cmd_has_option(tar, "-a", "x"))
+        self.assertFalse(HostInfo().cmd_has_option(tar, "-a", "x"))
+        mock_out.assert_called_with([tar, "x", "--help"])
+        self.assertEqual(mock_out.call_count, 4)
 
     @patch('udocker.helper.hostinfo.Uprocess.check_output')
     def test_07_termsize(self, mock_chkout):
@@ -97,6 +135,46 @@ class HostInfoTestCase(TestCase):
         status = HostInfo().termsize()
         self.assertEqual(status, (24, 80))
 
+    @patch('udocker.helper.hostinfo.platform.release')
+    @patch('udocker.helper.hostinfo.platform.machine')
+    def test_08_fact_cache(self, mock_mach, mock_rel):
+        """Test08 HostInfo().fact() with the cache file."""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        boot_id = patch.object(HostInfo, "boot_id_file", tmpdir + "/boot_id")
+        boot_id.start()
+        self.addCleanup(boot_id.stop)
+        with open(HostInfo.boot_id_file, "w") as filep:
+            filep.write("b1\n")
+        Config.conf['topdir'] = tmpdir
+        Config.conf['hostinfo_cache'] = "hostinfo.json"
+        mock_rel.return_value = "6.1.1"
+        mock_mach.return_value = "x86_64"
+        self.assertEqual(HostInfo().arch(), "x86_64")
+        with open(tmpdir + "/hostinfo.json") as filep:
+            data = json.load(filep)
+        self.assertEqual(data["fingerprint"],
+                         {"kernel": "6.1.1", "boot_id": "b1"})
+        self.assertEqual(data["facts"], {"machine": "x86_64"})
+
+        HostInfo._facts = {}
+        HostInfo._facts_file = None
+        mock_mach.return_value = "aarch64"
+        self.assertEqual(HostInfo().arch(), "x86_64")
+        self.assertEqual(mock_mach.call_count, 1)
+
+        HostInfo._facts = {}
+        HostInfo._facts_file = None
+        mock_rel.return_value = "6.1.2"
+        self.assertEqual(HostInfo().arch(), "arm64")
+
+        HostInfo._facts = {}
+        HostInfo._facts_file = None
+        with open(HostInfo.boot_id_file, "w") as filep:
+            filep.write("b2\n")
+        mock_mach.return_value = "i386"
+        self.assertEqual(HostInfo().arch(), "x86")
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: LayerCache
+"""
+
+import os
+import json
+import shutil
+import threading
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import Mock
+from udocker.container.layercache import LayerCache, RootfsCache
+from udocker.utils.fileutil import FileUtil
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+class LayerCacheTestCase(TestCase):
+    """Test LayerCache() cache of extracted layers."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        FileUtil(self.tmpdir).register_prefix()
+        self.cachedir = self.tmpdir + "/.layercache"
+        os.makedirs(self.cachedir)
+        self.local = Mock()
+        self.local.layer_cache_dir.side_effect = \
+            lambda tarf: self.cachedir + "/" + os.path.basename(tarf)
+        self.local.is_layer_extracted.return_value = False
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _putfile(self, pathname, data):
+        """Create a file with some content"""
+        if not os.path.isdir(os.path.dirname(pathname)):
+            os.makedirs(os.path.dirname(pathname))
+        with open(pathname, "w") as filep:
+            filep.write(data)
+
+    def _extract(self, tarfiles, destdir):
+        """Fake extraction creating one file per layer"""
+        for tarf in tarfiles:
+            self._putfile(destdir + "/d/" + os.path.basename(tarf), tarf)
+        return True
+
+    def test_01_init(self):
+        """Test01 LayerCache() constructor and is_enabled()."""
+        Config().conf['layer_cache'] = ""
+        self.assertFalse(LayerCache(self.local).is_enabled())
+        self.assertTrue(LayerCache(self.local, "copy").is_enabled())
+        self.assertTrue(LayerCache(self.local, "hardlink").is_enabled())
+        self.assertFalse(LayerCache(self.local, "other").is_enabled())
+
+    def test_02_get(self):
+        """Test02 LayerCache().get() extract once and reuse."""
+        extract = Mock(side_effect=self._extract)
+        lcache = LayerCache(self.local, "copy")
+        cache_dir = lcache.get("/layers/sha256:aa", extract)
+        self.assertEqual(cache_dir, self.cachedir + "/sha256:aa")
+        self.assertTrue(os.path.isfile(cache_dir + "/d/sha256:aa"))
+        self.local.set_layer_extracted.assert_called_once_with(
+            "/layers/sha256:aa")
+        self.local.is_layer_extracted.return_value = True
+        self.assertEqual(lcache.get("/layers/sha256:aa", extract), cache_dir)
+        self.assertEqual(extract.call_count, 1)
+
+        self.local.is_layer_extracted.return_value = False
+        self._putfile(cache_dir + "/stale", "x")
+        self.assertEqual(lcache.get("/layers/sha256:aa", extract), cache_dir)
+        self.assertFalse(os.path.exists(cache_dir + "/stale"))
+
+        extract.side_effect = None
+        extract.return_value = False
+        self.assertEqual(lcache.get("/layers/sha256:bb", extract), "")
+        self.assertEqual(os.listdir(self.cachedir), ["sha256:aa"])
+
+        self.local.layer_cache_dir.side_effect = None
+        self.local.layer_cache_dir.return_value = ""
+        self.assertEqual(lcache.get("/tmp/file.tar", extract), "")
+
+    def test_03_copy_tree(self):
+        """Test03 LayerCache().copy_tree() merge into a directory."""
+        lower = self.tmpdir + "/lower"
+        upper = self.tmpdir + "/upper"
+        root = self.tmpdir + "/ROOT"
+        self._putfile(lower + "/etc/a", "a")
+        self._putfile(lower + "/etc/b", "b")
+        os.symlink("/etc", lower + "/lnk")
+        os.makedirs(lower + "/bin")
+        self._putfile(upper + "/etc/a", "new")
+        self._putfile(upper + "/lnk/x", "x")
+        os.symlink("a", upper + "/bin")
+        os.chmod(upper + "/etc/a", 0o750)
+        os.makedirs(root)
+        lcache = LayerCache(self.local, "copy")
+        self.assertTrue(lcache.copy_tree(lower, root))
+        self.assertTrue(lcache.copy_tree(upper, root))
+        with open(root + "/etc/a") as filep:
+            self.assertEqual(filep.read(), "new")
+        self.assertEqual(os.stat(root + "/etc/a").st_mode & 0o777, 0o750)
+        self.assertNotEqual(os.stat(root + "/etc/a").st_ino,
+                            os.stat(upper + "/etc/a").st_ino)
+        self.assertTrue(os.path.isfile(root + "/etc/b"))
+        self.assertFalse(os.path.islink(root + "/lnk"))
+        self.assertTrue(os.path.isfile(root + "/lnk/x"))
+        self.assertEqual(os.readlink(root + "/bin"), "a")
+
+    def test_04_copy_tree_hardlink(self):
+        """Test04 LayerCache().copy_tree() with hardlinks."""
+        layer = self.tmpdir + "/layer"
+        root = self.tmpdir + "/ROOT"
+        self._putfile(layer + "/etc/a", "a")
+        os.makedirs(root)
+        lcache = LayerCache(self.local, "hardlink")
+        self.assertTrue(lcache.copy_tree(layer, root))
+        self.assertEqual(os.stat(root + "/etc/a").st_ino,
+                         os.stat(layer + "/etc/a").st_ino)
+
+    def test_05_copy_tree_dir_symlink(self):
+        """Test05 LayerCache().copy_tree() over directory symlinks."""
+        lower = self.tmpdir + "/lower"
+        upper = self.tmpdir + "/upper"
+        root = self.tmpdir + "/ROOT"
+        os.makedirs(lower + "/etc")
+        os.symlink("etc", lower + "/lnk")
+        os.symlink("/etc", lower + "/abs")
+        os.symlink("../../outside", lower + "/out")
+        self._putfile(upper + "/lnk/evil", "evil")
+        self._putfile(upper + "/abs/b", "b")
+        self._putfile(upper + "/out/c", "c")
+        os.makedirs(root)
+        lcache = LayerCache(self.local, "copy")
+        self.assertTrue(lcache.copy_tree(lower, root, []))
+        self.assertTrue(lcache.copy_tree(upper, root, []))
+        self.assertEqual(os.readlink(root + "/lnk"), "etc")
+        self.assertTrue(os.path.isfile(root + "/etc/evil"))
+        self.assertEqual(os.readlink(root + "/abs"), "/etc")
+        self.assertTrue(os.path.isfile(root + "/etc/b"))
+        self.assertFalse(os.path.islink(root + "/out"))
+        self.assertTrue(os.path.isfile(root + "/out/c"))
+        self.assertFalse(os.path.exists(self.tmpdir + "/../outside"))
+
+        self.assertTrue(lcache.copy_tree(upper, root, ["lnk"]))
+        self.assertFalse(os.path.islink(root + "/lnk"))
+        self.assertTrue(os.path.isfile(root + "/lnk/evil"))
+        self.assertTrue(os.path.islink(root + "/abs"))
+
+
+class RootfsCacheTestCase(TestCase):
+    """Test RootfsCache() cache of image rootfs snapshots."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        FileUtil(self.tmpdir).register_prefix()
+        self.local = Mock()
+        self.local.layersdir = self.tmpdir + "/layers"
+        self.local.save_json.side_effect = self._save_json
+        self.local.load_json.side_effect = self._load_json
+        os.makedirs(self.local.layersdir)
+        self.layers = []
+        for name in ("sha256:aa", "sha256:bb"):
+            self.layers.append(self.local.layersdir + "/" + name)
+            with open(self.layers[-1], "w") as filep:
+                filep.write(name)
+        self.root = self.tmpdir + "/ROOT"
+        os.makedirs(self.root + "/etc")
+        with open(self.root + "/etc/a", "w") as filep:
+            filep.write("a" * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _save_json(self, filename, data):
+        """Save json as LocalRepository().save_json()"""
+        with open(filename, "w") as filep:
+            json.dump(data, filep)
+        return True
+
+    def _load_json(self, filename):
+        """Load json as LocalRepository().load_json()"""
+        try:
+            with open(filename) as filep:
+                return json.load(filep)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def test_01_init(self):
+        """Test01 RootfsCache() constructor."""
+        Config().conf['rootfs_cache'] = "copy"
+        Config().conf['rootfs_cache_size'] = 2
+        rcache = RootfsCache(self.local)
+        self.assertTrue(rcache.is_enabled())
+        self.assertEqual(rcache.maxsize, 2 * 1024 * 1024)
+        self.assertEqual(rcache.cachedir,
+                         self.local.layersdir + "/.rootfscache")
+        Config().conf['rootfs_cache'] = ""
+
+    def test_02__key(self):
+        """Test02 RootfsCache()._key() depends on layers and order."""
+        rcache = RootfsCache(self.local, "copy", 0)
+        key = rcache._key(self.layers)
+        self.assertEqual(len(key), 64)
+        self.assertEqual(rcache._key(self.layers), key)
+        self.assertNotEqual(rcache._key(self.layers[::-1]), key)
+        self.assertEqual(rcache._key(self.layers + ["/missing"]), "")
+
+    def test_03_put_get_rootfs(self):
+        """Test03 RootfsCache().put_rootfs() and get_rootfs()."""
+        rcache = RootfsCache(self.local, "copy", 1024 * 1024)
+        self.assertEqual(rcache.get_rootfs(self.layers), "")
+        self.assertTrue(rcache.put_rootfs(self.layers, self.root))
+        snapshot = rcache.get_rootfs(self.layers)
+        self.assertTrue(snapshot.endswith("/ROOT"))
+        self.assertTrue(os.path.isfile(snapshot + "/etc/a"))
+        snapshot_json = os.path.dirname(snapshot) + "/snapshot.json"
+        with open(snapshot_json) as filep:
+            data = json.load(filep)
+        self.assertEqual(data["layers"], ["sha256:aa", "sha256:bb"])
+        self.assertTrue(data["size"] >= 1000)
+
+    def test_04_evict(self):
+        """Test04 RootfsCache().evict() least recently used."""
+        rcache = RootfsCache(self.local, "copy", 1500)
+        self.assertTrue(rcache.put_rootfs(self.layers[:1], self.root))
+        old_snapshot = rcache.get_rootfs(self.layers[:1])
+        os.utime(os.path.dirname(old_snapshot) + "/snapshot.json",
+                 (1, 1))
+        self.assertTrue(rcache.put_rootfs(self.layers, self.root))
+        self.assertEqual(rcache.get_rootfs(self.layers[:1]), "")
+        self.assertTrue(rcache.get_rootfs(self.layers))
+        rcache.maxsize = 0
+        rcache.evict()
+        self.assertEqual(os.listdir(rcache.cachedir), [".locks"])
+
+    def test_05_put_rootfs_hardlink(self):
+        """Test05 RootfsCache().put_rootfs() copies the container ROOT."""
+        rcache = RootfsCache(self.local, "hardlink", 1024 * 1024)
+        self.assertTrue(rcache.put_rootfs(self.layers, self.root))
+        snapshot = rcache.get_rootfs(self.layers)
+        self.assertEqual(os.stat(self.root + "/etc/a").st_nlink, 1)
+        with open(self.root + "/etc/a", "w") as filep:
+            filep.write("changed")
+        with open(snapshot + "/etc/a") as filep:
+            self.assertEqual(filep.read(), "a" * 1000)
+        os.makedirs(self.tmpdir + "/ROOT2")
+        self.assertTrue(rcache.copy_tree(snapshot, self.tmpdir + "/ROOT2"))
+        self.assertEqual(os.stat(snapshot + "/etc/a").st_ino,
+                         os.stat(self.tmpdir + "/ROOT2/etc/a").st_ino)
+
+    def test_06_evict_locked(self):
+        """Test06 RootfsCache().evict() waits for snapshot copies."""
+        rcache = RootfsCache(self.local, "copy", 1024 * 1024)
+        self.assertTrue(rcache.put_rootfs(self.layers, self.root))
+        snapshot = rcache.get_rootfs(self.layers)
+        rcache.maxsize = 0
+        thread = threading.Thread(target=rcache.evict)
+        with rcache.lock_rootfs(snapshot, shared=True):
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(os.path.isdir(snapshot))
+        thread.join()
+        self.assertFalse(os.path.exists(os.path.dirname(snapshot)))
+        self.assertEqual(os.listdir(rcache.cachedir), [".locks"])
+
+
+if __name__ == '__main__':
+    main()
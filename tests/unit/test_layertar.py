@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: LayerExtractor
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import TestCase, main
+from udocker.utils.layertar import LayerExtractor
+from udocker.utils.fileutil import FileUtil
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+class LayerExtractorTestCase(TestCase):
+    """Test LayerExtractor() python tarfile extraction of layers."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.destdir = self.tmpdir + "/ROOT"
+        os.makedirs(self.destdir)
+        FileUtil(self.tmpdir).register_prefix()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _mklayer(self, name, entries):
+        """Create a gzip layer tar file from a list of entries"""
+        tarf = self.tmpdir + "/" + name
+        with tarfile.open(tarf, "w:gz") as tar:
+            for (path, kind, data) in entries:
+                tinfo = tarfile.TarInfo(path)
+                fileobj = None
+                if kind == "d":
+                    tinfo.type = tarfile.DIRTYPE
+                    tinfo.mode = data
+                elif kind == "f":
+                    tinfo.size = len(data)
+                    tinfo.mode = 0o444
+                    fileobj = io.BytesIO(data)
+                elif kind == "s":
+                    tinfo.type = tarfile.SYMTYPE
+                    tinfo.linkname = data
+                elif kind == "h":
+                    tinfo.type = tarfile.LNKTYPE
+                    tinfo.linkname = data
+                elif kind == "c":
+                    tinfo.type = tarfile.CHRTYPE
+                tar.addfile(tinfo, fileobj)
+        return tarf
+
+    def test_01_init(self):
+        """Test01 LayerExtractor() constructor."""
+        extractor = LayerExtractor(self.destdir)
+        self.assertEqual(extractor.destdir, self.destdir)
+        self.assertEqual(extractor._layer_paths, set())
+
+    def test_02_is_supported(self):
+        """Test02 LayerExtractor().is_supported()."""
+        extractor = LayerExtractor(self.destdir)
+        tarf = self._mklayer("l1.tar", [("a", "f", b"a")])
+        self.assertTrue(extractor.is_supported(tarf))
+        self.assertFalse(extractor.is_supported("-"))
+        self.assertFalse(extractor.is_supported(self.tmpdir + "/missing"))
+
+    def test_03__member_path(self):
+        """Test03 LayerExtractor()._member_path()."""
+        extractor = LayerExtractor(self.destdir)
+        self.assertEqual(extractor._member_path("./usr//bin/"), "usr/bin")
+        self.assertEqual(extractor._member_path("/etc/passwd"), "etc/passwd")
+        self.assertEqual(extractor._member_path("a/../../b"), "")
+        self.assertEqual(extractor._member_path("./"), "")
+
+    def test_04_extract(self):
+        """Test04 LayerExtractor().extract() layers and whiteouts."""
+        layer1 = self._mklayer("l1.tar", [
+            ("etc", "d", 0o755), ("etc/a", "f", b"a"), ("etc/b", "f", b"b"),
+            ("ro", "d", 0o555), ("ro/x", "f", b"x"),
+            ("opq", "d", 0o755), ("opq/old", "f", b"o"),
+            ("dev", "d", 0o755), ("dev/null", "c", None),
+            ("dev/x", "f", b""), ("lnk", "s", "/etc/a"),
+            ("hl", "h", "etc/a"), ("../evil", "f", b"e")])
+        layer2 = self._mklayer("l2.tar", [
+            ("etc/.wh.a", "f", b""), ("opq/new", "f", b"n"),
+            ("opq/.wh..wh..opq", "f", b""), ("ro/y", "f", b"y"),
+            ("lnk", "f", b"file")])
+        extractor = LayerExtractor(self.destdir)
+        self.assertTrue(extractor.extract(layer1))
+        self.assertTrue(extractor.extract(layer2))
+        root = self.destdir
+        self.assertFalse(os.path.exists(root + "/etc/a"))
+        self.assertTrue(os.path.exists(root + "/etc/b"))
+        self.assertTrue(os.stat(root + "/etc/b").st_mode & 0o200)
+        self.assertTrue(os.stat(root + "/ro").st_mode & 0o200)
+        self.assertEqual(os.listdir(root + "/opq"), ["new"])
+        self.assertEqual(os.listdir(root + "/dev"), [])
+        self.assertFalse(os.path.islink(root + "/lnk"))
+        with open(root + "/hl", "rb") as filep:
+            self.assertEqual(filep.read(), b"a")
+        self.assertFalse(os.path.exists(self.tmpdir + "/evil"))
+        self.assertFalse(os.path.exists(root + "/etc/.wh.a"))
+
+    def test_05_extract_outside(self):
+        """Test05 LayerExtractor().extract() through symlinks."""
+        layer1 = self._mklayer("l1.tar", [
+            ("esc", "s", self.tmpdir), ("esc/pwn", "f", b"p"),
+            ("hl", "h", "esc/l1.tar")])
+        extractor = LayerExtractor(self.destdir)
+        self.assertFalse(extractor.extract(layer1))
+        self.assertFalse(os.path.exists(self.tmpdir + "/pwn"))
+        self.assertFalse(os.path.exists(self.destdir + "/hl"))
+        self.assertFalse(extractor.extract(self.tmpdir + "/missing"))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@
 udocker unit tests: LocalRepository
 """
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import patch, mock_open, call
 from udocker.container.localrepo import LocalRepository
@@ -28,6 +31,8 @@ class LocalRepositoryTestCase(TestCase):
         Config().conf['reposdir'] = ""
         Config().conf['layersdir'] = ""
         Config().conf['containersdir'] = ""
+        Config().conf['shared_reposdirs'] = ""
+        Config().conf['shared_layersdirs'] = ""
         Config().conf['homedir'] = "/home/u1"
 
     def tearDown(self):
@@ -250,29 +255,27 @@ class LocalRepositoryTestCase(TestCase):
         status = lrepo.iswriteable_container(container_id)
         self.assertEqual(status, 0)
 
-    @patch.object(LocalRepository, 'cd_container')
-    @patch('udocker.container.localrepo.Uprocess.get_output')
-    @patch('udocker.container.localrepo.FileUtil')
-    def test_13_get_size(self, mock_fu, mock_getout, mock_cdcont):
+    def test_13_get_size(self):
         """Test13 LocalRepository().get_size()."""
-        mock_fu.return_value.register_prefix.side_effect = \
-            [None, None, None]
-        container_id = "d2578feb-acfc-37e0-8561-47335f85e46a"
-        mock_getout.return_value = "1234 dd"
-        mock_cdcont.return_value = "/home/u1/.udocker/containerid"
-        lrepo = LocalRepository(UDOCKER_TOPDIR)
-        status = lrepo.get_size(container_id)
-        self.assertEqual(status, 1234)
-        self.assertTrue(mock_getout.called)
-
-        mock_fu.return_value.register_prefix.side_effect = \
-            [None, None, None]
-        container_id = "d2578feb-acfc-37e0-8561-47335f85e46a"
-        mock_getout.return_value = ""
-        mock_cdcont.return_value = "/home/u1/.udocker/containerid"
-        lrepo = LocalRepository(UDOCKER_TOPDIR)
-        status = lrepo.get_size(container_id)
-        self.assertEqual(status, -1)
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        self.assertEqual(lrepo.get_size("c1"), -1)
+        root = lrepo.containersdir + "/c1/ROOT"
+        os.makedirs(root + "/etc")
+        with open(root + "/etc/a", "wb") as filep:
+            filep.write(b"a" * (3 * 1024 * 1024 - 65536))
+        os.link(root + "/etc/a", root + "/b")
+        self.assertEqual(lrepo.get_size("c1"), 3)
+        index = lrepo.get_containers_index()
+        self.assertEqual(index["c1"]["size"], 3)
+        index["c1"]["size"] = 7
+        self.assertEqual(lrepo.get_size("c1"), 7)
+        os.utime(root + "/etc", (1, 1))
+        Config().conf['size_workers'] = 4
+        self.assertEqual(lrepo.get_size("c1"), 3)
+        Config().conf['size_workers'] = 1
+        shutil.rmtree(tmpdir)
 
     @patch('udocker.container.localrepo.os.listdir')
     @patch('udocker.container.localrepo.os.path.isdir')
@@ -324,6 +327,7 @@ class LocalRepositoryTestCase(TestCase):
             self.assertTrue(mock_listdir.called)
             self.assertTrue(mock_isdir.call_count, 2)
 
+    @patch.object(LocalRepository, '_lock_index')
     @patch.object(LocalRepository, 'del_container_name')
     @patch.object(LocalRepository, 'cd_container')
     @patch.object(LocalRepository, 'get_container_name')
@@ -331,7 +335,7 @@ class LocalRepositoryTestCase(TestCase):
     @patch('udocker.container.localrepo.FileUtil')
     def test_15_del_container(self, mock_fu,
                               mock_getlist, mock_getname,
-                              mock_cdcont, mock_delname):
+                              mock_cdcont, mock_delname, mock_lock):
         """Test15 LocalRepository().del_container()."""
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
@@ -372,33 +376,26 @@ class LocalRepositoryTestCase(TestCase):
         self.assertTrue(status)
         self.assertTrue(mock_fu.return_value.remove.called)
 
-    @patch.object(LocalRepository, 'get_containers_list')
-    @patch('udocker.container.localrepo.os.path.exists')
+    @patch('udocker.container.localrepo.os.path.isdir')
     @patch('udocker.container.localrepo.FileUtil')
-    def test_16_cd_container(self, mock_fu, mock_exists,
-                             mock_getlist):
+    def test_16_cd_container(self, mock_fu, mock_isdir):
         """Test16 LocalRepository().cd_container()."""
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
         cont_id = "d2578feb-acfc-37e0-8561-47335f85e46a"
         cdirs = "/home/u1/.udocker/containers"
         contdir = cdirs + "/" + cont_id
-        mock_getlist.return_value = [contdir]
-        mock_exists.return_value = False
+        mock_isdir.return_value = False
         lrepo = LocalRepository(UDOCKER_TOPDIR)
         status = lrepo.cd_container(cont_id)
         self.assertEqual(status, "")
 
-        mock_fu.return_value.register_prefix.side_effect = \
-            [None, None, None]
-        cont_id = "d2578feb-acfc-37e0-8561-47335f85e46a"
-        cdirs = "/home/u1/.udocker/containers"
-        contdir = cdirs + "/" + cont_id
-        mock_getlist.return_value = [contdir]
-        mock_exists.return_value = True
-        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        mock_isdir.return_value = True
         status = lrepo.cd_container(cont_id)
         self.assertEqual(status, contdir)
+        self.assertEqual(lrepo.cd_container("../layers"), "")
+        self.assertEqual(lrepo.cd_container(".."), "")
+        self.assertEqual(lrepo.cd_container(""), "")
 
     @patch('udocker.container.localrepo.os.path.relpath')
     @patch('udocker.container.localrepo.os.symlink')
@@ -747,13 +744,14 @@ class LocalRepositoryTestCase(TestCase):
         out = lrepo._inrepository(filename)
         self.assertEqual(out, [])
 
+    @patch.object(LocalRepository, 'lock_layer')
     @patch('udocker.container.localrepo.os.readlink')
     @patch('udocker.container.localrepo.os.path.islink')
     @patch('udocker.container.localrepo.os.listdir')
-    @patch.object(LocalRepository, '_inrepository')
+    @patch.object(LocalRepository, '_del_layer_ref')
     @patch('udocker.container.localrepo.FileUtil')
     def test_30__remove_layers(self, mock_fu, mock_in, mock_listdir,
-                               mock_islink, mock_readlink):
+                               mock_islink, mock_readlink, mock_lock):
         """Test30 LocalRepository()._remove_layers()."""
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
@@ -817,10 +815,12 @@ class LocalRepositoryTestCase(TestCase):
         status = lrepo._remove_layers("TAG_DIR", True)
         self.assertTrue(status)
 
+    @patch.object(LocalRepository, 'lock_tag')
     @patch.object(LocalRepository, 'cd_imagerepo')
     @patch.object(LocalRepository, '_remove_layers')
     @patch('udocker.container.localrepo.FileUtil')
-    def test_31_del_imagerepo(self, mock_fu, mock_rmlayers, mock_cd):
+    def test_31_del_imagerepo(self, mock_fu, mock_rmlayers, mock_cd,
+                              mock_lock):
         """Test31 LocalRepository()._del_imagerepo()."""
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
@@ -831,7 +831,7 @@ class LocalRepositoryTestCase(TestCase):
 
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
-        mock_cd.return_value = True
+        mock_cd.return_value = UDOCKER_TOPDIR + "/repos/IMAGE/TAG"
         mock_fu.return_value.remove.return_value = True
         mock_rmlayers.return_value = True
         lrepo = LocalRepository(UDOCKER_TOPDIR)
@@ -935,13 +935,16 @@ class LocalRepositoryTestCase(TestCase):
         self.assertTrue(mock_islink.called)
         self.assertEqual(status, [("IMAGE/TAG/f1", 123)])
 
+    @patch.object(LocalRepository, 'lock_layer')
+    @patch.object(LocalRepository, '_add_layer_ref')
     @patch.object(LocalRepository, '_symlink')
     @patch('udocker.container.localrepo.os.path.basename')
     @patch('udocker.container.localrepo.os.path.islink')
     @patch('udocker.container.localrepo.os.path.exists')
     @patch('udocker.container.localrepo.FileUtil')
     def test_35_add_image_layer(self, mock_fu, mock_exists,
-                                mock_islink, mock_base, mock_symln):
+                                mock_islink, mock_base, mock_symln,
+                                mock_addref, mock_lock):
         """Test35 LocalRepository().add_image_layer()."""
         mock_fu.return_value.register_prefix.side_effect = \
             [None, None, None]
@@ -988,6 +991,7 @@ class LocalRepositoryTestCase(TestCase):
         self.assertTrue(mock_fu.return_value.remove.called)
         self.assertTrue(mock_islink.called)
         self.assertTrue(mock_symln.called)
+        mock_addref.assert_called_once_with("file1", "TAG/file1")
 
     @patch('udocker.container.localrepo.os.makedirs')
     @patch('udocker.container.localrepo.os.path.exists')
@@ -1449,6 +1453,353 @@ class LocalRepositoryTestCase(TestCase):
     #     """Test53 LocalRepository().verify_image"""
     #     pass
 
+    @patch('udocker.container.localrepo.os.path.realpath')
+    @patch('udocker.container.localrepo.os.stat')
+    @patch('udocker.container.localrepo.FileUtil')
+    def test_54_layer_digest(self, mock_fu, mock_stat, mock_realpath):
+        """Test54 LocalRepository().set_layer_digest() get_layer_digest()"""
+        mock_fu.return_value.register_prefix.side_effect = \
+            [None, None, None]
+        mock_realpath.side_effect = lambda path: path
+        mock_stat.return_value.st_size = 10
+        mock_stat.return_value.st_mtime_ns = 1000
+        mock_stat.return_value.st_ino = 5
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertEqual(lrepo.get_layer_digest("/l/f", "sha256"), "")
+        self.assertTrue(lrepo.set_layer_digest("/l/f", "sha256", "aa"))
+        self.assertEqual(lrepo.get_layer_digest("/l/f", "sha256"), "aa")
+        self.assertEqual(lrepo.get_layer_digest("/l/f", "sha512"), "")
+        mock_stat.return_value.st_mtime_ns = 2000
+        self.assertEqual(lrepo.get_layer_digest("/l/f", "sha256"), "")
+        mock_stat.side_effect = OSError("fail")
+        self.assertFalse(lrepo.set_layer_digest("/l/f", "sha256", "aa"))
+
+    def test_55_layer_digest_sidecar(self):
+        """Test55 LocalRepository() layer metadata sidecar files"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        Config().conf['layersdir'] = tmpdir
+        layer_file = tmpdir + "/sha256:aa"
+        with open(layer_file, "wb") as filep:
+            filep.write(b"data")
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertTrue(lrepo.set_layer_digest(layer_file, "sha256", "aa"))
+        self.assertTrue(os.path.exists(tmpdir + "/.layermeta/sha256:aa.json"))
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertEqual(lrepo.get_layer_digest(layer_file, "sha256"), "aa")
+        with open(layer_file, "ab") as filep:
+            filep.write(b"more")
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertEqual(lrepo.get_layer_digest(layer_file, "sha256"), "")
+        lrepo._remove_layer_meta(layer_file)
+        self.assertFalse(os.path.exists(tmpdir + "/.layermeta/sha256:aa.json"))
+        os.remove(layer_file)
+        os.rmdir(tmpdir + "/.layermeta")
+        os.rmdir(tmpdir)
+
+    @patch.object(LocalRepository, 'get_layer_digest')
+    @patch('udocker.container.localrepo.ChkSUM.hash_many')
+    @patch('udocker.container.localrepo.os.path.exists')
+    @patch('udocker.container.localrepo.FileUtil')
+    def test_56__hash_layer_files(self, mock_fu, mock_exists, mock_hmany,
+                                  mock_getdigest):
+        """Test56 LocalRepository()._hash_layer_files()"""
+        mock_fu.return_value.register_prefix.side_effect = \
+            [None, None, None]
+        mock_exists.return_value = True
+        mock_getdigest.side_effect = \
+            lambda layer_f, algorithm: "cc" if layer_f == "/t/c" else ""
+        mock_hmany.return_value = {"/t/a": "aa", "/t/b": "xx"}
+        structure = {"repolayers": {
+            "sha256:aa": {"layer_f": "/t/a"},
+            "sha256:bb": {"layer_f": "/t/b"},
+            "sha256:cc": {"layer_f": "/t/c"},
+            "dd": {"layer_f": "/t/d"},
+            "sha256:ee": {}, }}
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        status = lrepo._hash_layer_files(structure)
+        self.assertEqual(status, {"sha256:aa": "aa", "sha256:bb": "xx"})
+        self.assertEqual(sorted(mock_hmany.call_args[0][0]),
+                         ["/t/a", "/t/b"])
+
+    @patch.object(LocalRepository, '_update_layer_meta')
+    @patch.object(LocalRepository, '_load_layer_meta')
+    @patch('udocker.container.localrepo.Uprocess.get_output')
+    @patch('udocker.container.localrepo.Msg')
+    @patch('udocker.container.localrepo.FileUtil')
+    def test_57_get_layer_whiteouts(self, mock_fu, mock_msg,
+                                    mock_uprocget, mock_loadmeta,
+                                    mock_updmeta):
+        """Test57 LocalRepository().get_layer_whiteouts()"""
+        mock_fu.return_value.register_prefix.side_effect = \
+            [None, None, None]
+        mock_loadmeta.return_value = {"whiteouts": ["d/.wh.a"]}
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertEqual(lrepo.get_layer_whiteouts("/l/f"), ["d/.wh.a"])
+        self.assertFalse(mock_uprocget.called)
+
+        mock_loadmeta.return_value = {}
+        mock_uprocget.return_value = "d/\nd/.wh.a\nd/b.wh.c\n.wh.e\n" \
+            "d/.wh..wh..opq\n"
+        self.assertEqual(lrepo.get_layer_whiteouts("/l/f"),
+                         ["d/.wh.a", ".wh.e", "d/.wh..wh..opq"])
+        self.assertEqual(mock_uprocget.call_args[0][0],
+                         ["tar", "tf", "/l/f"])
+        mock_updmeta.assert_called_with(
+            "/l/f", whiteouts=["d/.wh.a", ".wh.e", "d/.wh..wh..opq"],
+            dirs=["d"])
+
+        mock_updmeta.reset_mock()
+        mock_uprocget.return_value = None
+        self.assertEqual(lrepo.get_layer_whiteouts("/l/f"), [])
+        self.assertFalse(mock_updmeta.called)
+
+    @patch('udocker.container.localrepo.FileUtil')
+    def test_58_layer_cache_dir(self, mock_fu):
+        """Test58 LocalRepository() extracted layers cache"""
+        mock_fu.return_value.register_prefix.side_effect = \
+            [None, None, None]
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        Config().conf['layersdir'] = tmpdir
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        Config().conf['layersdir'] = ""
+        layer_file = tmpdir + "/sha256:aa"
+        self.assertEqual(lrepo.layer_cache_dir(layer_file),
+                         tmpdir + "/.layercache/sha256:aa")
+        self.assertEqual(lrepo.layer_cache_dir("/other/sha256:aa"), "")
+        with open(layer_file, "w") as filep:
+            filep.write("data")
+        self.assertFalse(lrepo.is_layer_extracted(layer_file))
+        self.assertTrue(lrepo.set_layer_extracted(layer_file))
+        self.assertTrue(lrepo.is_layer_extracted(layer_file))
+        with open(layer_file, "a") as filep:
+            filep.write("more")
+        self.assertFalse(lrepo.is_layer_extracted(layer_file))
+        os.makedirs(tmpdir + "/.layercache/sha256:aa")
+        lrepo._remove_layer_meta(layer_file)
+        self.assertTrue(mock_fu.return_value.remove.called)
+        shutil.rmtree(tmpdir)
+
+    def test_59_layer_refs(self):
+        """Test59 LocalRepository() layer references index"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        layer_file = lrepo.layersdir + "/sha256:aa"
+        with open(layer_file, "w") as filep:
+            filep.write("data")
+        lrepo.setup_imagerepo("repo/img")
+        lrepo.setup_tag("v1")
+        self.assertTrue(lrepo.add_image_layer(layer_file))
+        self.assertEqual(lrepo.get_layer_refs("sha256:aa"),
+                         ["repo/img/v1/sha256:aa"])
+        self.assertTrue(os.path.exists(lrepo.layersdir + "/.layerrefs.json"))
+        self.assertTrue(lrepo.tag("repo/img", "v1", "repo/img", "v2"))
+        self.assertEqual(sorted(lrepo.get_layer_refs("sha256:aa")),
+                         ["repo/img/v1/sha256:aa", "repo/img/v2/sha256:aa"])
+
+        os.remove(lrepo.layersdir + "/.layerrefs.json")
+        lrepo = LocalRepository(tmpdir)
+        self.assertEqual(sorted(lrepo.get_layer_refs("sha256:aa")),
+                         ["repo/img/v1/sha256:aa", "repo/img/v2/sha256:aa"])
+        self.assertTrue(lrepo.del_imagerepo("repo/img", "v1"))
+        self.assertTrue(os.path.exists(layer_file))
+        self.assertEqual(lrepo.get_layer_refs("sha256:aa"),
+                         ["repo/img/v2/sha256:aa"])
+        os.makedirs(lrepo.reposdir + "/repo/old/v1")
+        with open(lrepo.reposdir + "/repo/old/v1/TAG", "w") as filep:
+            filep.write("repo/old:v1")
+        os.symlink(layer_file, lrepo.reposdir + "/repo/old/v1/sha256:aa")
+        lrepo.rebuild_layer_refs()
+        self.assertTrue(lrepo.del_imagerepo("repo/img", "v2"))
+        self.assertTrue(os.path.exists(layer_file))
+        self.assertEqual(lrepo.get_layer_refs("sha256:aa"),
+                         ["repo/old/v1/sha256:aa"])
+        self.assertTrue(lrepo.del_imagerepo("repo/old", "v1"))
+        self.assertFalse(os.path.exists(layer_file))
+        self.assertEqual(lrepo.get_layer_refs("sha256:aa"), [])
+        shutil.rmtree(tmpdir)
+
+    def test_60_store_layer(self):
+        """Test60 LocalRepository() layers stored by content digest"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        Config().conf['layer_store'] = "digest"
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        digest = ("sha256:3a6eb0790f39ac87c94f3856b2dd2c5d"
+                  "110e6811602261a9a923d3bb23adc8b7")
+        for (tag, layer_id) in (("v1", "id1"), ("v2", "id2")):
+            layer_file = lrepo.layersdir + "/" + layer_id + ".layer"
+            with open(layer_file, "w") as filep:
+                filep.write("data")
+            lrepo.setup_imagerepo("repo/img")
+            lrepo.setup_tag(tag)
+            self.assertTrue(lrepo.add_image_layer(layer_file))
+            link = lrepo.cur_tagdir + "/" + layer_id + ".layer"
+            self.assertTrue(os.path.islink(link))
+            self.assertEqual(os.path.basename(os.readlink(link)), digest)
+        self.assertEqual(sorted(os.listdir(lrepo.layersdir)),
+                         [".layermeta", ".layerrefs.json",
+                          ".layerrefs.json.lock", ".locks", "id1.layer",
+                          "id2.layer", digest])
+        self.assertEqual(os.readlink(lrepo.layersdir + "/id1.layer"), digest)
+        self.assertEqual(lrepo.get_layer_digest(
+            lrepo.layersdir + "/id2.layer", "sha256"), digest[7:])
+        self.assertEqual(len(lrepo.get_layer_refs(digest)), 2)
+
+        self.assertTrue(lrepo.del_imagerepo("repo/img", "v1"))
+        self.assertTrue(os.path.exists(lrepo.layersdir + "/" + digest))
+        self.assertTrue(lrepo.del_imagerepo("repo/img", "v2"))
+        self.assertEqual(sorted(os.listdir(lrepo.layersdir)),
+                         [".layermeta", ".layerrefs.json",
+                          ".layerrefs.json.lock", ".locks"])
+        shutil.rmtree(tmpdir)
+
+    def test_61_migrate_layers(self):
+        """Test61 LocalRepository().migrate_layers()"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        Config().conf['layer_store'] = "name"
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        with open(lrepo.layersdir + "/id1.layer", "w") as filep:
+            filep.write("data")
+        lrepo.setup_imagerepo("repo/img")
+        lrepo.setup_tag("v1")
+        self.assertTrue(lrepo.add_image_layer(
+            lrepo.layersdir + "/id1.layer"))
+        link = lrepo.cur_tagdir + "/id1.layer"
+        self.assertEqual(os.path.basename(os.readlink(link)), "id1.layer")
+
+        self.assertEqual(lrepo.migrate_layers(), 1)
+        self.assertEqual(lrepo.migrate_layers(), 0)
+        self.assertTrue(
+            os.path.basename(os.readlink(link)).startswith("sha256:"))
+        self.assertTrue(os.path.islink(lrepo.layersdir + "/id1.layer"))
+        with open(link) as filep:
+            self.assertEqual(filep.read(), "data")
+        self.assertEqual(list(lrepo.get_layer_refs(
+            os.path.basename(os.readlink(link)))), ["repo/img/v1/id1.layer"])
+        shutil.rmtree(tmpdir)
+
+    def test_62_get_images_index(self):
+        """Test62 LocalRepository().get_images_index()"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        with open(lrepo.layersdir + "/sha256:aa", "w") as filep:
+            filep.write("data")
+        lrepo.setup_imagerepo("repo/img")
+        lrepo.setup_tag("v1")
+        lrepo.add_image_layer(lrepo.layersdir + "/sha256:aa")
+        self.assertFalse(os.path.exists(lrepo.reposdir + "/.images.json"))
+        images = lrepo.get_images_index()
+        self.assertEqual(images, [("repo/img", "v1", {
+            "protected": False, "platform": "unknown/unknown",
+            "layers": [["sha256:aa", 4]]})])
+        self.assertTrue(os.path.exists(lrepo.reposdir + "/.images.json"))
+
+        lrepo.tag("repo/img", "v1", "repo/img", "v2")
+        lrepo.protect_imagerepo("repo/img", "v1")
+        index = lrepo.load_json(lrepo.reposdir + "/.images.json")
+        self.assertEqual(index["repo/img"], {"v1": None, "v2": None})
+        images = lrepo.get_images_index()
+        self.assertEqual([(repo, tag) for (repo, tag, dummy) in images],
+                         [("repo/img", "v1"), ("repo/img", "v2")])
+        self.assertTrue(images[0][2]["protected"])
+
+        lrepo.del_imagerepo("repo/img", "v2")
+        self.assertEqual(len(lrepo.get_images_index()), 1)
+        os.remove(lrepo.reposdir + "/.images.json")
+        self.assertEqual(lrepo.get_images_index(), images[:1])
+        shutil.rmtree(tmpdir)
+
+    def test_63_containers_index(self):
+        """Test63 LocalRepository().update_containers_index()"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        lrepo = LocalRepository(tmpdir)
+        lrepo.create_repo()
+        self.assertEqual(lrepo.get_containers_index(), {})
+        self.assertTrue(lrepo.clear_containers_index("c1"))
+        self.assertFalse(os.path.exists(lrepo.containersdir +
+                                        "/.containers.json"))
+        lrepo.update_containers_index({"c1": {"size": 2, "platform": "p"},
+                                       "c2": {"size": 3}})
+        lrepo.update_containers_index({"c1": {"size": 4}})
+        lrepo.clear_containers_index("c2", "size")
+        self.assertEqual(lrepo.load_json(lrepo.containersdir +
+                                         "/.containers.json"),
+                         {"c1": {"size": 4, "platform": "p"}, "c2": {}})
+        os.makedirs(lrepo.containersdir + "/c1/ROOT")
+        self.assertEqual(lrepo.get_containers_list(), [
+            lrepo.containersdir + "/c1"])
+        self.assertTrue(lrepo.del_container("c1"))
+        self.assertEqual(lrepo.get_containers_index(), {"c2": {}})
+        shutil.rmtree(tmpdir)
+
+    def test_64_shared_repository(self):
+        """Test64 LocalRepository() with a shared read-only repository"""
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        shared = LocalRepository(tmpdir + "/shared")
+        shared.create_repo()
+        digest = ("sha256:3a6eb0790f39ac87c94f3856b2dd2c5d"
+                  "110e6811602261a9a923d3bb23adc8b7")
+        with open(shared.layersdir + "/" + digest, "w") as filep:
+            filep.write("data")
+        shared.setup_imagerepo("repo/img")
+        shared.setup_tag("v1")
+        shared.add_image_layer(shared.layersdir + "/" + digest)
+        Config().conf['shared_reposdirs'] = shared.reposdir
+        lrepo = LocalRepository(tmpdir + "/user")
+        lrepo.create_repo()
+        self.assertEqual(lrepo.shared_layersdirs, [shared.layersdir])
+        self.assertTrue(lrepo.is_shared(shared.layersdir + "/" + digest))
+        self.assertFalse(lrepo.is_shared(lrepo.layersdir + "/" + digest))
+        tag_dir = lrepo.cd_imagerepo("repo/img", "v1")
+        self.assertEqual(tag_dir, shared.reposdir + "/repo/img/v1")
+        self.assertEqual(lrepo.get_imagerepos(), [("repo/img", "v1")])
+        images = lrepo.get_images_index()
+        self.assertEqual(images[0][2]["reposdir"], shared.reposdir)
+        self.assertFalse(lrepo.del_imagerepo("repo/img", "v1"))
+
+        self.assertEqual(lrepo.find_shared_layer(digest),
+                         shared.layersdir + "/" + digest)
+        self.assertEqual(lrepo.find_shared_layer("sha256:00"), "")
+        lrepo.setup_imagerepo("repo/img")
+        lrepo.setup_tag("v1")
+        self.assertTrue(lrepo.add_image_layer(shared.layersdir + "/" +
+                                              digest))
+        self.assertEqual(os.readlink(lrepo.cur_tagdir + "/" + digest),
+                         shared.layersdir + "/" + digest)
+        self.assertEqual(lrepo.cd_imagerepo("repo/img", "v1"),
+                         lrepo.reposdir + "/repo/img/v1")
+        self.assertTrue(lrepo.del_imagerepo("repo/img", "v1"))
+        self.assertTrue(os.path.exists(shared.layersdir + "/" + digest))
+        Config().conf['shared_reposdirs'] = ""
+        shutil.rmtree(tmpdir)
+
+    @patch.object(LocalRepository, '_update_layer_meta')
+    @patch.object(LocalRepository, '_load_layer_meta')
+    @patch('udocker.container.localrepo.Uprocess.get_output')
+    @patch('udocker.container.localrepo.Msg')
+    @patch('udocker.container.localrepo.FileUtil')
+    def test_65_get_layer_dirs(self, mock_fu, mock_msg, mock_uprocget,
+                               mock_loadmeta, mock_updmeta):
+        """Test65 LocalRepository().get_layer_dirs()"""
+        mock_fu.return_value.register_prefix.side_effect = \
+            [None, None, None]
+        mock_loadmeta.return_value = {"whiteouts": [], "dirs": ["d"]}
+        lrepo = LocalRepository(UDOCKER_TOPDIR)
+        self.assertEqual(lrepo.get_layer_dirs("/l/f"), ["d"])
+        self.assertFalse(mock_uprocget.called)
+
+        mock_loadmeta.return_value = {"whiteouts": []}
+        mock_uprocget.return_value = "./\n./d/\n./d/a\n./d/e/\n/f/.wh.g\n"
+        self.assertEqual(lrepo.get_layer_dirs("/l/f"), ["d", "d/e"])
+        mock_updmeta.assert_called_with(
+            "/l/f", whiteouts=["/f/.wh.g"], dirs=["d", "d/e"])
+
+        mock_uprocget.return_value = None
+        self.assertIsNone(lrepo.get_layer_dirs("/l/f"))
+
 
 if __name__ == '__main__':
     main()
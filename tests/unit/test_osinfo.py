@@ -29,11 +29,14 @@ class GuestInfoTestCase(TestCase):
         ginfo = OSInfo(self.rootdir)
         self.assertEqual(ginfo._root_dir, self.rootdir)
 
+    @patch('udocker.helper.osinfo.ElfHeader')
     @patch('udocker.helper.osinfo.os.path.islink')
     @patch('udocker.helper.osinfo.Uprocess.get_output')
     @patch('udocker.helper.osinfo.os.path.isfile')
-    def test_02_get_filetype(self, mock_isfile, mock_getout, mock_islink):
+    def test_02_get_filetype(self, mock_isfile, mock_getout, mock_islink,
+                             mock_elfh):
         """Test02 OSInfo.get_filetype(filename)"""
+        mock_elfh.return_value.read.return_value = None
         # file does not exist
         ftype = "/bin/ls: yyy, x86-64, xxx"
         mock_islink.return_value = False
@@ -50,7 +53,23 @@ class GuestInfoTestCase(TestCase):
         mock_getout.return_value = ftype
         ginfo = OSInfo(self.rootdir)
         status = ginfo.get_filetype(self.file)
-        self.assertEqual(status, ("readelf", ftype))
+        self.assertEqual(status, ("file", " yyy, x86-64, xxx"))
+
+        # ELF header read in process
+        mock_elfh.return_value.read.return_value = {
+            "class": 64, "endian": "little", "osabi": 0, "type": 3,
+            "machine": 62, "flags": 0, "dynamic": True,
+            "interpreter": "/lib64/ld-linux-x86-64.so.2", "rpath": ""}
+        mock_getout.reset_mock()
+        status = ginfo.get_filetype(self.file)
+        self.assertEqual(status, ("elf", "ELF64 little endian machine=62; "
+                                  "osabi=0; DYN dynamic interpreter "
+                                  "/lib64/ld-linux-x86-64.so.2"))
+        self.assertFalse(mock_getout.called)
+        self.assertEqual(ginfo.get_arch(status[0], status[1]), ["x86_64"])
+        self.assertEqual(ginfo.get_arch(status[0], status[1], "qemu"),
+                         ["x86_64"])
+        mock_elfh.return_value.read.return_value = None
 
         # file type data not returned
         mock_isfile.return_value = False
@@ -119,5 +138,29 @@ class GuestInfoTestCase(TestCase):
         self.assertEqual(status, "")
 
 
+    @patch('udocker.helper.osinfo.ElfHeader')
+    @patch('udocker.helper.osinfo.os.path.islink')
+    @patch('udocker.helper.osinfo.os.path.isfile')
+    def test_06_arch_from_binaries(self, mock_isfile, mock_islink,
+                                   mock_elfh):
+        """Test06 OSInfo.arch_from_binaries()"""
+        mock_islink.return_value = False
+        mock_isfile.return_value = True
+        mock_elfh.return_value.read.return_value = {
+            "class": 32, "endian": "little", "osabi": 0, "type": 2,
+            "machine": 40, "flags": 0x05000400, "dynamic": True,
+            "interpreter": "/lib/ld-linux-armhf.so.3", "rpath": ""}
+        ginfo = OSInfo(self.rootdir)
+        self.assertEqual(ginfo.arch_from_binaries(), "armhf")
+        self.assertEqual(ginfo.arch_from_binaries("docker"), "arm")
+
+        mock_elfh.return_value.read.return_value["flags"] = 0x05000200
+        self.assertEqual(ginfo.arch_from_binaries(), "armel")
+
+        mock_elfh.return_value.read.return_value.update(
+            {"class": 64, "endian": "big", "machine": 22})
+        self.assertEqual(ginfo.arch_from_binaries(), "s390x")
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: run_parallel
+"""
+
+import threading
+from unittest import TestCase, main
+from udocker.utils.parallel import run_parallel
+
+
+class RunParallelTestCase(TestCase):
+    """Test run_parallel()."""
+
+    def test_01_run_parallel(self):
+        """Test01 run_parallel() with threads."""
+        calls = []
+        status = run_parallel(lambda item: calls.append(item) or item * 2,
+                              [3, 1, 2, 1], 4)
+        self.assertEqual(status, {1: 2, 2: 4, 3: 6})
+        self.assertEqual(sorted(calls), [1, 2, 3])
+
+        status = run_parallel(lambda item: item, [], 4)
+        self.assertEqual(status, {})
+
+    def test_02_run_parallel(self):
+        """Test02 run_parallel() in the calling thread."""
+        threads = []
+        status = run_parallel(
+            lambda item: threads.append(threading.current_thread()) or item,
+            ["a", "b"], 1)
+        self.assertEqual(status, {"a": "a", "b": "b"})
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+        status = run_parallel(lambda item: item, ["a"], 0)
+        self.assertEqual(status, {"a": "a"})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: RepositoryGC
+"""
+
+import os
+import json
+import shutil
+import threading
+import tempfile
+from unittest import TestCase, main
+from udocker.container.repogc import RepositoryGC
+from udocker.container.localrepo import LocalRepository
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+class RepositoryGCTestCase(TestCase):
+    """Test RepositoryGC() garbage collection of the repository."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.local = LocalRepository(self.tmpdir)
+        self.local.create_repo()
+        self.layersdir = self.local.layersdir
+        for name in ("sha256:aa", "sha256:bb", "sha256:cc.tmp"):
+            self._putfile(self.layersdir + "/" + name, name)
+        self.local.setup_imagerepo("repo/img")
+        self.local.setup_tag("v1")
+        self.local.add_image_layer(self.layersdir + "/sha256:aa")
+        self._putfile(self.layersdir + "/.layermeta/sha256:aa.json", "{}")
+        self._putfile(self.layersdir + "/.layermeta/sha256:bb.json", "{}")
+        self._putfile(self.layersdir + "/.layercache/sha256:bb/f", "f")
+        self._putfile(self.layersdir + "/.rootfscache/k1/snapshot.json",
+                      json.dumps({"layers": ["sha256:aa"], "size": 1}))
+        self._putfile(self.layersdir + "/.rootfscache/k2/snapshot.json",
+                      json.dumps({"layers": ["sha256:bb"], "size": 1}))
+        cntdir = self.local.containersdir
+        self._putfile(cntdir + "/c1/imagerepo.name", "CLONING:inprogress")
+        self._putfile(cntdir + "/c2/imagerepo.name", "repo/img:v1")
+        os.symlink("c3", cntdir + "/name3")
+        for (dirpath, dirnames, filenames) in os.walk(self.tmpdir):
+            for name in dirnames + filenames:
+                os.utime(dirpath + "/" + name, (1, 1),
+                         follow_symlinks=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _putfile(self, pathname, data):
+        """Create a file with some content"""
+        if not os.path.isdir(os.path.dirname(pathname)):
+            os.makedirs(os.path.dirname(pathname))
+        with open(pathname, "w") as filep:
+            filep.write(data)
+
+    def test_01_find_garbage(self):
+        """Test01 RepositoryGC().find_garbage()."""
+        garbage = RepositoryGC(self.local).find_garbage(False)
+        cntdir = self.local.containersdir
+        self.assertEqual(sorted(garbage), sorted([
+            ("layer", self.layersdir + "/sha256:bb"),
+            ("tmp", self.layersdir + "/sha256:cc.tmp"),
+            ("meta", self.layersdir + "/.layermeta/sha256:bb.json"),
+            ("cache", self.layersdir + "/.layercache/sha256:bb"),
+            ("rootfs", self.layersdir + "/.rootfscache/k2"),
+            ("container", cntdir + "/c1"),
+            ("name", cntdir + "/name3"),
+            ("lock", self.layersdir + "/.locks/sha256:aa.lock"),
+        ]))
+
+        os.utime(self.layersdir + "/sha256:bb", None)
+        os.utime(self.layersdir + "/sha256:cc.tmp", None)
+        garbage = RepositoryGC(self.local).find_garbage(False)
+        self.assertNotIn(("layer", self.layersdir + "/sha256:bb"), garbage)
+        self.assertNotIn(("tmp", self.layersdir + "/sha256:cc.tmp"), garbage)
+        self.assertNotIn(("rootfs", self.layersdir + "/.rootfscache/k2"),
+                         garbage)
+        self.assertEqual(len(RepositoryGC(self.local, 0).find_garbage()), 8)
+
+    def test_02_collect(self):
+        """Test02 RepositoryGC().collect() dry run and removal."""
+        (garbage, failed) = RepositoryGC(self.local).collect(True)
+        self.assertEqual(len(garbage), 8)
+        self.assertEqual(failed, [])
+        self.assertTrue(os.path.exists(self.layersdir + "/sha256:bb"))
+        self.assertIn(("layer", self.layersdir + "/sha256:bb", 9), garbage)
+
+        (garbage, failed) = RepositoryGC(self.local).collect()
+        self.assertEqual(len(garbage), 8)
+        self.assertEqual(failed, [])
+        for (dummy, pathname, dummy) in garbage:
+            self.assertFalse(os.path.lexists(pathname))
+        self.assertTrue(os.path.exists(self.layersdir + "/sha256:aa"))
+        self.assertTrue(os.path.exists(self.local.containersdir + "/c2"))
+        self.assertEqual(RepositoryGC(self.local).find_garbage(), [])
+
+    def test_03_find_garbage_aliases(self):
+        """Test03 RepositoryGC().find_garbage() layer aliases."""
+        os.symlink("sha256:aa", self.layersdir + "/id1.layer")
+        os.symlink("sha256:bb", self.layersdir + "/id2.layer")
+        garbage = RepositoryGC(self.local).find_garbage(False)
+        self.assertIn(("alias", self.layersdir + "/id2.layer"), garbage)
+        self.assertNotIn(("alias", self.layersdir + "/id1.layer"), garbage)
+
+    def test_04_find_garbage_locks(self):
+        """Test04 RepositoryGC().find_garbage() locks and index tmp."""
+        reposdir = self.local.reposdir
+        cntdir = self.local.containersdir
+        old = [self.layersdir + "/.locks/sha256:bb.lock",
+               self.layersdir + "/.rootfscache/.locks/k2.lock",
+               reposdir + "/.locks/repo%2Fimg:v1.lock",
+               reposdir + "/.images.json.123",
+               cntdir + "/.containers.json.123"]
+        new = [self.layersdir + "/.locks/sha256:aa.lock",
+               reposdir + "/.images.json.124"]
+        for pathname in old + new:
+            self._putfile(pathname, "")
+        for pathname in old:
+            os.utime(pathname, (1, 1))
+        garbage = RepositoryGC(self.local).find_garbage(False)
+        for pathname in old:
+            self.assertTrue(("lock", pathname) in garbage or
+                            ("tmp", pathname) in garbage)
+        for pathname in new:
+            self.assertNotIn(pathname, [path for (dummy, path) in garbage])
+        self.assertNotIn(("rootfs", self.layersdir + "/.rootfscache/.locks"),
+                         garbage)
+
+    def test_05_sweep_relinked(self):
+        """Test05 RepositoryGC().sweep() keeps layers linked meanwhile."""
+        rgc = RepositoryGC(self.local)
+        garbage = rgc.find_garbage()
+        layer_file = self.layersdir + "/sha256:bb"
+        self.assertIn(("layer", layer_file), garbage)
+        self.local.setup_imagerepo("repo/other")
+        self.local.setup_tag("v1")
+        self.assertTrue(self.local.add_image_layer(layer_file))
+        failed = rgc.sweep(garbage)
+        self.assertEqual(failed, [])
+        self.assertTrue(os.path.exists(layer_file))
+        self.assertTrue(os.path.exists(
+            self.layersdir + "/.layermeta/sha256:bb.json"))
+        self.assertFalse(os.path.exists(self.layersdir + "/sha256:cc.tmp"))
+
+        layer_file = self.layersdir + "/sha256:dd"
+        self._putfile(layer_file, "dd")
+        thread = threading.Thread(target=rgc.sweep,
+                                  args=([("layer", layer_file)], ))
+        with self.local.lock_layer(layer_file):
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertTrue(os.path.exists(layer_file))
+        thread.join()
+        self.assertFalse(os.path.exists(layer_file))
+
+    def test_06_find_garbage_digests(self):
+        """Test06 RepositoryGC() removes the obsolete .digests."""
+        self._putfile(self.layersdir + "/.digests/sha256:aa.json", "{}")
+        rgc = RepositoryGC(self.local)
+        garbage = rgc.find_garbage(False)
+        self.assertIn(("obsolete", self.layersdir + "/.digests"), garbage)
+        self.assertEqual(rgc.sweep(garbage), [])
+        self.assertFalse(os.path.exists(self.layersdir + "/.digests"))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@
 udocker unit tests: RuncEngine
 """
 
+import sys
+import tempfile
 from unittest import TestCase, main
 from unittest.mock import Mock, patch, mock_open
 from udocker.config import Config
@@ -679,9 +681,22 @@ class RuncEngineTestCase(TestCase):
         status = rcex.run_pty("CONTAINERID")
         self.assertEqual(status, 0)
 
-    # def test_19_run_nopty(self):
-    #     """Test19 RuncEngine().run_nopty()."""
-    #     pass
+    @patch('udocker.engine.runc.FileBind')
+    def test_19_run_nopty(self, mock_fbind):
+        """Test19 RuncEngine().run_nopty()."""
+        rcex = RuncEngine(self.local, self.xmode)
+        rcex._filebind = mock_fbind
+        rcex.relay_size = 7
+        output = "line %d of the container output\n"
+        script = "for i in 1 2 3; do printf '%s' $i; done; exit 3" % output
+        with tempfile.TemporaryFile() as filep:
+            with patch.object(sys, "stdout", filep):
+                status = rcex.run_nopty(["sh", "-c", script])
+            filep.seek(0)
+            out = filep.read().decode().replace("\r\n", "\n")
+        self.assertEqual(status, 3)
+        self.assertEqual(out, "".join(output % i for i in (1, 2, 3)))
+        self.assertTrue(mock_fbind.finish.called)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+udocker unit tests: TokenCache
+"""
+
+import os
+import stat
+import tempfile
+from unittest import TestCase, main
+from unittest.mock import patch
+from udocker.helper.tokencache import TokenCache
+from udocker.config import Config
+import collections
+
+collections.Callable = collections.abc.Callable
+
+
+class TokenCacheTestCase(TestCase):
+    """Test TokenCache() registry bearer tokens cache."""
+
+    def setUp(self):
+        Config().getconf()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = self.tmpdir + "/tokencache"
+
+    def tearDown(self):
+        for filename in os.listdir(self.tmpdir):
+            os.remove(self.tmpdir + "/" + filename)
+        os.rmdir(self.tmpdir)
+
+    def test_01_init(self):
+        """Test01 TokenCache() constructor."""
+        tcache = TokenCache("filename")
+        self.assertEqual(tcache.cache_file, "filename")
+        self.assertEqual(tcache.tokens, {})
+
+    def test_02_key(self):
+        """Test02 TokenCache().key()."""
+        tcache = TokenCache()
+        key = tcache.key("realm", "service", "scope")
+        self.assertEqual(key, "realm|service|scope|")
+        key = tcache.key("realm", "service", "scope", "credential")
+        self.assertNotIn("credential", key)
+        self.assertNotEqual(key, tcache.key("realm", "service", "scope", "x"))
+
+    @patch('udocker.helper.tokencache.time.time')
+    def test_03_get_put(self, mock_time):
+        """Test03 TokenCache().get() and put()."""
+        mock_time.return_value = 1000
+        tcache = TokenCache()
+        self.assertEqual(tcache.get("key"), "")
+        self.assertTrue(tcache.put("key", "TOKEN", 300))
+        self.assertEqual(tcache.get("key"), "TOKEN")
+        mock_time.return_value = 1000 + 300 - tcache.expire_margin
+        self.assertEqual(tcache.get("key"), "")
+        self.assertFalse(tcache.put("key", "TOKEN", 5))
+        self.assertTrue(tcache.put("key", "TOKEN", None))
+        tcache.invalidate("key")
+        self.assertEqual(tcache.get("key"), "")
+
+    def test_04_file(self):
+        """Test04 TokenCache() persistence to file."""
+        tcache = TokenCache(self.cache_file)
+        tcache.put("key", "TOKEN", 300)
+        tcache.put_challenge("https://registry", "REALM", "SERVICE")
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_file).st_mode),
+                         0o600)
+        tcache = TokenCache(self.cache_file)
+        self.assertEqual(tcache.get("key"), "TOKEN")
+        self.assertEqual(tcache.get_challenge("https://registry"),
+                         {"realm": "REALM", "service": "SERVICE"})
+
+        os.chmod(self.cache_file, 0o644)
+        tcache = TokenCache(self.cache_file)
+        self.assertEqual(tcache.get("key"), "")
+        self.assertFalse(tcache._save())
+
+
+if __name__ == '__main__':
+    main()
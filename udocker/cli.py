@@ -16,12 +16,14 @@ from udocker.helper.keystore import KeyStore
 from udocker.helper.hostinfo import HostInfo
 from udocker.helper.unshare import Unshare
 from udocker.container.structure import ContainerStructure
+from udocker.container.repogc import RepositoryGC
 from udocker.engine.execmode import ExecutionMode
 from udocker.engine.nvidia import NvidiaMode
 from udocker.tools import UdockerTools
 from udocker.utils.fileutil import FileUtil
 from udocker.utils.filebind import FileBind
 from udocker.utils.mountpoint import MountPoint
+from udocker.utils.parallel import run_parallel
 
 # if Python 3
 if sys.version_info[0] >= 3:
@@ -544,19 +546,24 @@ class UdockerCLI(object):
         --index=https://index.docker.io/v1              :docker index
         --registry=https://registry-1.docker.io         :docker registry
         --platform=os/arch                              :docker platform
+        --parallel=N                                    :concurrent layers
 
         Examples:
           pull fedora:latest
           pull quay.io/something/somewhere:latest
+          pull --parallel=4 fedora:latest
         """
         index_url = cmdp.get("--index=")
         registry_url = cmdp.get("--registry=")
         http_proxy = cmdp.get("--httpproxy=")
         platform = cmdp.get("--platform=")
+        parallel = cmdp.get("--parallel=")
         (imagerepo, tag) = self._check_imagespec(cmdp.get("P1"))
         if (not imagerepo) or cmdp.missing_options():    # syntax error
             return self.STATUS_ERROR
 
+        if parallel:
+            self.dockerioapi.set_parallel_layers(parallel)
         self._set_repository(registry_url, index_url, imagerepo, http_proxy)
         v2_auth_token = self.keystore.get(self.dockerioapi.registry_url)
         self.dockerioapi.set_v2_login_token(v2_auth_token)
@@ -824,6 +831,7 @@ class UdockerCLI(object):
 
         self._get_run_options(cmdp, exec_engine)
         exit_status = exec_engine.run(container_id)
+        self.localrepo.clear_containers_index(container_id, "size")
         if delete and not self.localrepo.isprotected_container(container_id):
             self.localrepo.del_container(container_id)
 
@@ -835,44 +843,46 @@ class UdockerCLI(object):
         images [options]
         -l                         :long format
         -p                         :print platform
+        --reindex                  :rebuild the images and layers indexes
         """
         verbose = cmdp.get("-l")
         print_platform = cmdp.get("-p")
+        reindex = cmdp.get("--reindex")
         dummy = cmdp.get("--no-trunc")
         dummy = cmdp.get("--all")
         if cmdp.missing_options():               # syntax error
             return self.STATUS_ERROR
-        images_list = self.localrepo.get_imagerepos()
+        if reindex:
+            self.localrepo.reindex_images()
+            self.localrepo.rebuild_layer_refs()
+        images_list = self.localrepo.get_images_index()
         Msg().out("REPOSITORY", l=Msg.INF)
-        for (imagerepo, tag) in images_list:
-            prot = (".", "P")[
-                self.localrepo.isprotected_imagerepo(imagerepo, tag)]
-            imagerepo_dir = self.localrepo.cd_imagerepo(imagerepo, tag)
-
+        for (imagerepo, tag, entry) in images_list:
+            prot = (".", "P")[bool(entry["protected"])]
             if print_platform:
-                platform = self.localrepo.get_image_platform_fmt()
+                platform = entry["platform"]
                 Msg().out("%-18.18s %c %s" % (platform, prot, imagerepo + ":" + tag))
             else:
                 Msg().out("%s    %c" % (imagerepo + ":" + tag, prot))
 
             if verbose:
+                imagerepo_dir = (entry.get("reposdir",
+                                           self.localrepo.reposdir) +
+                                 "/" + imagerepo + "/" + tag)
                 Msg().out(" %s" % (imagerepo_dir))
-                layers_list = self.localrepo.get_layers(imagerepo, tag)
-                if layers_list:
-                    for (layer_name, size) in layers_list:
-                        file_size = size / (1024 * 1024)
-                        if not file_size and size:
-                            file_size = 1
-                        Msg().out("    %s (%d MB)" %
-                                  (layer_name.replace(imagerepo_dir, ""),
-                                   file_size))
+                for (layer_name, size) in entry["layers"]:
+                    file_size = size / (1024 * 1024)
+                    if not file_size and size:
+                        file_size = 1
+                    Msg().out("    /%s (%d MB)" % (layer_name, file_size))
         return self.STATUS_OK
 
     def do_ps(self, cmdp):
         """
         ps: list containers
         -m                         :print execution mode
-        -s                         :print size in MB
+        -s                         :print size in MB, the size is cached
+                                   :until the container is run or setup
         -p                         :print platform
         """
         print_mode = cmdp.get("-m")
@@ -894,23 +904,58 @@ class UdockerCLI(object):
         fmt = "%-36.36s %c %c " + mod_h + size_h + plat_h + "%-18s %-20.20s"
         Msg().out(fmt % ("CONTAINER ID", 'P', 'M', "NAMES", "IMAGE"))
         fmt = "%-36.36s %c %c " + mod_l + size_l + plat_l + "%-18.100s %-20.100s"
-        line = [''] * 8
         containers_list = self.localrepo.get_containers_list(False)
-        for (line[0], line[7], line[6]) in containers_list:
-            container_id = line[0]
-            exec_mode = ExecutionMode(self.localrepo, container_id)
-            line[3] = exec_mode.get_mode() if print_mode else ""
-            line[1] = ('.', 'P')[
-                self.localrepo.isprotected_container(container_id)]
-            line[2] = ('R', 'W', 'N', 'D')[
-                self.localrepo.iswriteable_container(container_id)]
-            line[4] = self.localrepo.get_size(container_id) if print_size else ""
-            platform = ContainerStructure(self.localrepo,
-                                          container_id).get_container_platform_fmt()
-            line[5] = platform if print_platform else ""
-            Msg().out(fmt % tuple(line))
+        containers_info = self._ps_info(
+            [container_id for (container_id, dummy, dummy)
+             in containers_list], print_mode, print_size, print_platform)
+        for (container_id, reponame, names) in containers_list:
+            info = containers_info[container_id]
+            Msg().out(fmt % (container_id, info["prot"], info["write"],
+                             info["mode"], info["size"], info["platform"],
+                             names, reponame))
         return self.STATUS_OK
 
+    def _ps_container_info(self, container_id, cached,
+                           print_mode, print_size, print_platform):
+        """Get the attributes of a container shown by ps, the platform
+        is taken from the containers index when cached
+        """
+        info = {"mode": "", "size": "", "platform": ""}
+        info["prot"] = ('.', 'P')[
+            self.localrepo.isprotected_container(container_id)]
+        info["write"] = ('R', 'W', 'N', 'D')[
+            self.localrepo.iswriteable_container(container_id)]
+        if print_mode:
+            info["mode"] = \
+                ExecutionMode(self.localrepo, container_id).get_mode()
+        if print_size:
+            info["size"] = self.localrepo.get_size(container_id)
+        if print_platform:
+            info["platform"] = cached.get("platform")
+            if info["platform"] is None:
+                info["platform"] = ContainerStructure(
+                    self.localrepo, container_id).get_container_platform_fmt()
+        return info
+
+    def _ps_info(self, container_ids, print_mode, print_size, print_platform):
+        """Get the attributes of the containers concurrently and save
+        newly computed platforms in the containers index
+        """
+        containers_index = self.localrepo.get_containers_index()
+        containers_info = run_parallel(
+            lambda container_id: self._ps_container_info(
+                container_id, containers_index.get(container_id, {}),
+                print_mode, print_size, print_platform),
+            container_ids, int(Config.conf['ps_workers']))
+        updates = {}
+        for (container_id, info) in containers_info.items():
+            cached = containers_index.get(container_id, {})
+            if info["platform"] and cached.get("platform") != info["platform"]:
+                updates[container_id] = {"platform": info["platform"]}
+        if updates:
+            self.localrepo.update_containers_index(updates)
+        return containers_info
+
     def do_rm(self, cmdp):
         """
         rm: delete a container
@@ -1218,6 +1263,52 @@ class UdockerCLI(object):
         Msg().err("Error: image verification failure")
         return self.STATUS_ERROR
 
+    def do_gc(self, cmdp):
+        """
+        gc: remove unused layers and leftover files from the repository
+        gc [options]
+        --dry-run                  :only report what would be removed
+        --age=<time>               :remove files older than time in seconds
+                                   :or with suffix m, h, d (default 1d)
+        --migrate                  :store layers by content digest
+        """
+        dry_run = cmdp.get("--dry-run")
+        age = cmdp.get("--age=")
+        migrate = cmdp.get("--migrate")
+        if cmdp.missing_options():               # syntax error
+            return self.STATUS_ERROR
+
+        if not age:
+            age = "1d"
+        try:
+            units = {"s": 1, "m": 60, "h": 3600, "d": 86400, }
+            if age[-1] in units:
+                age = int(age[:-1]) * units[age[-1]]
+            else:
+                age = int(age)
+        except (ValueError, IndexError):
+            Msg().err("Error: invalid age:", age)
+            return self.STATUS_ERROR
+
+        if migrate and not dry_run:
+            Msg().out("Info: layers moved to content addresses:",
+                      self.localrepo.migrate_layers(), l=Msg.INF)
+        (garbage, failed) = \
+            RepositoryGC(self.localrepo, age).collect(dry_run)
+        total_size = sum([size for (dummy, pathname, size) in garbage
+                          if pathname not in failed])
+        if dry_run:
+            Msg().out("Info: can be removed: %d entries (%d MB)" %
+                      (len(garbage), total_size / (1024 * 1024)))
+        else:
+            Msg().out("Info: removed: %d entries (%d MB)" %
+                      (len(garbage) - len(failed),
+                       total_size / (1024 * 1024)), l=Msg.INF)
+        if failed:
+            Msg().err("Error: removing:", " ".join(failed))
+            return self.STATUS_ERROR
+        return self.STATUS_OK
+
     def do_setup(self, cmdp):
         """
         setup: change container execution settings
@@ -1263,6 +1354,11 @@ class UdockerCLI(object):
             Msg().err("Error: container is protected")
             return self.STATUS_ERROR
 
+        if xmode or force or nvidia or purge or fixperm:
+            self.localrepo.clear_containers_index(container_id, "size")
+            ContainerStructure(self.localrepo,
+                               container_id).clear_container_platform()
+
         if purge:
             FileBind(self.localrepo, container_id).restore(force)
             MountPoint(self.localrepo, container_id).restore()
@@ -1396,6 +1492,8 @@ Commands:
 
   inspect -p <repo/image:tag>   :Print image or container metadata
   verify <repo/image:tag>       :Verify a pulled image
+  gc --dry-run --age=<time>     :Remove unused layers and leftover files
+  gc --migrate                  :Store image layers by content digest
   manifest inspect <repo/image:tag> :Print manifest metadata
 
   udocker manifest inspect centos/centos8
@@ -103,6 +103,8 @@ class CommonLocalFileApi(object):
             container_json["size"] = 0
         layer_chksum = ChkSUM().hash(layer_file, "sha256")
         if layer_chksum:
+            self.localrepo.set_layer_digest(layer_file, "sha256",
+                                            layer_chksum)
             container_json["rootfs"] = {}
             container_json["rootfs"]["type"] = "layers"
             container_json["rootfs"]["diff_ids"] = ["sha256:" + layer_chksum, ]
@@ -193,9 +195,9 @@ class CommonLocalFileApi(object):
             if not FileUtil(tarfile).copyto(layer_file):
                 Msg().err("Error: in move/copy file", tarfile)
                 return False
+        container_json = self.create_container_meta(layer_id, platform)
         self.localrepo.add_image_layer(layer_file)
         self.localrepo.save_json("ancestry", [layer_id])
-        container_json = self.create_container_meta(layer_id, platform)
         self.localrepo.save_json(json_file, container_json)
         self.localrepo.add_image_layer(json_file)
         Msg().out("Info: added layer", layer_id, l=Msg.INF)
@@ -26,6 +26,8 @@ class Config(object):
     conf['reposdir'] = None
     conf['layersdir'] = None
     conf['containersdir'] = None
+    conf['shared_reposdirs'] = ""       # read-only reposdirs, ":" separated
+    conf['shared_layersdirs'] = ""      # read-only layersdirs, ":" separated
 
     # udocker installation tarball the release is the minimum requirement
     # the actual tarball used in the installation can have a higher version
@@ -43,6 +45,8 @@ class Config(object):
     conf['autoinstall'] = True
     conf['config'] = "udocker.conf"
     conf['keystore'] = "keystore"
+    conf['tokencache'] = ""       # registry tokens file, empty to disable
+    conf['hostinfo_cache'] = ""   # host facts cache file, empty to disable
     conf['tmpdir'] = os.getenv("TMPDIR", "/tmp")    # for tmp files only
 
     # defaults for container execution
@@ -165,6 +169,15 @@ class Config(object):
     conf['http_agent'] = ""
     conf['http_insecure'] = False
     conf['use_curl_executable'] = ""  # force use of executable
+    conf['pull_parallel_layers'] = 1  # number of concurrent layer downloads
+    conf['untar_engine'] = "tar"  # layers extraction with "tar" or "python"
+    conf['layer_cache'] = ""      # cache extracted layers "copy" or "hardlink"
+    conf['rootfs_cache'] = ""     # cache image rootfs "copy" or "hardlink"
+    conf['rootfs_cache_size'] = 10240   # rootfs cache size budget in MB
+    conf['layer_store'] = "name"  # layer files by "name" or by "digest"
+    conf['ps_workers'] = 8        # concurrent container queries in ps
+    conf['size_workers'] = 1      # concurrent walkers for container sizes
+    conf['patchelf_workers'] = 0  # concurrent patchelf, 0 for number of cpus
 
     # docker hub index
     conf['dockerio_index_url'] = "https://hub.docker.com"
@@ -247,6 +260,11 @@ class Config(object):
             os.getenv("UDOCKER_LAYERS", Config.conf['layersdir'])
         Config.conf['containersdir'] = \
             os.getenv("UDOCKER_CONTAINERS", Config.conf['containersdir'])
+        Config.conf['shared_reposdirs'] = \
+            os.getenv("UDOCKER_SHARED_REPOS", Config.conf['shared_reposdirs'])
+        Config.conf['shared_layersdirs'] = \
+            os.getenv("UDOCKER_SHARED_LAYERS",
+                      Config.conf['shared_layersdirs'])
         Config.conf['dockerio_index_url'] = \
             os.getenv("UDOCKER_INDEX", Config.conf['dockerio_index_url'])
         Config.conf['dockerio_registry_url'] = \
@@ -263,9 +281,28 @@ class Config(object):
         Config.conf['tmpdir'] = os.getenv("UDOCKER_TMP", Config.conf['tmpdir'])
         Config.conf['keystore'] = \
             os.getenv("UDOCKER_KEYSTORE", Config.conf['keystore'])
+        Config.conf['tokencache'] = \
+            os.getenv("UDOCKER_TOKENCACHE", Config.conf['tokencache'])
+        Config.conf['hostinfo_cache'] = \
+            os.getenv("UDOCKER_HOSTINFO_CACHE", Config.conf['hostinfo_cache'])
         Config.conf['use_curl_executable'] = \
             os.getenv("UDOCKER_USE_CURL_EXECUTABLE",
                       Config.conf['use_curl_executable'])
+        Config.conf['untar_engine'] = \
+            os.getenv("UDOCKER_UNTAR_ENGINE", Config.conf['untar_engine'])
+        Config.conf['layer_cache'] = \
+            os.getenv("UDOCKER_LAYER_CACHE", Config.conf['layer_cache'])
+        Config.conf['layer_store'] = \
+            os.getenv("UDOCKER_LAYER_STORE", Config.conf['layer_store'])
+        Config.conf['rootfs_cache'] = \
+            os.getenv("UDOCKER_ROOTFS_CACHE", Config.conf['rootfs_cache'])
+        try:
+            Config.conf['rootfs_cache_size'] = \
+                int(os.getenv("UDOCKER_ROOTFS_CACHE_SIZE",
+                              Config.conf['rootfs_cache_size']))
+        except ValueError:
+            Msg().err("Warning: invalid UDOCKER_ROOTFS_CACHE_SIZE ignored",
+                      l=Msg.WAR)
         Config.conf['use_proot_executable'] = \
             os.getenv("UDOCKER_USE_PROOT_EXECUTABLE",
                       Config.conf['use_proot_executable'])
@@ -300,5 +337,6 @@ class Config(object):
         Values should be in the form x = y
         """
         ignore_keys = ["topdir", "homedir", "reposdir", "layersdir",
-                       "containersdir", "location", ]
+                       "containersdir", "shared_reposdirs",
+                       "shared_layersdirs", "location", ]
         self._file_override(user_cfile, ignore_keys)
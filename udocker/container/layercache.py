@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Cache of extracted image layers and image rootfs"""
+
+import os
+import hashlib
+import stat
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from udocker.config import Config
+from udocker.msg import Msg
+from udocker.utils.fileutil import FileUtil
+from udocker.utils.filelock import FileLock
+
+FICLONE = 0x40049409        # linux ioctl to clone a file with a reflink
+
+
+class LayerCache(object):
+    """Keep the extracted tree of each image layer in the repository
+    under layersdir/.layercache and assemble the ROOT of new containers
+    from these trees instead of extracting the layer tarballs again.
+    In "copy" mode files are cloned with reflinks where the filesystem
+    supports them and copied otherwise. In "hardlink" mode files are
+    shared with the cache, changes made to them inside a container
+    will also change the cached layer.
+    """
+
+    modes = ("copy", "hardlink", )
+
+    def __init__(self, localrepo, mode=None):
+        self.localrepo = localrepo
+        self.mode = Config.conf['layer_cache'] if mode is None else mode
+        self._reflink = fcntl is not None
+
+    def is_enabled(self):
+        """Is the layer cache enabled"""
+        return self.mode in self.modes
+
+    def get(self, tarf, extract):
+        """Get the directory with the extracted tree of a layer file,
+        the layer is extracted with extract([tarf, ], destdir) and
+        added to the cache on first use
+        """
+        cache_dir = self.localrepo.layer_cache_dir(tarf)
+        if not cache_dir:
+            return ""
+        if os.path.isdir(cache_dir):
+            if self.localrepo.is_layer_extracted(tarf):
+                return cache_dir
+            FileUtil(cache_dir).remove(recursive=True)
+        tmp_dir = cache_dir + ".%d" % os.getpid()
+        try:
+            if os.path.lexists(tmp_dir):
+                FileUtil(tmp_dir).remove(recursive=True)
+            os.makedirs(tmp_dir)
+        except (IOError, OSError):
+            Msg().err("Error: creating layer cache:", tmp_dir)
+            return ""
+        Msg().out("Info: adding to layer cache:", tarf, l=Msg.VER)
+        if not extract([tarf, ], tmp_dir):
+            FileUtil(tmp_dir).remove(recursive=True)
+            return ""
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except (IOError, OSError):
+            FileUtil(tmp_dir).remove(recursive=True)
+            if not os.path.isdir(cache_dir):
+                return ""
+        self.localrepo.set_layer_extracted(tarf)
+        return cache_dir
+
+    def _clone_file(self, source, target):
+        """Copy a file using a reflink when the filesystem allows it"""
+        if self._reflink:
+            try:
+                with open(source, "rb") as src, open(target, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except (IOError, OSError):
+                self._reflink = False
+        shutil.copyfile(source, target)
+
+    def _copy_file(self, source, target):
+        """Hardlink, clone or copy a file from the cache"""
+        if self.mode == "hardlink":
+            try:
+                os.link(source, target)
+                return
+            except (IOError, OSError):
+                pass
+        self._clone_file(source, target)
+        shutil.copystat(source, target)
+
+    def _remove(self, pathname):
+        """Remove an entry replaced by the upper layer"""
+        if os.path.isdir(pathname) and not os.path.islink(pathname):
+            FileUtil(pathname).remove(recursive=True)
+        else:
+            FileUtil(pathname).remove()
+
+    def _follow_dir_link(self, rootdir, pathname):
+        """Resolve a symbolic link to a directory within rootdir as
+        seen from inside the container, empty if it points elsewhere
+        """
+        real_root = os.path.realpath(rootdir)
+        real_path = FileUtil(rootdir).cont2host('/' + pathname)
+        if real_path.startswith(real_root + '/') and \
+                os.path.isdir(real_path):
+            return real_path
+        return ""
+
+    def _copy_tree(self, sourcedir, targetdir, rootdir, relpath, dirs):
+        """Merge a directory of the layer tree into targetdir"""
+        status = True
+        for name in os.listdir(sourcedir):
+            source = sourcedir + '/' + name
+            target = targetdir + '/' + name
+            pathname = relpath + name
+            try:
+                s_mode = os.lstat(source).st_mode
+                if stat.S_ISDIR(s_mode):
+                    if (dirs is not None and pathname not in dirs and
+                            os.path.islink(target)):
+                        real_target = self._follow_dir_link(rootdir,
+                                                            pathname)
+                        if real_target:
+                            if not self._copy_tree(source, real_target,
+                                                   rootdir, pathname + '/',
+                                                   dirs):
+                                status = False
+                            continue
+                    if os.path.lexists(target) and (
+                            os.path.islink(target) or
+                            not os.path.isdir(target)):
+                        self._remove(target)
+                    if not os.path.isdir(target):
+                        os.mkdir(target, 0o700)
+                    if not self._copy_tree(source, target, rootdir,
+                                           pathname + '/', dirs):
+                        status = False
+                    shutil.copystat(source, target)
+                    continue
+                if os.path.lexists(target):
+                    self._remove(target)
+                if stat.S_ISLNK(s_mode):
+                    os.symlink(os.readlink(source), target)
+                elif stat.S_ISREG(s_mode):
+                    self._copy_file(source, target)
+                elif stat.S_ISFIFO(s_mode):
+                    os.mkfifo(target, stat.S_IMODE(s_mode))
+            except (IOError, OSError) as error:
+                Msg().err("Error: copying from layer cache:", source,
+                          str(error), l=Msg.VER)
+                status = False
+        return status
+
+    def copy_tree(self, sourcedir, targetdir, dirs=None):
+        """Merge the extracted tree of a layer into a directory, entries
+        from the layer replace existing entries with the same name.
+        As with tar, a symbolic link to a directory inside targetdir
+        is followed unless the layer has its own entry for the directory
+        in dirs, without dirs every directory of the layer replaces it.
+        """
+        if dirs is not None:
+            dirs = set(dirs)
+        return self._copy_tree(sourcedir, targetdir, targetdir, "", dirs)
+
+
+class RootfsCache(LayerCache):
+    """Keep a snapshot of the flattened rootfs of each image under
+    layersdir/.rootfscache so that containers of the same image are
+    created by copying a single tree instead of replaying all layers.
+    Snapshots are keyed by the ordered list of layer files and evicted
+    by least recent use when the total size exceeds the budget.
+    The snapshot is always a copy or reflink of the first container
+    ROOT, the "hardlink" mode only applies to containers created from
+    the snapshot. Snapshots are locked shared while being copied and
+    exclusive while being removed.
+    """
+
+    def __init__(self, localrepo, mode=None, maxsize=None):
+        LayerCache.__init__(self, localrepo, Config.conf['rootfs_cache']
+                            if mode is None else mode)
+        if maxsize is None:
+            maxsize = int(Config.conf['rootfs_cache_size']) * 1024 * 1024
+        self.maxsize = maxsize
+        self.cachedir = localrepo.layersdir + "/.rootfscache"
+
+    def _key(self, tarfiles):
+        """Snapshot key from the ordered layer names and their stat"""
+        key = hashlib.sha256()
+        for tarf in tarfiles:
+            try:
+                fstat = os.stat(tarf)
+            except (IOError, OSError):
+                return ""
+            layer_name = os.path.basename(os.path.realpath(tarf))
+            key.update(("%s:%d:%d\n" % (layer_name, fstat.st_size,
+                                         int(fstat.st_mtime))).encode())
+        return key.hexdigest()
+
+    def _tree_size(self, directory):
+        """Total size of the files in a directory tree"""
+        size = 0
+        for (dirpath, dummy, filenames) in os.walk(directory):
+            for name in filenames:
+                try:
+                    size += os.lstat(dirpath + '/' + name).st_size
+                except (IOError, OSError):
+                    pass
+        return size
+
+    def get_rootfs(self, tarfiles):
+        """Get the snapshot ROOT of an image given its layer files"""
+        key = self._key(tarfiles)
+        if not key:
+            return ""
+        snapshot_dir = self.cachedir + '/' + key
+        snapshot_json = snapshot_dir + "/snapshot.json"
+        if not (os.path.isdir(snapshot_dir + "/ROOT") and
+                os.path.exists(snapshot_json)):
+            return ""
+        try:
+            os.utime(snapshot_json, None)
+        except (IOError, OSError):
+            pass
+        return snapshot_dir + "/ROOT"
+
+    def lock_rootfs(self, snapshot, shared=False):
+        """Lock the snapshot ROOT returned by get_rootfs()"""
+        key = os.path.basename(os.path.dirname(snapshot))
+        return FileLock(self.cachedir + "/.locks/" + key + ".lock", shared)
+
+    def put_rootfs(self, tarfiles, rootdir):
+        """Add the ROOT of a newly created container as the snapshot
+        of the image made of these layer files
+        """
+        key = self._key(tarfiles)
+        if not key:
+            return False
+        snapshot_dir = self.cachedir + '/' + key
+        if os.path.isdir(snapshot_dir):
+            return True
+        tmp_dir = snapshot_dir + ".%d" % os.getpid()
+        try:
+            if os.path.lexists(tmp_dir):
+                FileUtil(tmp_dir).remove(recursive=True)
+            os.makedirs(tmp_dir + "/ROOT")
+        except (IOError, OSError):
+            Msg().err("Error: creating rootfs cache:", tmp_dir)
+            return False
+        Msg().out("Info: adding to rootfs cache:", key, l=Msg.VER)
+        snapshot = {"layers": [os.path.basename(tarf) for tarf in tarfiles],
+                    "size": 0, }
+        if LayerCache(self.localrepo, "copy").copy_tree(rootdir,
+                                                       tmp_dir + "/ROOT"):
+            snapshot["size"] = self._tree_size(tmp_dir + "/ROOT")
+            if self.localrepo.save_json(tmp_dir + "/snapshot.json", snapshot):
+                try:
+                    os.rename(tmp_dir, snapshot_dir)
+                except (IOError, OSError):
+                    pass
+        if os.path.lexists(tmp_dir):
+            FileUtil(tmp_dir).remove(recursive=True)
+        self.evict()
+        return os.path.isdir(snapshot_dir)
+
+    def evict(self):
+        """Remove least recently used snapshots beyond the size budget"""
+        if not os.path.isdir(self.cachedir):
+            return
+        snapshots = []
+        total_size = 0
+        for key in os.listdir(self.cachedir):
+            if key.startswith("."):
+                continue
+            snapshot_json = self.cachedir + '/' + key + "/snapshot.json"
+            snapshot = self.localrepo.load_json(snapshot_json)
+            if not isinstance(snapshot, dict):
+                continue
+            try:
+                used = os.stat(snapshot_json).st_mtime
+            except (IOError, OSError):
+                continue
+            size = snapshot.get("size", 0)
+            total_size += size
+            snapshots.append((used, size, self.cachedir + '/' + key))
+        for (dummy, size, snapshot_dir) in sorted(snapshots):
+            if total_size <= self.maxsize:
+                break
+            Msg().out("Info: removing from rootfs cache:", snapshot_dir,
+                      l=Msg.VER)
+            with self.lock_rootfs(snapshot_dir + "/ROOT"):
+                if not os.path.isdir(snapshot_dir) or \
+                        FileUtil(snapshot_dir).remove(recursive=True):
+                    total_size -= size
@@ -13,6 +13,7 @@ from udocker.msg import Msg
 from udocker.helper.osinfo import OSInfo
 from udocker.utils.fileutil import FileUtil
 from udocker.utils.chksum import ChkSUM
+from udocker.utils.filelock import FileLock
 from udocker.utils.uprocess import Uprocess
 
 
@@ -32,6 +33,8 @@ class LocalRepository(object):
     5. lib:        contains python libraries
     """
 
+    digest_name_regex = re.compile(r"^(sha256|sha512):[0-9a-f]+$")
+
     def __init__(self, topdir=None):
         self.topdir = topdir if topdir else Config.conf['topdir']
         self.bindir = Config.conf['bindir']
@@ -55,9 +58,21 @@ class LocalRepository(object):
         if not self.containersdir:
             self.containersdir = self.topdir + "/containers"
 
+        self.shared_reposdirs = self._search_path(
+            Config.conf['shared_reposdirs'], self.reposdir)
+        self.shared_layersdirs = self._search_path(
+            Config.conf['shared_layersdirs'], self.layersdir)
+        if not self.shared_layersdirs:
+            self.shared_layersdirs = [
+                os.path.dirname(reposdir) + "/layers" for reposdir in
+                self.shared_reposdirs
+                if os.path.isdir(os.path.dirname(reposdir) + "/layers")]
+
         self.cur_repodir = ""
         self.cur_tagdir = ""
         self.cur_containerdir = ""
+        self._layer_meta = {}
+        self._indexes = {}
 
         FileUtil(self.reposdir).register_prefix()
         FileUtil(self.layersdir).register_prefix()
@@ -67,6 +82,26 @@ class LocalRepository(object):
         """change to a different localrepo"""
         self.__init__(topdir)
 
+    def _search_path(self, dirs, own_dir):
+        """Read-only directories from a ":" separated search path"""
+        if is_genstr(dirs):
+            dirs = dirs.split(":")
+        search_path = []
+        for directory in dirs or []:
+            directory = os.path.realpath(directory) if directory else ""
+            if (directory and directory not in search_path and
+                    directory != os.path.realpath(own_dir)):
+                search_path.append(directory)
+        return search_path
+
+    def is_shared(self, pathname):
+        """Is the file in one of the shared read-only repositories"""
+        pathname = os.path.realpath(pathname)
+        for directory in self.shared_reposdirs + self.shared_layersdirs:
+            if pathname.startswith(directory + '/'):
+                return True
+        return False
+
     def create_repo(self):
         """creates properties with pathnames for easy
         access to the several repository directories
@@ -153,15 +188,43 @@ class LocalRepository(object):
             return 1
         return 0
 
+    def _size_marker(self, container_root):
+        """Modification marker of a container ROOT made of its mtime,
+        the sum of the mtimes of its top level entries and their number,
+        deeper changes are only seen through the size being cleared by
+        run and setup
+        """
+        try:
+            marker = [int(os.stat(container_root).st_mtime * 1e9), 0, 0]
+            for name in os.listdir(container_root):
+                fstat = os.lstat(container_root + '/' + name)
+                mtime_ns = getattr(fstat, "st_mtime_ns",
+                                   int(fstat.st_mtime * 1e9))
+                marker[1] += mtime_ns
+                marker[2] += 1
+        except (IOError, OSError):
+            return []
+        return marker
+
     def get_size(self, container_id):
-        """See if a container root dir is writable by this user"""
+        """Get the disk usage in MB of a container ROOT, the size is
+        kept in the containers index until the container changes
+        """
         container_root = self.cd_container(container_id) + "/ROOT"
-        try:
-            size, dummy = Uprocess().get_output(["du", "-s", "-m", "-x",
-                                                 container_root]).split()
-            return int(size)
-        except (ValueError, NameError, AttributeError):
+        marker = self._size_marker(container_root)
+        if not marker:
+            return -1
+        entry = self.get_containers_index().get(container_id, {})
+        if "size" in entry and entry.get("size_marker") == marker:
+            return entry["size"]
+        usage = FileUtil(container_root).disk_usage(
+            int(Config.conf['size_workers']))
+        if usage < 0:
             return -1
+        size = (usage + 1024 * 1024 - 1) // (1024 * 1024)
+        self.update_containers_index({container_id: {"size": size,
+                                                     "size_marker": marker}})
+        return size
 
     def get_containers_list(self, dir_only=True):
         """Get a list of all containers in the local repo
@@ -176,6 +239,9 @@ class LocalRepository(object):
         for fname in os.listdir(self.containersdir):
             container_dir = self.containersdir + '/' + fname
             if os.path.isdir(container_dir):
+                if dir_only:
+                    containers_list.append(container_dir)
+                    continue
                 try:
                     filep = open(container_dir + "/imagerepo.name", 'r')
                 except (IOError, OSError):
@@ -183,9 +249,7 @@ class LocalRepository(object):
                 else:
                     reponame = filep.read()
                     filep.close()
-                if dir_only:
-                    containers_list.append(container_dir)
-                elif not os.path.islink(container_dir):
+                if not os.path.islink(container_dir):
                     names = self.get_container_name(fname)
                     if not names:
                         names = ""
@@ -207,24 +271,74 @@ class LocalRepository(object):
                                                stat.S_IXUSR)
             if FileUtil(container_dir).remove(recursive=True):
                 self.cur_containerdir = ""
+                self.clear_containers_index(container_id)
                 return True
 
         return False
 
     def cd_container(self, container_id):
         """Select a container directory for further operations"""
-        container_dir = self.containersdir + '/' + str(container_id)
-        if os.path.exists(container_dir):
-            if container_dir in self.get_containers_list(True):
-                return container_dir
+        container_id = str(container_id)
+        if (not container_id or '/' in container_id or
+                container_id in (".", "..")):
+            return ""
+        container_dir = self.containersdir + '/' + container_id
+        if os.path.isdir(container_dir):
+            return container_dir
         return ""
 
+    def _containers_index_file(self):
+        """File with the cached attributes of the containers"""
+        return self.containersdir + "/.containers.json"
+
+    def get_containers_index(self):
+        """Get the cached attributes of the containers such as the
+        platform and the size as {container_id: {name: value}}
+        """
+        containers_index = self._load_index(self._containers_index_file())
+        if containers_index is None:
+            return {}
+        return containers_index
+
+    def update_containers_index(self, updates):
+        """Add attributes {container_id: {name: value}} to the index"""
+        with self._lock_index(self._containers_index_file()):
+            containers_index = self._load_index(
+                self._containers_index_file())
+            if containers_index is None:
+                containers_index = {}
+            for (container_id, items) in updates.items():
+                containers_index.setdefault(container_id, {}).update(items)
+            return self._save_index(self._containers_index_file(),
+                                    containers_index)
+
+    def clear_containers_index(self, container_id, *names):
+        """Forget cached attributes of a container, all if no names"""
+        with self._lock_index(self._containers_index_file()):
+            containers_index = self._load_index(
+                self._containers_index_file())
+            if not (containers_index and container_id in containers_index):
+                return True
+            entry = containers_index[container_id]
+            if not names:
+                del containers_index[container_id]
+            elif [name for name in names if name in entry]:
+                for name in names:
+                    entry.pop(name, None)
+            else:
+                return True
+            return self._save_index(self._containers_index_file(),
+                                    containers_index)
+
     def _symlink(self, existing_file, link_file):
         """Create relative symbolic links"""
         if os.path.exists(link_file):
             return False
-        rel_path_to_existing = os.path.relpath(
-            existing_file, os.path.dirname(link_file))
+        if self.is_shared(existing_file):
+            rel_path_to_existing = os.path.realpath(existing_file)
+        else:
+            rel_path_to_existing = os.path.relpath(
+                existing_file, os.path.dirname(link_file))
         try:
             os.symlink(rel_path_to_existing, link_file)
         except (IOError, OSError):
@@ -314,23 +428,36 @@ class LocalRepository(object):
 
     def protect_imagerepo(self, imagerepo, tag):
         """Protect an image repo TAG against deletion"""
+        self._update_images_index(imagerepo, tag)
         return self._protect(self.reposdir + "/" + imagerepo + "/" + tag)
 
     def unprotect_imagerepo(self, imagerepo, tag):
         """Removes the deletion protection"""
+        self._update_images_index(imagerepo, tag)
         return self._unprotect(self.reposdir + "/" + imagerepo + "/" + tag)
 
     def isprotected_imagerepo(self, imagerepo, tag):
         """See if this image TAG is protected against deletion"""
-        return self._isprotected(self.reposdir + "/" + imagerepo + "/" + tag)
+        return self._isprotected(self._find_reposdir(imagerepo, tag) + "/" +
+                                 imagerepo + "/" + tag)
+
+    def _find_reposdir(self, imagerepo, tag):
+        """Find the reposdir holding an image TAG, the user reposdir
+        is searched first and then the shared reposdirs
+        """
+        for reposdir in [self.reposdir, ] + self.shared_reposdirs:
+            if self._is_tag(reposdir + "/" + imagerepo + "/" + tag):
+                return reposdir
+        return self.reposdir
 
     def cd_imagerepo(self, imagerepo, tag):
         """Select an image TAG for further operations"""
         if imagerepo and tag:
-            tag_dir = self.reposdir + "/" + imagerepo + "/" + tag
+            reposdir = self._find_reposdir(imagerepo, tag)
+            tag_dir = reposdir + "/" + imagerepo + "/" + tag
             if os.path.exists(tag_dir):
                 if self._is_tag(tag_dir):
-                    self.cur_repodir = self.reposdir + "/" + imagerepo
+                    self.cur_repodir = reposdir + "/" + imagerepo
                     self.cur_tagdir = self.cur_repodir + "/" + tag
                     return self.cur_tagdir
         return ""
@@ -352,7 +479,8 @@ class LocalRepository(object):
         for fname in os.listdir(src_tag_dir):
             filename = src_tag_dir + "/" + fname
             if os.path.islink(filename):
-                if not self.add_image_layer(os.path.realpath(filename)):
+                if not self.add_image_layer(os.path.realpath(filename),
+                                            fname):
                     return False
             elif fname == "TAG":
                 continue
@@ -378,6 +506,126 @@ class LocalRepository(object):
         """Check if a given file is in the repository"""
         return self._find(filename, self.reposdir)
 
+    def _lock_index(self, index_file):
+        """Lock to update an index file"""
+        return FileLock(index_file + ".lock")
+
+    def lock_layer(self, filename):
+        """Lock to download, store or remove a layer file"""
+        return FileLock(self.layersdir + "/.locks/" +
+                        os.path.basename(filename) + ".lock")
+
+    def lock_tag(self, imagerepo, tag, shared=False):
+        """Lock to pull or remove an image TAG, or shared to read it"""
+        name = (imagerepo + ':' + tag).replace('%', "%25").replace('/', "%2F")
+        return FileLock(self.reposdir + "/.locks/" + name + ".lock", shared)
+
+    def _layer_refs_file(self):
+        """File with the index of links from image TAGs to layers"""
+        return self.layersdir + "/.layerrefs.json"
+
+    def _scan_layer_refs(self):
+        """Build the layer references index by walking all TAGs"""
+        layer_refs = {}
+        for (dirpath, dirnames, filenames) in os.walk(self.reposdir):
+            for fname in dirnames + filenames:
+                f_path = dirpath + '/' + fname
+                if os.path.islink(f_path):
+                    layer_name = os.path.basename(os.path.realpath(f_path))
+                    layer_refs.setdefault(layer_name, []).append(
+                        f_path[len(self.reposdir) + 1:])
+        return layer_refs
+
+    def _load_index(self, index_file):
+        """Load a repository index file, kept in memory while unchanged"""
+        index_stat = self._layer_stat(index_file)
+        if not index_stat:
+            return None
+        cached = self._indexes.get(index_file)
+        if cached and cached[0] == index_stat:
+            return cached[1]
+        index = self.load_json(index_file)
+        if not isinstance(index, dict):
+            return None
+        self._indexes[index_file] = (index_stat, index)
+        return index
+
+    def _save_index(self, index_file, index):
+        """Write a repository index file"""
+        tmp_file = index_file + ".%d" % os.getpid()
+        self._indexes.pop(index_file, None)
+        if not (os.path.isdir(os.path.dirname(index_file)) and
+                self.save_json(tmp_file, index)):
+            FileUtil(tmp_file).remove()
+            return False
+        try:
+            os.rename(tmp_file, index_file)
+        except (IOError, OSError):
+            FileUtil(tmp_file).remove()
+            return False
+        self._indexes[index_file] = (self._layer_stat(index_file), index)
+        return True
+
+    def _load_layer_refs(self):
+        """Get the index of TAG links referencing each layer file.
+        The index is kept in layersdir/.layerrefs.json and is built
+        by walking the repository when missing.
+        """
+        layer_refs = self._load_index(self._layer_refs_file())
+        if layer_refs is None:
+            layer_refs = self._scan_layer_refs()
+            self._save_layer_refs(layer_refs)
+        return layer_refs
+
+    def _save_layer_refs(self, layer_refs):
+        """Write the layer references index"""
+        return self._save_index(self._layer_refs_file(), layer_refs)
+
+    def _add_layer_ref(self, layer_name, link_file):
+        """Record a TAG link referencing a layer file"""
+        with self._lock_index(self._layer_refs_file()):
+            layer_refs = self._load_layer_refs()
+            link_ref = link_file[len(self.reposdir) + 1:]
+            if link_ref not in layer_refs.get(layer_name, []):
+                layer_refs.setdefault(layer_name, []).append(link_ref)
+                self._save_layer_refs(layer_refs)
+
+    def _del_layer_ref(self, layer_name, link_file):
+        """Remove a TAG link from the index and return the number of
+        links still referencing the layer file
+        """
+        with self._lock_index(self._layer_refs_file()):
+            layer_refs = self._load_layer_refs()
+            link_ref = link_file[len(self.reposdir) + 1:]
+            refs = [ref for ref in layer_refs.get(layer_name, [])
+                    if ref != link_ref and
+                    os.path.islink(self.reposdir + '/' + ref)]
+            if refs:
+                layer_refs[layer_name] = refs
+            else:
+                layer_refs.pop(layer_name, None)
+            self._save_layer_refs(layer_refs)
+            return len(refs)
+
+    def rebuild_layer_refs(self, save=True):
+        """Rebuild the layer references index from the image TAGs"""
+        with self._lock_index(self._layer_refs_file()):
+            layer_refs = self._scan_layer_refs()
+            if save:
+                self._save_layer_refs(layer_refs)
+            return layer_refs
+
+    def is_layer_unused(self, layer_name):
+        """Is the layer file no longer linked from any TAG, to be
+        called holding lock_layer() before removing the layer
+        """
+        return not [ref for ref in self.get_layer_refs(layer_name)
+                    if os.path.islink(self.reposdir + '/' + ref)]
+
+    def get_layer_refs(self, layer_name):
+        """Get the TAG links referencing a layer file"""
+        return list(self._load_layer_refs().get(layer_name, []))
+
     def _remove_layers(self, tag_dir, force):
         """Remove link to image layer and corresponding layer
         if not being used by other images
@@ -385,48 +633,66 @@ class LocalRepository(object):
         for fname in os.listdir(tag_dir):
             f_path = tag_dir + '/' + fname  # link to layer
             if os.path.islink(f_path):
-                linkname = os.readlink(f_path)
-                layer_file = tag_dir + '/' + linkname
+                layer_file = os.path.realpath(f_path)
                 if not FileUtil(f_path).remove() and not force:
                     return False
-                if not self._inrepository(os.path.basename(linkname)):
-                    # removing actual layers not reference by other repos
-                    if not FileUtil(layer_file).remove() and not force:
-                        return False
+                with self.lock_layer(layer_file):
+                    if (not self._del_layer_ref(os.path.basename(layer_file),
+                                                f_path) and
+                            not self.is_shared(layer_file)):
+                        # removing actual layers not reference by other repos
+                        self._remove_layer_meta(layer_file)
+                        if not FileUtil(layer_file).remove() and not force:
+                            return False
         return True
 
     def del_imagerepo(self, imagerepo, tag, force=False):
         """Delete an image repository and its layers"""
-        tag_dir = self.cd_imagerepo(imagerepo, tag)
-        if (tag_dir and
-                self._remove_layers(tag_dir, force) and
-                FileUtil(tag_dir).remove(recursive=True)):
-            self.cur_repodir = ""
-            self.cur_tagdir = ""
-            while imagerepo:
-                FileUtil(self.reposdir + '/' + imagerepo).rmdir()
-                imagerepo = "/".join(imagerepo.split("/")[:-1])
-            return True
-        return False
+        with self.lock_tag(imagerepo, tag):
+            tag_dir = self.cd_imagerepo(imagerepo, tag)
+            if tag_dir and self.is_shared(tag_dir):
+                Msg().err("Error: image is in a shared repository:",
+                          imagerepo + ":" + tag)
+                return False
+            if not (tag_dir and
+                    self._remove_layers(tag_dir, force) and
+                    FileUtil(tag_dir).remove(recursive=True)):
+                return False
+        self.cur_repodir = ""
+        self.cur_tagdir = ""
+        self._update_images_index(imagerepo, tag, remove=True)
+        while imagerepo:
+            FileUtil(self.reposdir + '/' + imagerepo).rmdir()
+            imagerepo = "/".join(imagerepo.split("/")[:-1])
+        return True
 
-    def _get_tags(self, tag_dir):
+    def _get_tags(self, tag_dir, reposdir=None):
         """Get image tags from repository
         The tags identify actual usable containers
         """
+        if reposdir is None:
+            reposdir = self.reposdir
         tag_list = []
         if FileUtil(tag_dir).isdir():
             for fname in os.listdir(tag_dir):
                 f_path = tag_dir + '/' + fname
                 if self._is_tag(f_path):
                     tag_list.append(
-                        (tag_dir.replace(self.reposdir + '/', ""), fname))
+                        (tag_dir.replace(reposdir + '/', ""), fname))
                 elif os.path.isdir(f_path):
-                    tag_list.extend(self._get_tags(f_path))
+                    tag_list.extend(self._get_tags(f_path, reposdir))
         return tag_list
 
     def get_imagerepos(self):
-        """get all images repositories with tags"""
-        return self._get_tags(self.reposdir)
+        """get all images repositories with tags including the ones
+        from the shared reposdirs not present in the user reposdir
+        """
+        tag_list = self._get_tags(self.reposdir)
+        for reposdir in self.shared_reposdirs:
+            for image_tag in self._get_tags(reposdir, reposdir):
+                if image_tag not in tag_list:
+                    tag_list.append(image_tag)
+        return tag_list
 
     def get_layers(self, imagerepo, tag):
         """Get all layers for a given image image tag"""
@@ -440,21 +706,406 @@ class LocalRepository(object):
                     layers_list.append((filename, size))
         return layers_list
 
+    def _images_index_file(self):
+        """File with the index of image TAGs for fast listing"""
+        return self.reposdir + "/.images.json"
+
+    def _cur_tag(self):
+        """Image repository and TAG currently selected"""
+        if not (self.cur_tagdir and self.cur_repodir.startswith(
+                self.reposdir + '/')):
+            return (None, None)
+        return (self.cur_repodir[len(self.reposdir) + 1:],
+                os.path.basename(self.cur_tagdir))
+
+    def _image_index_entry(self, imagerepo, tag):
+        """Collect the attributes of an image TAG for the images index"""
+        (cur_repodir, cur_tagdir) = (self.cur_repodir, self.cur_tagdir)
+        entry = None
+        tag_dir = self.cd_imagerepo(imagerepo, tag)
+        if tag_dir:
+            entry = {
+                "protected": self._isprotected(tag_dir),
+                "platform": self.get_image_platform_fmt(),
+                "layers": [[os.path.basename(filename), size] for
+                           (filename, size) in
+                           self.get_layers(imagerepo, tag)],
+            }
+        (self.cur_repodir, self.cur_tagdir) = (cur_repodir, cur_tagdir)
+        return entry
+
+    def _update_images_index(self, imagerepo=None, tag=None, remove=False):
+        """Mark an image TAG as changed in the images index or remove
+        it, the entry is refreshed on the next listing
+        """
+        if not imagerepo:
+            (imagerepo, tag) = self._cur_tag()
+            if not imagerepo:
+                return
+        images_index = self._load_index(self._images_index_file())
+        if images_index is None or (
+                not remove and images_index.get(imagerepo, {}).get(
+                    tag, False) is None):
+            return
+        with self._lock_index(self._images_index_file()):
+            images_index = self._load_index(self._images_index_file())
+            if images_index is None:
+                return
+            tags = images_index.get(imagerepo, {})
+            if remove:
+                if tag not in tags:
+                    return
+                del tags[tag]
+                if not tags:
+                    del images_index[imagerepo]
+            else:
+                images_index.setdefault(imagerepo, {})[tag] = None
+            self._save_index(self._images_index_file(), images_index)
+
+    def reindex_images(self):
+        """Rebuild the images index by walking the repository"""
+        with self._lock_index(self._images_index_file()):
+            images_index = {}
+            for (imagerepo, tag) in self._get_tags(self.reposdir):
+                entry = self._image_index_entry(imagerepo, tag)
+                if entry:
+                    images_index.setdefault(imagerepo, {})[tag] = entry
+            self._save_index(self._images_index_file(), images_index)
+            return images_index
+
+    def _refresh_images_index(self):
+        """Refresh the changed entries of the images index"""
+        with self._lock_index(self._images_index_file()):
+            images_index = self._load_index(self._images_index_file())
+            if images_index is None:
+                return self.reindex_images()
+            for (imagerepo, tags) in list(images_index.items()):
+                for (tag, entry) in list(tags.items()):
+                    if entry is not None:
+                        continue
+                    entry = self._image_index_entry(imagerepo, tag)
+                    if entry:
+                        tags[tag] = entry
+                    else:
+                        del tags[tag]
+                if not tags:
+                    del images_index[imagerepo]
+            self._save_index(self._images_index_file(), images_index)
+            return images_index
+
+    def _shared_images_index(self, reposdir):
+        """Images index of a shared reposdir, read from its index file
+        when up to date or otherwise collected from its image TAGs
+        """
+        images_index = self._load_index(reposdir + "/.images.json")
+        if images_index is not None and not [
+                tag for tags in images_index.values()
+                for (tag, entry) in tags.items() if entry is None]:
+            return images_index
+        images_index = {}
+        for (imagerepo, tag) in self._get_tags(reposdir, reposdir):
+            entry = self._image_index_entry(imagerepo, tag)
+            if entry:
+                images_index.setdefault(imagerepo, {})[tag] = entry
+        return images_index
+
+    def get_images_index(self):
+        """Get the list of (imagerepo, tag, entry) of all image TAGs
+        from the images index, entry has the protection status, the
+        platform and the list of layer names and sizes, entries from
+        a shared reposdir also have its pathname in reposdir
+        """
+        images_index = self._load_index(self._images_index_file())
+        if images_index is None or [
+                tag for tags in images_index.values()
+                for (tag, entry) in tags.items() if entry is None]:
+            images_index = self._refresh_images_index()
+        images = dict(((imagerepo, tag), entry)
+                      for (imagerepo, tags) in images_index.items()
+                      for (tag, entry) in tags.items())
+        for reposdir in self.shared_reposdirs:
+            for (imagerepo, tags) in \
+                    self._shared_images_index(reposdir).items():
+                for (tag, entry) in tags.items():
+                    if (imagerepo, tag) not in images:
+                        images[(imagerepo, tag)] = dict(entry,
+                                                        reposdir=reposdir)
+        return [(imagerepo, tag, images[(imagerepo, tag)])
+                for (imagerepo, tag) in sorted(images)]
+
+    def find_shared_layer(self, layer_id):
+        """Find a verified layer file sha256:<hex> in the shared
+        layersdirs, that can be linked instead of downloaded
+        """
+        match = re.match(r"^(\w+):(\w+)$", layer_id)
+        if not match:
+            return ""
+        (algorithm, digest) = (match.group(1), match.group(2))
+        for layersdir in self.shared_layersdirs:
+            layer_file = layersdir + '/' + layer_id
+            if not os.path.isfile(layer_file):
+                continue
+            if (self.get_layer_digest(layer_file, algorithm) == digest or
+                    ChkSUM().hash(layer_file, algorithm) == digest):
+                return os.path.realpath(layer_file)
+        return ""
+
+    def _layer_stat(self, filename):
+        """Identify the content of a layer file by its stat"""
+        try:
+            fstat = os.stat(filename)
+        except (IOError, OSError):
+            return None
+        mtime_ns = getattr(fstat, "st_mtime_ns", int(fstat.st_mtime * 1e9))
+        return (fstat.st_size, mtime_ns, fstat.st_ino)
+
+    def _layer_meta_file(self, layer_file):
+        """Sidecar file keeping the metadata of a file in layersdir
+        or in one of the shared layersdirs
+        """
+        layer_dir = os.path.dirname(layer_file)
+        if layer_dir == os.path.realpath(self.layersdir):
+            layer_dir = self.layersdir
+        elif layer_dir not in self.shared_layersdirs:
+            return ""
+        return (layer_dir + "/.layermeta/" +
+                os.path.basename(layer_file) + ".json")
+
+    def _save_layer_meta(self, layer_file, layer_meta):
+        """Write the metadata sidecar file of a layer"""
+        meta_file = self._layer_meta_file(layer_file)
+        if not meta_file or self.is_shared(meta_file):
+            return False
+        meta_dir = os.path.dirname(meta_file)
+        tmp_file = meta_file + ".%d" % os.getpid()
+        try:
+            if not os.path.isdir(meta_dir):
+                os.makedirs(meta_dir)
+        except (IOError, OSError):
+            return False
+        if not self.save_json(tmp_file, layer_meta):
+            FileUtil(tmp_file).remove()
+            return False
+        try:
+            os.rename(tmp_file, meta_file)
+        except (IOError, OSError):
+            FileUtil(tmp_file).remove()
+            return False
+        return True
+
+    def _load_layer_meta(self, layer_file):
+        """Metadata of a layer file, empty if the file has changed"""
+        layer_stat = self._layer_stat(layer_file)
+        if not layer_stat:
+            return {}
+        layer_meta = self._layer_meta.get(layer_file)
+        if layer_meta is None:
+            meta_file = self._layer_meta_file(layer_file)
+            if meta_file and os.path.exists(meta_file):
+                layer_meta = self.load_json(meta_file)
+            if not isinstance(layer_meta, dict):
+                layer_meta = {}
+            self._layer_meta[layer_file] = layer_meta
+        if layer_meta.get("stat") != list(layer_stat):
+            return {}
+        return layer_meta
+
+    def _update_layer_meta(self, filename, **items):
+        """Add items to the metadata of a layer file, the metadata is
+        kept in memory and in a sidecar file under layersdir/.layermeta
+        """
+        layer_stat = self._layer_stat(filename)
+        if not layer_stat:
+            return False
+        layer_file = os.path.realpath(filename)
+        layer_meta = dict(self._load_layer_meta(layer_file))
+        layer_meta["stat"] = list(layer_stat)
+        layer_meta.update(items)
+        if self._layer_meta.get(layer_file) != layer_meta:
+            self._layer_meta[layer_file] = layer_meta
+            self._save_layer_meta(layer_file, layer_meta)
+        return True
+
+    def _remove_layer_meta(self, layer_file):
+        """Remove the metadata sidecar file, the aliases and the
+        extracted tree of a removed layer
+        """
+        layer_file = os.path.realpath(layer_file)
+        for alias in self._load_layer_meta(layer_file).get("aliases", []):
+            alias_file = self.layersdir + '/' + alias
+            if os.path.islink(alias_file):
+                FileUtil(alias_file).remove()
+        self._layer_meta.pop(layer_file, None)
+        meta_file = self._layer_meta_file(layer_file)
+        if meta_file:
+            FileUtil(meta_file).remove()
+        cache_dir = self.layer_cache_dir(layer_file)
+        if cache_dir and os.path.lexists(cache_dir):
+            FileUtil(cache_dir).remove(recursive=True)
+
+    def set_layer_digest(self, filename, algorithm, digest):
+        """Record the verified digest of a layer file"""
+        return self._update_layer_meta(filename, algorithm=algorithm,
+                                       digest=digest)
+
+    def get_layer_digest(self, filename, algorithm):
+        """Get the recorded digest of a layer file if unchanged"""
+        layer_meta = self._load_layer_meta(os.path.realpath(filename))
+        if layer_meta.get("algorithm") != algorithm:
+            return ""
+        return layer_meta.get("digest", "")
+
+    def _list_layer_entries(self, filename):
+        """List the whiteout entries and the directory entries in a
+        layer tar file, the whole table of contents is listed as tar
+        fails when a member pattern is not found, returns None if tar
+        fails
+        """
+        entries = Uprocess().get_output(["tar", "tf", filename])
+        if entries is None:
+            return None
+        whiteouts = []
+        dirs = []
+        for entry in entries.split('\n'):
+            entry = entry.strip()
+            if os.path.basename(entry).startswith(".wh."):
+                whiteouts.append(entry)
+            elif entry.endswith('/'):
+                dirname = os.path.normpath(entry).lstrip('/')
+                if dirname != '.':
+                    dirs.append(dirname)
+        return {"whiteouts": whiteouts, "dirs": dirs}
+
+    def _get_layer_entries(self, filename, kind):
+        """Get a list of entries of a layer tar file. The lists are
+        computed once and kept in the layer metadata, returns None
+        if the layer cannot be listed.
+        """
+        layer_meta = self._load_layer_meta(os.path.realpath(filename))
+        if kind in layer_meta:
+            return layer_meta[kind]
+        entries = self._list_layer_entries(filename)
+        if entries is None:
+            Msg().err("Warning: cannot list layer:", filename, l=Msg.WAR)
+            return None
+        self._update_layer_meta(filename, **entries)
+        return entries[kind]
+
+    def get_layer_whiteouts(self, filename):
+        """Get the whiteout entries of a layer tar file"""
+        return self._get_layer_entries(filename, "whiteouts") or []
+
+    def get_layer_dirs(self, filename):
+        """Get the directories that have their own entry in a layer
+        tar file, None if unknown
+        """
+        return self._get_layer_entries(filename, "dirs")
+
+    def layer_cache_dir(self, filename):
+        """Directory keeping the extracted tree of a layer file"""
+        layer_file = os.path.realpath(filename)
+        if os.path.dirname(layer_file) != os.path.realpath(self.layersdir):
+            return ""
+        return self.layersdir + "/.layercache/" + os.path.basename(layer_file)
+
+    def set_layer_extracted(self, filename):
+        """Record that the layer extracted tree is complete"""
+        return self._update_layer_meta(filename, extracted=True)
+
+    def is_layer_extracted(self, filename):
+        """Is there a complete extracted tree of this layer file"""
+        layer_meta = self._load_layer_meta(os.path.realpath(filename))
+        return bool(layer_meta.get("extracted"))
+
+    def _store_layer(self, filename):
+        """Move a file in layersdir to its content address sha256:<hex>.
+        Identical files share the same content address, the original
+        name is kept as an alias symbolic link to the stored file.
+        Returns the pathname of the stored file.
+        """
+        layer_file = os.path.realpath(filename)
+        if (os.path.dirname(layer_file) != os.path.realpath(self.layersdir)
+                or self.digest_name_regex.match(os.path.basename(layer_file))
+                or not os.path.isfile(layer_file)):
+            return layer_file
+        digest = self.get_layer_digest(layer_file, "sha256")
+        if not digest:
+            digest = ChkSUM().sha256(layer_file)
+        if not digest:
+            return layer_file
+        stored_file = self.layersdir + "/sha256:" + digest
+        alias = os.path.basename(layer_file)
+        layer_meta = self._load_layer_meta(os.path.realpath(stored_file))
+        try:
+            if os.path.isfile(stored_file):
+                os.remove(layer_file)
+                Msg().out("Info: layer already stored:", alias, l=Msg.VER)
+            else:
+                os.rename(layer_file, stored_file)
+            os.symlink(os.path.basename(stored_file), layer_file)
+        except (IOError, OSError):
+            Msg().err("Error: storing layer:", alias)
+            return filename
+        meta_file = self._layer_meta_file(layer_file)
+        if meta_file:
+            FileUtil(meta_file).remove()
+        self._layer_meta.pop(layer_file, None)
+        aliases = layer_meta.get("aliases", [])
+        if alias not in aliases:
+            aliases = aliases + [alias, ]
+        self._update_layer_meta(stored_file, algorithm="sha256",
+                                digest=digest, aliases=aliases)
+        return os.path.realpath(stored_file)
+
+    def migrate_layers(self):
+        """Move all layer files to their content addresses and point
+        the image TAG links to the stored files keeping their names.
+        Returns the number of files moved.
+        """
+        count = 0
+        for fname in os.listdir(self.layersdir):
+            f_path = self.layersdir + '/' + fname
+            if (fname.startswith(".") or os.path.islink(f_path) or
+                    not os.path.isfile(f_path) or
+                    self.digest_name_regex.match(fname)):
+                continue
+            if os.path.basename(self._store_layer(f_path)) != fname:
+                count += 1
+        for (dirpath, dummy, filenames) in os.walk(self.reposdir):
+            for fname in filenames:
+                f_path = dirpath + '/' + fname
+                layer_file = os.path.realpath(f_path)
+                if not (os.path.islink(f_path) and
+                        os.path.basename(os.readlink(f_path)) !=
+                        os.path.basename(layer_file) and
+                        os.path.dirname(layer_file) ==
+                        os.path.realpath(self.layersdir)):
+                    continue
+                FileUtil(f_path).remove()
+                self._symlink(layer_file, f_path)
+        self.rebuild_layer_refs()
+        return count
+
     def add_image_layer(self, filename, linkname=None):
         """Add a layer to an image TAG"""
         if not self.cur_tagdir:
             return False
-        if not os.path.exists(filename):
-            return False
         if not os.path.exists(self.cur_tagdir):
             return False
         if linkname:
             linkname = self.cur_tagdir + '/' + os.path.basename(linkname)
         else:
             linkname = self.cur_tagdir + '/' + os.path.basename(filename)
-        if os.path.islink(linkname):
-            FileUtil(linkname).remove()
-        self._symlink(filename, linkname)
+        with self.lock_layer(filename):
+            if not os.path.exists(filename):
+                return False
+            if Config.conf['layer_store'] == "digest":
+                filename = self._store_layer(filename)
+            if os.path.islink(linkname):
+                FileUtil(linkname).remove()
+            self._symlink(filename, linkname)
+            self._add_layer_ref(os.path.basename(filename), linkname)
+        self._update_images_index()
         return True
 
     def setup_imagerepo(self, imagerepo):
@@ -487,6 +1138,7 @@ class LocalRepository(object):
             return False
         out_tag.write(self.cur_repodir + ":" + tag)
         out_tag.close()
+        self._update_images_index()
         return True
 
     def set_version(self, version):
@@ -516,6 +1168,7 @@ class LocalRepository(object):
             open(directory + "/" + version, 'a').close()
         except (IOError, OSError):
             return False
+        self._update_images_index()
         return True
 
     def _get_image_attributes_v1(self, directory):
@@ -622,6 +1275,7 @@ class LocalRepository(object):
             if not os.path.exists(self.cur_tagdir):
                 return False
             out_filename = self.cur_tagdir + "/" + filename
+            self._update_images_index()
         outfile = None
         try:
             outfile = open(out_filename, 'w')
@@ -751,8 +1405,10 @@ class LocalRepository(object):
 
         return ("", layer_id)
 
-    def _verify_layer_file(self, structure, layer_id):
-        """Verify layer file in repository"""
+    def _verify_layer_file(self, structure, layer_id, layer_f_chksum=None):
+        """Verify layer file in repository, the checksum may have been
+        previously computed with _hash_layer_files()
+        """
         (layer_algorithm, layer_hash) = self._split_layer_id(layer_id)
         layer_f = structure["repolayers"][layer_id]["layer_f"]
         if not (os.path.exists(layer_f) and
@@ -764,18 +1420,52 @@ class LocalRepository(object):
                               os.readlink(layer_f)):
             Msg().err("Error: layer data file not found")
             return False
+        if (layer_algorithm and
+                self.get_layer_digest(layer_f, layer_algorithm) == layer_hash):
+            return True
         (dummy, filetype) = OSInfo('/').get_filetype(layer_f)
         if "gzip" in filetype:
             if not FileUtil(layer_f).verify_tar():
                 Msg().err("Error: layer tar verify failed:", layer_f)
                 return False
         if layer_algorithm:
-            layer_f_chksum = ChkSUM().hash(layer_f, layer_algorithm)
+            if layer_f_chksum is None:
+                layer_f_chksum = ChkSUM().hash(layer_f, layer_algorithm)
             if layer_f_chksum and layer_f_chksum != layer_hash:
                 Msg().err("Error: layer file chksum failed:", layer_f)
                 return False
+            if layer_f_chksum:
+                self.set_layer_digest(layer_f, layer_algorithm, layer_hash)
         return True
 
+    def _hash_layer_files(self, structure):
+        """Concurrently hash the layer files that have no recorded
+        digest, returns a dictionary of checksums by layer id
+        """
+        by_algorithm = {}
+        for layer_id in structure["repolayers"]:
+            (layer_algorithm, layer_hash) = self._split_layer_id(layer_id)
+            if not layer_algorithm:
+                continue
+            try:
+                layer_f = structure["repolayers"][layer_id]["layer_f"]
+            except KeyError:
+                continue
+            if (os.path.exists(layer_f) and
+                    self.get_layer_digest(layer_f, layer_algorithm) !=
+                    layer_hash):
+                by_algorithm.setdefault(layer_algorithm, {})[layer_id] = \
+                    layer_f
+        layer_chksums = {}
+        for (layer_algorithm, layers) in by_algorithm.items():
+            if len(layers) < 2:
+                continue
+            file_chksums = ChkSUM().hash_many(list(layers.values()),
+                                              layer_algorithm)
+            for (layer_id, layer_f) in layers.items():
+                layer_chksums[layer_id] = file_chksums[layer_f]
+        return layer_chksums
+
     def _verify_image_v1(self, structure):
         """Verify the structure of a v1 image repository"""
         Msg().out("Info: finding top layer id", l=Msg.INF)
@@ -829,6 +1519,7 @@ class LocalRepository(object):
             return False
         Msg().out("Info: verifying layers", l=Msg.INF)
         status = True
+        layer_chksums = self._hash_layer_files(structure)
         if "ancestry" in structure and "has_json_f" in structure:
             status = self._verify_image_v1(structure)
         elif "manifest" in structure:
@@ -845,7 +1536,8 @@ class LocalRepository(object):
                           layer_id)
                 status = False
                 continue
-            layer_status = self._verify_layer_file(structure, layer_id)
+            layer_status = self._verify_layer_file(
+                structure, layer_id, layer_chksums.get(layer_id))
             if not layer_status:
                 status = False
                 continue
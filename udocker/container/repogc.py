@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""Garbage collection of the local repository"""
+
+import os
+import re
+import time
+
+from udocker.msg import Msg
+from udocker.utils.fileutil import FileUtil
+from udocker.utils.parallel import run_parallel
+from udocker.container.layercache import RootfsCache
+
+class RepositoryGC(object):
+    """Find and remove what is no longer needed in a local repository:
+    layer files not referenced by any image TAG and their aliases, the
+    metadata, cached trees and rootfs snapshots of removed layers,
+    temporary files of interrupted downloads or writes, unfinished
+    container clones and lock files no longer in use.
+    Layers, temporary files, locks and containers are only removed when
+    older than age seconds so that ongoing pulls and clones are not
+    affected.
+    """
+
+    workers = 4
+    tmp_regex = re.compile(r"\.(tmp|[0-9]+)$")
+
+    def __init__(self, localrepo, age=86400):
+        self.localrepo = localrepo
+        self.age = age
+        self.now = time.time()
+
+    def _is_old(self, pathname):
+        """Is the file older than the age threshold"""
+        try:
+            return os.lstat(pathname).st_mtime < self.now - self.age
+        except (IOError, OSError):
+            return False
+
+    def _size(self, pathname):
+        """Size of a file or directory tree"""
+        size = 0
+        try:
+            if os.path.islink(pathname) or not os.path.isdir(pathname):
+                return os.lstat(pathname).st_size
+            for (dirpath, dummy, filenames) in os.walk(pathname):
+                for name in filenames:
+                    size += os.lstat(dirpath + '/' + name).st_size
+        except (IOError, OSError):
+            pass
+        return size
+
+    def _listdir(self, directory):
+        """List a directory that may not exist"""
+        try:
+            return os.listdir(directory)
+        except (IOError, OSError):
+            return []
+
+    def _layers_garbage(self, layer_refs):
+        """Unreferenced layer files and temporary files in layersdir,
+        returns the garbage and the names of the live layer files
+        """
+        layersdir = self.localrepo.layersdir
+        garbage = []
+        live = set()
+        aliases = []
+        for name in self._listdir(layersdir):
+            pathname = layersdir + '/' + name
+            if self.tmp_regex.search(name):
+                if self._is_old(pathname):
+                    garbage.append(("tmp", pathname))
+                continue
+            if os.path.islink(pathname):
+                aliases.append(name)
+                continue
+            if name.startswith(".") or os.path.isdir(pathname):
+                continue
+            if name in layer_refs or not self._is_old(pathname):
+                live.add(name)
+            else:
+                garbage.append(("layer", pathname))
+        for name in aliases:
+            pathname = layersdir + '/' + name
+            if os.path.basename(os.path.realpath(pathname)) in live:
+                live.add(name)
+            else:
+                garbage.append(("alias", pathname))
+        return (garbage, live)
+
+    def _derived_garbage(self, live):
+        """Metadata, extracted trees and rootfs snapshots depending on
+        layer files that no longer exist or are being removed, and the
+        digests directory replaced by .layermeta
+        """
+        layersdir = self.localrepo.layersdir
+        garbage = []
+        for (subdir, kind) in ((".layermeta", "meta"),
+                               (".layercache", "cache")):
+            for name in self._listdir(layersdir + '/' + subdir):
+                pathname = layersdir + '/' + subdir + '/' + name
+                layer_name = name
+                if kind == "meta" and name.endswith(".json"):
+                    layer_name = name[:-len(".json")]
+                if self.tmp_regex.search(name):
+                    if self._is_old(pathname):
+                        garbage.append(("tmp", pathname))
+                elif layer_name not in live:
+                    garbage.append((kind, pathname))
+        if os.path.isdir(layersdir + "/.digests"):
+            garbage.append(("obsolete", layersdir + "/.digests"))
+        rootfsdir = layersdir + "/.rootfscache"
+        for name in self._listdir(rootfsdir):
+            pathname = rootfsdir + '/' + name
+            if name.startswith("."):
+                continue
+            if self.tmp_regex.search(name):
+                if self._is_old(pathname):
+                    garbage.append(("tmp", pathname))
+                continue
+            snapshot = self.localrepo.load_json(pathname + "/snapshot.json")
+            if not (isinstance(snapshot, dict) and
+                    set(snapshot.get("layers", [])) <= live):
+                garbage.append(("rootfs", pathname))
+        return garbage
+
+    def _containers_garbage(self):
+        """Unfinished clones and container names of removed containers"""
+        containersdir = self.localrepo.containersdir
+        garbage = []
+        for name in self._listdir(containersdir):
+            pathname = containersdir + '/' + name
+            if os.path.islink(pathname):
+                if not os.path.exists(pathname):
+                    garbage.append(("name", pathname))
+                continue
+            reponame = FileUtil(pathname + "/imagerepo.name").getdata('r')
+            if (reponame == "CLONING:inprogress" and
+                    not os.path.exists(pathname + "/PROTECT") and
+                    self._is_old(pathname + "/imagerepo.name")):
+                garbage.append(("container", pathname))
+        return garbage
+
+    def _index_tmp_garbage(self):
+        """Temporary files of interrupted index writes"""
+        garbage = []
+        for directory in (self.localrepo.reposdir,
+                          self.localrepo.containersdir):
+            for name in self._listdir(directory):
+                pathname = directory + '/' + name
+                if (name.startswith(".") and self.tmp_regex.search(name)
+                        and self._is_old(pathname)):
+                    garbage.append(("tmp", pathname))
+        return garbage
+
+    def _locks_garbage(self):
+        """Lock files not used for longer than age"""
+        garbage = []
+        for locksdir in (self.localrepo.layersdir + "/.locks",
+                         self.localrepo.layersdir + "/.rootfscache/.locks",
+                         self.localrepo.reposdir + "/.locks"):
+            for name in self._listdir(locksdir):
+                pathname = locksdir + '/' + name
+                if self._is_old(pathname):
+                    garbage.append(("lock", pathname))
+        return garbage
+
+    def find_garbage(self, save_refs=True):
+        """Mark the layers referenced from all image TAGs and list the
+        garbage as (kind, pathname) tuples
+        """
+        layer_refs = self.localrepo.rebuild_layer_refs(save_refs)
+        (garbage, live) = self._layers_garbage(layer_refs)
+        garbage.extend(self._derived_garbage(live))
+        garbage.extend(self._containers_garbage())
+        garbage.extend(self._index_tmp_garbage())
+        garbage.extend(self._locks_garbage())
+        return garbage
+
+    def _remove(self, pathname):
+        """Remove a file or directory tree"""
+        if os.path.isdir(pathname) and not os.path.islink(pathname):
+            return FileUtil(pathname).remove(recursive=True)
+        return FileUtil(pathname).remove()
+
+    def _layer_name(self, kind, pathname):
+        """Name of the layer file a garbage entry depends on"""
+        name = os.path.basename(pathname)
+        if kind == "alias":
+            return os.path.basename(os.path.realpath(pathname))
+        if kind == "meta" and name.endswith(".json"):
+            return name[:-len(".json")]
+        return name
+
+    def _sweep_entry(self, kind, pathname):
+        """Remove one garbage entry holding the lock of the layer or
+        snapshot, a layer linked meanwhile by a pull is kept
+        """
+        if kind in ("layer", "alias", "meta", "cache"):
+            layer_name = self._layer_name(kind, pathname)
+            with self.localrepo.lock_layer(layer_name):
+                if not self.localrepo.is_layer_unused(layer_name):
+                    return True
+                return self._remove(pathname)
+        if kind == "rootfs":
+            with RootfsCache(self.localrepo).lock_rootfs(pathname + "/ROOT"):
+                return self._remove(pathname)
+        return self._remove(pathname)
+
+    def sweep(self, garbage, workers=None):
+        """Remove the garbage concurrently, returns the list of
+        pathnames that could not be removed
+        """
+        if not workers:
+            workers = self.workers
+        results = run_parallel(lambda entry: self._sweep_entry(*entry),
+                               garbage, workers)
+        return [pathname for (kind, pathname) in results
+                if not results[(kind, pathname)]]
+
+    def collect(self, dry_run=False):
+        """Find and remove the garbage, returns the garbage found with
+        the size of each entry and the pathnames that failed removal
+        """
+        garbage = [(kind, pathname, self._size(pathname))
+                   for (kind, pathname) in self.find_garbage(not dry_run)]
+        for (kind, pathname, size) in garbage:
+            Msg().out("Info: %s %s (%d bytes)" % (kind, pathname, size),
+                      l=Msg.INF)
+        if dry_run:
+            return (garbage, [])
+        failed = self.sweep([(kind, pathname)
+                             for (kind, pathname, dummy) in garbage])
+        return (garbage, failed)
@@ -8,8 +8,10 @@ from udocker.config import Config
 from udocker.msg import Msg
 from udocker.helper.unique import Unique
 from udocker.helper.hostinfo import HostInfo
+from udocker.helper.osinfo import OSInfo
 from udocker.utils.fileutil import FileUtil
-from udocker.utils.uprocess import Uprocess
+from udocker.utils.layertar import LayerExtractor
+from udocker.container.layercache import LayerCache, RootfsCache
 
 
 class ContainerStructure(object):
@@ -44,9 +46,8 @@ class ContainerStructure(object):
 
         return (container_dir, container_json)
 
-    def get_container_platform_fmt(self):
-        """Get the container platform from the metadata"""
-        (dummy, container_json) = self.get_container_attr()
+    def _platform_fmt(self, container_json):
+        """Format the container platform from the metadata"""
         if not container_json:
             return "unknown/unknown"
         try:
@@ -65,6 +66,59 @@ class ContainerStructure(object):
             return "%s/%s" % (p_os, p_architecture)
         return "%s/%s/%s" % (p_os, p_architecture, p_variant)
 
+    def save_container_platform(self, container_dir=None):
+        """Detect the platform and the architecture of the container
+        and keep them in the container directory, the architecture
+        of a container only changes if its ROOT is modified by setup
+        """
+        if container_dir is None:
+            container_dir = self.localrepo.cd_container(self.container_id)
+        if not container_dir:
+            return {}
+        container_json = \
+            self.localrepo.load_json(container_dir + "/container.json")
+        platform = {"platform": self._platform_fmt(container_json)}
+        osinfo = OSInfo(container_dir + "/ROOT")
+        for target in ("UDOCKER", "qemu"):
+            platform[target] = osinfo.arch(target)
+        if not self.localrepo.save_json(container_dir + "/platform.json",
+                                        platform):
+            Msg().out("Debug: cannot save container platform:",
+                      container_dir, l=Msg.DBG)
+        return platform
+
+    def get_container_platform(self, container_dir=None):
+        """Get the platform and the architecture of the container
+        saved in the container directory, detected on first use
+        """
+        if container_dir is None:
+            container_dir = self.localrepo.cd_container(self.container_id)
+        if not container_dir:
+            return {}
+        platform = self.localrepo.load_json(container_dir + "/platform.json")
+        if isinstance(platform, dict) and "platform" in platform:
+            return platform
+        return self.save_container_platform(container_dir)
+
+    def clear_container_platform(self):
+        """Forget the platform and architecture saved for the container"""
+        container_dir = self.localrepo.cd_container(self.container_id)
+        if not container_dir or \
+                not os.path.exists(container_dir + "/platform.json"):
+            return True
+        return FileUtil(container_dir + "/platform.json").remove()
+
+    def get_container_arch(self, target="UDOCKER", container_dir=None):
+        """Get the container architecture for UDOCKER or qemu"""
+        return self.get_container_platform(container_dir).get(target, "")
+
+    def get_container_platform_fmt(self):
+        """Get the container platform from the metadata"""
+        if Config.conf['location']:
+            return "unknown/unknown"
+        platform = self.get_container_platform()
+        return platform.get("platform", "unknown/unknown")
+
     def _get_container_meta(self, param, default, cntjson):
         """Get the metadata configuration from the container"""
         cidx = ""
@@ -146,33 +200,39 @@ class ContainerStructure(object):
         """
         self.imagerepo = imagerepo
         self.tag = tag
-        image_dir = self.localrepo.cd_imagerepo(self.imagerepo, self.tag)
-        if not image_dir:
-            Msg().err("Error: create container: imagerepo is invalid")
-            return False
-
-        (container_json, layer_files) = self.localrepo.get_image_attributes()
-        if not container_json:
-            Msg().err("Error: create container: getting layers or json")
-            return False
+        with self.localrepo.lock_tag(self.imagerepo, self.tag, shared=True):
+            image_dir = self.localrepo.cd_imagerepo(self.imagerepo, self.tag)
+            if not image_dir:
+                Msg().err("Error: create container: imagerepo is invalid")
+                return False
+
+            (container_json, layer_files) = \
+                self.localrepo.get_image_attributes()
+            if not container_json:
+                Msg().err("Error: create container: getting layers or json")
+                return False
 
-        if not self.container_id:
-            self.container_id = Unique().uuid(os.path.basename(self.imagerepo))
+            if not self.container_id:
+                self.container_id = \
+                    Unique().uuid(os.path.basename(self.imagerepo))
 
-        container_dir = self.localrepo.setup_container(
-            self.imagerepo, self.tag, self.container_id)
-        if not container_dir:
-            Msg().err("Error: create container: setting up container")
-            return False
+            container_dir = self.localrepo.setup_container(
+                self.imagerepo, self.tag, self.container_id)
+            if not container_dir:
+                Msg().err("Error: create container: setting up container")
+                return False
 
-        self.localrepo.save_json(
-            container_dir + "/container.json", container_json)
-        status = self._untar_layers(layer_files, container_dir + "/ROOT")
+            self.localrepo.save_json(
+                container_dir + "/container.json", container_json)
+            status = self._assemble_layers(layer_files,
+                                           container_dir + "/ROOT")
         if not status:
             Msg().err("Error: creating container:", self.container_id)
         elif not self._chk_container_root():
             Msg().out("Warning: check container content:", self.container_id,
                       l=Msg.WAR)
+        if status:
+            self.save_container_platform(container_dir)
 
         return self.container_id
 
@@ -202,6 +262,8 @@ class ContainerStructure(object):
         elif not self._chk_container_root():
             Msg().out("Warning: check container content:", self.container_id,
                       l=Msg.WAR)
+        if status:
+            self.save_container_platform(container_dir)
 
         return self.container_id
 
@@ -224,6 +286,8 @@ class ContainerStructure(object):
         elif not self._chk_container_root():
             Msg().out("Warning: check container content:", self.container_id,
                       l=Msg.WAR)
+        if status:
+            self.save_container_platform(container_dir)
 
         return self.container_id
 
@@ -232,18 +296,11 @@ class ContainerStructure(object):
         to identify files or directories to be removed.
         The format is .wh.<filename>
         """
-        verbose = ""
-        if Msg.level >= Msg.VER:
-            verbose = 'v'
-            Msg().out("Info: applying whiteouts:", tarf, l=Msg.INF)
-        wildcards = ["--wildcards", ]
-        if not HostInfo().cmd_has_option("tar", wildcards[0]):
-            wildcards = []
-        cmd = ["tar", "t" + verbose] + wildcards + ["-f", tarf, r"*/.wh.*"]
-        whiteouts = Uprocess().get_output(cmd, True)
+        Msg().out("Info: applying whiteouts:", tarf, l=Msg.VER)
+        whiteouts = self.localrepo.get_layer_whiteouts(tarf)
         if not whiteouts:
             return
-        for wh_filename in whiteouts.split('\n'):
+        for wh_filename in whiteouts:
             if wh_filename:
                 wh_basename = os.path.basename(wh_filename.strip())
                 wh_dirname = os.path.dirname(wh_filename)
@@ -261,7 +318,83 @@ class ContainerStructure(object):
                     FileUtil(rm_filename).remove(recursive=True)
         return
 
+    def _assemble_layers(self, tarfiles, destdir):
+        """Create the container ROOT from image layers, when the rootfs
+        cache is enabled the ROOT is copied from a snapshot of the
+        image taken when the first container was created
+        """
+        rootfscache = RootfsCache(self.localrepo)
+        if not rootfscache.is_enabled():
+            return self._assemble_from_layers(tarfiles, destdir)
+        snapshot = rootfscache.get_rootfs(tarfiles)
+        if snapshot:
+            with rootfscache.lock_rootfs(snapshot, shared=True):
+                if os.path.isdir(snapshot):
+                    Msg().out("Info: copying from rootfs cache:", snapshot,
+                              l=Msg.VER)
+                    if not rootfscache.copy_tree(snapshot, destdir):
+                        Msg().err("Error: while copying image rootfs")
+                        return False
+                    return True
+        status = self._assemble_from_layers(tarfiles, destdir)
+        if status:
+            rootfscache.put_rootfs(tarfiles, destdir)
+        return status
+
+    def _assemble_from_layers(self, tarfiles, destdir):
+        """Create the container ROOT from image layers, when the layer
+        cache is enabled the layers are extracted once into the cache
+        and the cached trees are copied into the ROOT
+        """
+        layercache = LayerCache(self.localrepo)
+        if not layercache.is_enabled():
+            return self._untar_layers(tarfiles, destdir)
+        if not (tarfiles and destdir):
+            return False
+        status = True
+        for tarf in tarfiles:
+            cache_dir = layercache.get(tarf, self._untar_layers)
+            if not cache_dir:
+                if not self._untar_layers([tarf, ], destdir):
+                    status = False
+                continue
+            self._apply_whiteouts(tarf, destdir)
+            Msg().out("Info: copying from layer cache:", tarf, l=Msg.VER)
+            if not layercache.copy_tree(
+                    cache_dir, destdir, self.localrepo.get_layer_dirs(tarf)):
+                Msg().err("Error: while copying image layer")
+                status = False
+        return status
+
     def _untar_layers(self, tarfiles, destdir):
+        """Untar all container layers with the selected engine, either
+        the tar executable or the python tarfile based extractor.
+        """
+        if not (tarfiles and destdir):
+            return False
+        if Config.conf['untar_engine'] == "python":
+            return self._untar_layers_python(tarfiles, destdir)
+        return self._untar_layers_tar(tarfiles, destdir)
+
+    def _untar_layers_python(self, tarfiles, destdir):
+        """Untar all container layers in a single pass per layer.
+        Whiteouts and permissions are handled during extraction.
+        Layers not readable by tarfile are passed to the tar executable.
+        """
+        status = True
+        extractor = LayerExtractor(destdir)
+        for tarf in tarfiles:
+            if not extractor.is_supported(tarf):
+                if not self._untar_layers_tar([tarf, ], destdir):
+                    status = False
+                continue
+            Msg().out("Info: extracting:", tarf, l=Msg.VER)
+            if not extractor.extract(tarf):
+                Msg().err("Error: while extracting image layer")
+                status = False
+        return status
+
+    def _untar_layers_tar(self, tarfiles, destdir):
         """Untar all container layers. Each layer is extracted
         and permissions are changed to avoid file permission
         issues when extracting the next layer.
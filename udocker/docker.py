@@ -6,6 +6,8 @@ import sys
 import re
 import base64
 import json
+import copy
+import threading
 
 from udocker.config import Config
 from udocker.msg import Msg
@@ -14,7 +16,10 @@ from udocker.helper.unique import Unique
 from udocker.utils.fileutil import FileUtil
 from udocker.utils.curl import GetURL
 from udocker.utils.chksum import ChkSUM
+from udocker.utils.parallel import run_parallel
 from udocker.helper.hostinfo import HostInfo
+from udocker.helper.tokencache import TokenCache
+
 
 
 class DockerIoAPI(object):
@@ -33,6 +38,22 @@ class DockerIoAPI(object):
         self.search_pause = True
         self.search_page = 0
         self.search_ended = False
+        self.parallel_layers = 1
+        self.set_parallel_layers(Config.conf['pull_parallel_layers'])
+        self.tokencache = TokenCache(self._tokencache_file())
+
+    def _tokencache_file(self):
+        """Pathname of the token cache file, placed next to the keystore"""
+        tokencache = Config.conf['tokencache']
+        if not tokencache or tokencache.startswith("/"):
+            return tokencache
+        keystore = Config.conf['keystore']
+        if not keystore.startswith("/"):
+            try:
+                keystore = self.localrepo.homedir + "/" + keystore
+            except (AttributeError, TypeError):
+                return ""
+        return os.path.dirname(keystore) + "/" + tokencache
 
     def set_proxy(self, http_proxy):
         """Select a socks http proxy for API access and file download"""
@@ -46,6 +67,13 @@ class DockerIoAPI(object):
         """Change docker index url"""
         self.index_url = index_url
 
+    def set_parallel_layers(self, parallel_layers):
+        """Number of layers to be downloaded concurrently"""
+        try:
+            self.parallel_layers = max(1, int(parallel_layers))
+        except (ValueError, TypeError):
+            self.parallel_layers = 1
+
     # ARCHNEW
     def is_repo_name(self, imagerepo):
         """Check if name matches authorized characters for a docker repo"""
@@ -69,6 +97,10 @@ class DockerIoAPI(object):
         url = str(args[0])
         if "RETRY" not in kwargs:
             kwargs["RETRY"] = 3
+            auth_header = self._get_v2_cached_auth(url)
+            if auth_header and not [hdr for hdr in kwargs.get("header", [])
+                                    if hdr.startswith("Authorization:")]:
+                kwargs["header"] = kwargs.get("header", []) + [auth_header]
         if "FOLLOW" not in kwargs:
             kwargs["FOLLOW"] = 3
         kwargs["RETRY"] -= 1
@@ -100,16 +132,18 @@ class DockerIoAPI(object):
                 if 'error="insufficient_scope"' in www_authenticate:
                     return (hdr, buf)
                 auth_header = ""
+                sent_header = [hdr for hdr in auth_kwargs.get("header", [])
+                               if hdr.startswith("Authorization:")]
                 if "/v2/" in url:
-                    auth_header = self._get_v2_auth(www_authenticate,
-                                                    kwargs["RETRY"])
+                    auth_header = self._get_v2_auth(
+                        www_authenticate, kwargs["RETRY"],
+                        sent_header[-1] if sent_header else "")
                 if "/v1/" in url:
                     auth_header = self._get_v1_auth(www_authenticate)
                 # OCI and multiplatform, prevent removal of header attributes
-                try:
-                    auth_kwargs["header"].append(auth_header)
-                except KeyError:
-                    auth_kwargs.update({"header": [auth_header]})
+                auth_kwargs["header"] = \
+                    [hdr for hdr in auth_kwargs.get("header", [])
+                     if hdr not in sent_header] + [auth_header]
         (hdr, buf) = self._get_url(*args, **auth_kwargs)
         return (hdr, buf)
 
@@ -120,9 +154,14 @@ class DockerIoAPI(object):
         same to avoid downloaded it again.
         """
         match = re.search("/([^/:]+):(\\S+)$", filename)
+        (algorithm, digest) = ("", "")
         if match:
-            layer_f_chksum = ChkSUM().hash(filename, match.group(1))
-            if layer_f_chksum == match.group(2):
+            (algorithm, digest) = (match.group(1), match.group(2))
+            if self.localrepo.get_layer_digest(filename, algorithm) == digest:
+                return True             # is cached skip download
+            layer_f_chksum = ChkSUM().hash(filename, algorithm)
+            if layer_f_chksum == digest:
+                self.localrepo.set_layer_digest(filename, algorithm, digest)
                 return True             # is cached skip download
             cache_mode = 0
         if self.curl.cache_support and cache_mode:
@@ -135,12 +174,22 @@ class DockerIoAPI(object):
                 return True             # is cached skip download
         else:
             remote_size = -1
+        if os.path.islink(filename):
+            FileUtil(filename).remove()     # never write to a stored layer
         resume = False
         if filename.endswith("layer"):
             resume = True
-        (hdr, dummy) = self._get_url(url, ofile=filename, resume=resume)
+        (hdr, dummy) = self._get_url(url, ofile=filename, resume=resume,
+                                     digest=algorithm)
         if self.curl.get_status_code(hdr.data["X-ND-HTTPSTATUS"]) != 200:
             return False
+        if digest and "X-ND-DIGEST" in hdr.data:
+            if hdr.data["X-ND-DIGEST"] != algorithm + ":" + digest:
+                Msg().err("Error: digest mismatch:", filename,
+                          hdr.data["X-ND-DIGEST"])
+                FileUtil(filename).remove()
+                return False
+            self.localrepo.set_layer_digest(filename, algorithm, digest)
         if remote_size == -1:
             remote_size = self.curl.get_content_length(hdr)
         if (remote_size != FileUtil(filename).size() and
@@ -250,9 +299,9 @@ class DockerIoAPI(object):
         url = endpoint + "/v1/images/" + layer_id + "/json"
         Msg().out("Debug: json url", url, l=Msg.DBG)
         filename = self.localrepo.layersdir + '/' + layer_id + ".json"
-        if self._get_file(url, filename, 0):
-            self.localrepo.add_image_layer(filename)
-            return True
+        with self.localrepo.lock_layer(filename):
+            if self._get_file(url, filename, 0):
+                return self.localrepo.add_image_layer(filename)
         return False
 
     def get_v1_image_layer(self, endpoint, layer_id):
@@ -260,9 +309,9 @@ class DockerIoAPI(object):
         url = endpoint + "/v1/images/" + layer_id + "/layer"
         Msg().out("Debug: layer url", url, l=Msg.DBG)
         filename = self.localrepo.layersdir + '/' + layer_id + ".layer"
-        if self._get_file(url, filename, 3):
-            self.localrepo.add_image_layer(filename)
-            return True
+        with self.localrepo.lock_layer(filename):
+            if self._get_file(url, filename, 3):
+                return self.localrepo.add_image_layer(filename)
         return False
 
     def get_v1_layers_all(self, endpoint, layer_list):
@@ -281,13 +330,44 @@ class DockerIoAPI(object):
                 files.append(layer_id + ".layer")
         return files
 
-    def _get_v2_auth(self, www_authenticate, retry):
+    def _get_v2_cached_auth(self, url):
+        """Cached bearer token for a manifest, blob or tags request
+        to the current registry, to be sent before being challenged
+        """
+        if not url.startswith(self.registry_url + "/v2/"):
+            return ""
+        match = re.search("/v2/(.+)/(manifests|blobs|tags)/", url)
+        if not match:
+            return ""
+        challenge = self.tokencache.get_challenge(self.registry_url)
+        if not challenge:
+            return ""
+        token_key = self.tokencache.key(
+            challenge["realm"], challenge["service"],
+            "repository:%s:pull" % match.group(1), self.v2_auth_token)
+        auth_token = self.tokencache.get(token_key)
+        if not auth_token:
+            return ""
+        return "Authorization: Bearer " + auth_token
+
+    def _get_v2_auth(self, www_authenticate, retry, sent_header=""):
         """Authentication for v2 API"""
         auth_header = ""
         (bearer, auth_data) = www_authenticate.rsplit(' ', 1)
         if bearer == "Bearer":
             auth_fields = self._split_fields(auth_data)
             if "realm" in auth_fields:
+                token_key = self.tokencache.key(
+                    auth_fields["realm"], auth_fields.get("service", ""),
+                    auth_fields.get("scope", ""), self.v2_auth_token)
+                auth_token = self.tokencache.get(token_key)
+                if auth_token:
+                    auth_header = "Authorization: Bearer " + auth_token
+                    if auth_header != sent_header:
+                        self.v2_auth_header = auth_header
+                        return auth_header
+                    self.tokencache.invalidate(token_key)
+                    auth_header = ""
                 auth_url = auth_fields["realm"] + '?'
                 for (field, value) in auth_fields.items():
                     if field != "realm":
@@ -307,6 +387,12 @@ class DockerIoAPI(object):
                     auth_header = "Authorization: Bearer " + \
                         auth_token["token"]
                     self.v2_auth_header = auth_header
+                    self.tokencache.put(token_key, auth_token["token"],
+                                        auth_token.get("expires_in"))
+                    if auth_fields.get("scope", "").startswith("repository:"):
+                        self.tokencache.put_challenge(
+                            self.registry_url, auth_fields["realm"],
+                            auth_fields.get("service", ""))
         # PR #126
         elif 'BASIC' in bearer or 'Basic' in bearer:
             auth_header = "Authorization: Basic %s" % self.v2_auth_token
@@ -438,20 +524,90 @@ class DockerIoAPI(object):
             pass
         return (hdr.data, {})
 
-    def get_v2_image_layer(self, imagerepo, layer_id):
-        """Get one image layer data file (tarball)"""
+    def _get_v2_image_layer_file(self, imagerepo, layer_id):
+        """Download one image layer data file without linking it"""
         url = self.registry_url + "/v2/" + imagerepo + \
             "/blobs/" + layer_id
         Msg().out("Debug: layer url", url, l=Msg.DBG)
+        shared_file = self.localrepo.find_shared_layer(layer_id)
+        if shared_file:
+            Msg().out("Info: using shared layer", layer_id, l=Msg.VER)
+            return shared_file
         filename = self.localrepo.layersdir + '/' + layer_id
         if self._get_file(url, filename, 3):
-            self.localrepo.add_image_layer(filename)
-            return True
-        return False
+            if Config.conf['untar_engine'] == "tar":
+                self.localrepo.get_layer_whiteouts(filename)
+            return filename
+        return ""
+
+    def get_v2_image_layer(self, imagerepo, layer_id):
+        """Get one image layer data file (tarball) and add it to the
+        image TAG, the layer stays locked until it is linked so that
+        a concurrent rmi or gc cannot remove it meanwhile
+        """
+        with self.localrepo.lock_layer(layer_id):
+            filename = self._get_v2_image_layer_file(imagerepo, layer_id)
+            if not filename:
+                return False
+            if not self.localrepo.add_image_layer(filename):
+                Msg().err("Error: adding layer to image:", layer_id)
+                return False
+        return True
+
+    def _clone(self):
+        """Copy of this object with its own GetURL so that it can be
+        used by a download thread without sharing curl state
+        """
+        dockerioapi = copy.copy(self)
+        dockerioapi.curl = GetURL()
+        dockerioapi.curl.set_insecure(self.curl.insecure)
+        if self.curl.http_proxy:
+            dockerioapi.curl.set_proxy(self.curl.http_proxy)
+        return dockerioapi
+
+    def _get_v2_layers_parallel(self, imagerepo, blobs):
+        """Download layer files using several threads, the layers are
+        then added to the image TAG sequentially in manifest order.
+        The layers are locked in name order before the downloads and
+        released once linked.
+        """
+        locks = [self.localrepo.lock_layer(blob)
+                 for blob in sorted(set(blobs))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            return self._get_v2_layers_locked(imagerepo, blobs)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _get_v2_layers_locked(self, imagerepo, blobs):
+        """Download the locked layer files in parallel and link them,
+        each download thread uses its own copy of this object
+        """
+        thread_data = threading.local()
+
+        def _download(blob):
+            """Get a layer file with the copy of the current thread"""
+            if not hasattr(thread_data, "dockerioapi"):
+                thread_data.dockerioapi = self._clone()
+            Msg().out("Info: downloading layer", blob, l=Msg.INF)
+            return thread_data.dockerioapi._get_v2_image_layer_file(
+                imagerepo, blob)
+
+        downloaded = run_parallel(_download, blobs, self.parallel_layers)
+        for blob in blobs:
+            if not downloaded.get(blob):
+                Msg().err("Error: downloading layer", blob)
+                return []
+            if not self.localrepo.add_image_layer(downloaded[blob]):
+                Msg().err("Error: adding layer to image:", blob)
+                return []
+        return blobs
 
     def get_v2_layers_all(self, imagerepo, fslayers):
         """Get all layer data files belonging to a image tag"""
-        files = []
+        blobs = []
         blob = ""
         if fslayers:
             for layer in reversed(fslayers):
@@ -459,10 +615,15 @@ class DockerIoAPI(object):
                     blob = layer["blobSum"]
                 elif "digest" in layer:
                     blob = layer["digest"]
-                Msg().out("Info: downloading layer", blob, l=Msg.INF)
-                if not self.get_v2_image_layer(imagerepo, blob):
-                    return []
-                files.append(blob)
+                blobs.append(blob)
+        if self.parallel_layers > 1 and len(blobs) > 1:
+            return self._get_v2_layers_parallel(imagerepo, blobs)
+        files = []
+        for blob in blobs:
+            Msg().out("Info: downloading layer", blob, l=Msg.INF)
+            if not self.get_v2_image_layer(imagerepo, blob):
+                return []
+            files.append(blob)
         return files
 
     def get_v2(self, imagerepo, tag, platform=""):
@@ -599,19 +760,21 @@ class DockerIoAPI(object):
         """Pull a docker image from a v2 registry or v1 index"""
         Msg().out("Debug: get imagerepo: %s tag: %s" % (imagerepo, tag), l=Msg.DBG)
         (imagerepo, remoterepo) = self._parse_imagerepo(imagerepo)
-        if self.localrepo.cd_imagerepo(imagerepo, tag):
-            new_repo = False
-        else:
-            self.localrepo.setup_imagerepo(imagerepo)
-            new_repo = True
-        if self.is_v2():
-            if not platform:
-                platform = HostInfo().platform()
-            files = self.get_v2(remoterepo, tag, platform)  # try v2
-        else:
-            files = self.get_v1(remoterepo, tag)  # try v1
-        if new_repo and not files:
-            self.localrepo.del_imagerepo(imagerepo, tag, False)
+        with self.localrepo.lock_tag(imagerepo, tag):
+            tag_dir = self.localrepo.cd_imagerepo(imagerepo, tag)
+            if tag_dir and not self.localrepo.is_shared(tag_dir):
+                new_repo = False
+            else:
+                self.localrepo.setup_imagerepo(imagerepo)
+                new_repo = True
+            if self.is_v2():
+                if not platform:
+                    platform = HostInfo().platform()
+                files = self.get_v2(remoterepo, tag, platform)  # try v2
+            else:
+                files = self.get_v1(remoterepo, tag)  # try v1
+            if new_repo and not files:
+                self.localrepo.del_imagerepo(imagerepo, tag, False)
         return files
 
     def get_manifest(self, imagerepo, tag, platform=""):
@@ -664,12 +664,20 @@ class ExecutionEngineCommon(object):
             pass
         return False
 
+    def _get_container_arch(self, target="UDOCKER"):
+        """Get the container architecture saved in the container dir"""
+        if self.container_dir and not Config.conf['location']:
+            return ContainerStructure(self.localrepo, self.container_id). \
+                get_container_arch(target, self.container_dir)
+        return OSInfo(self.container_root).arch(target)
+
     def _check_arch(self, fail=False):
         """Check if architecture is the same"""
-        same_arch = OSInfo(self.container_root).is_same_arch()
-        if same_arch is None:
+        container_arch = self._get_container_arch()
+        host_arch = OSInfo("/").arch()
+        if not (container_arch and host_arch):
             return True
-        if not same_arch:
+        if container_arch != host_arch:
             if fail:
                 Msg().err("Error: host and container architectures mismatch")
                 return False
@@ -679,7 +687,7 @@ class ExecutionEngineCommon(object):
 
     def _get_qemu(self, return_path=False):
         """Get the qemu binary name if emulation needed"""
-        container_qemu_arch = OSInfo(self.container_root).arch("qemu")
+        container_qemu_arch = self._get_container_arch("qemu")
         host_qemu_arch = HostInfo().arch("qemu")
         if not (container_qemu_arch and host_qemu_arch):
             return ""
@@ -85,12 +85,14 @@ class ExecutionMode(object):
                 status = True
             elif force or prev_xmode in ("F2", "F3", "F4"):
                 status = ((elfpatcher.restore_ld() or force) and
-                          elfpatcher.restore_binaries())
+                          elfpatcher.restore_binaries(force or
+                                                      prev_xmode == "F4"))
             if xmode[0] == 'R':
                 filebind.setup()
         elif xmode in ("F2", ):
             if force or prev_xmode in ("F3", "F4"):
-                status = elfpatcher.restore_binaries()
+                status = elfpatcher.restore_binaries(force or
+                                                     prev_xmode == "F4")
             if force or prev_xmode in ('P1', 'P2', 'F1', 'R1',
                                        'R2', 'R3', 'S1'):
                 status = elfpatcher.patch_ld()
@@ -3,6 +3,7 @@
 
 import sys
 import os
+import errno
 import subprocess
 import platform
 import stat
@@ -27,6 +28,8 @@ class RuncEngine(ExecutionEngineCommon):
     Inherits from ContainerEngine class
     """
 
+    relay_size = 65536          # bytes read at once from the pty
+
     def __init__(self, localrepo, exec_mode):
         super(RuncEngine, self).__init__(localrepo, exec_mode)
         self.executable = None                   # runc
@@ -445,31 +448,73 @@ class RuncEngine(ExecutionEngineCommon):
         self._filebind.finish()
         return status
 
+    def _write_fd(self, out_fd, data):
+        """Write all data to a file descriptor or to sys.stdout"""
+        if out_fd is None:
+            if sys.version_info[0] >= 3:
+                sys.stdout.write(data.decode(errors="replace"))
+            else:
+                sys.stdout.write(data)
+            return
+        while data:
+            try:
+                data = data[os.write(out_fd, data):]
+            except OSError as error:
+                if error.errno != errno.EINTR:
+                    raise
+
+    def _relay_pty(self, pmaster, child):
+        """Copy the output of the child from the pty to stdout until
+        the pty is closed or the child exits, returns False if the
+        output could not be written
+        """
+        try:
+            sys.stdout.flush()
+            out_fd = sys.stdout.fileno()
+        except (AttributeError, IOError, OSError, ValueError):
+            out_fd = None
+        timeout = 1
+        while True:
+            try:
+                readable = select.select([pmaster, ], [], [], timeout)[0]
+            except (select.error, OSError) as error:
+                if error.args[0] == errno.EINTR:
+                    continue
+                return True
+            if not readable:
+                if child.poll() is not None:
+                    return True         # exited leaving the pty open
+                continue
+            try:
+                data = os.read(pmaster, self.relay_size)
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                return True             # EIO once the pty is closed
+            if not data:
+                return True
+            try:
+                self._write_fd(out_fd, data)
+            except (IOError, OSError):
+                return False
+            if child.poll() is not None:
+                timeout = 0             # drain the output left
+
     def run_nopty(self, cmd_l):
         """runc without a terminal"""
         (pmaster, pslave) = os.openpty()
         status = subprocess.Popen(cmd_l, shell=False, close_fds=False,
                                   stdout=pslave, stderr=pslave)
         os.close(pslave)
-        while True:
-            status.poll()
-            if status.returncode is not None:
-                break
-            readable, dummy, exception = \
-                select.select([pmaster, ], [], [pmaster, ], 5)
-            if exception:
-                break
-            if readable:
-                try:
-                    if sys.version_info[0] >= 3:
-                        sys.stdout.write(os.read(pmaster, 1).decode())
-                    else:
-                        sys.stdout.write(os.read(pmaster, 1))
-                except OSError:
-                    break
         try:
-            status.terminate()
-        except OSError:
-            pass
+            relayed = self._relay_pty(pmaster, status)
+        finally:
+            os.close(pmaster)
+        if not relayed:
+            try:
+                status.terminate()
+            except OSError:
+                pass
+        status.wait()
         self._filebind.finish()
-        return status
+        return status.returncode
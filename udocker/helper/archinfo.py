@@ -7,65 +7,79 @@ class ArchInfo(object):
 
     # { 'docker':['docker_arch'], 'qemu':['qemu_arch'],
     #   'UDOCKER':['udocker_arch'], 'uname':['uname string]',
-    #   'file':['file string'], 'readelf':['readelf string']
+    #   'file':['file string'], 'readelf':['readelf string'],
+    #   'elf':['ElfHeader description string']
     # }
 
     _arch_list = [
         {'docker': ['amd64'], 'qemu': ['x86_64'], 'UDOCKER': ['x86_64'],
          'uname': ['x86_64'], 'file': ['x86-64'], 'readelf': ['X86-64'],
-         'arch/var': ['amd64']},
+         'elf': ['machine=62;'], 'arch/var': ['amd64']},
         {'docker': ['x86_64'], 'qemu':['x86_64'], 'UDOCKER': ['x86_64'],
          'uname': ['x86_64'], 'file':['x86-64'], 'readelf': ['X86_64'],
-         'arch/var':['amd64']},
+         'elf': ['machine=62;'], 'arch/var':['amd64']},
         {'docker': ['386'], 'qemu': ['i386'], 'UDOCKER': ['x86'],
          'uname': ['i386'], 'file': ['Intel 80386'], 'readelf': ['Intel 80386'],
-         'arch/var': ['386']},
+         'elf': ['machine=3;'], 'arch/var': ['386']},
         {'docker': ['arm64'], 'qemu': ['aarch64'], 'UDOCKER': ['arm64'],
          'uname': ['aarch64'], 'file': ['aarch64'], 'readelf': ['AArch64'],
-         'arch/var': ['arm64']},
+         'elf': ['machine=183;'], 'arch/var': ['arm64']},
         {'docker': ['arm'], 'qemu': ['arm'], 'UDOCKER': ['armhf'],
          'uname': ['armv7l'], 'file': [' ARM', '32-bit', 'LSB', 'EABI5'],
          'readelf': [' ARM', 'hard-float', 'little', 'Version5 EABI'],
-         'arch/var': ['arm/v7']},
+         'elf': ['machine=40;', 'hard-float'], 'arch/var': ['arm/v7']},
         {'docker': ['arm/v4'], 'qemu': ['arm'], 'UDOCKER': ['armel'],
          'uname': ['arm'], 'file': [' ARM', '32-bit', 'LSB', 'EABI5'],
-         'readelf': [' ARM', 'little', 'Version5 EABI'], 'arch/var': ['arm/v4']},
+         'readelf': [' ARM', 'little', 'Version5 EABI'],
+         'elf': ['machine=40;'], 'arch/var': ['arm/v4']},
         {'docker': ['arm/v5'], 'qemu': ['arm'], 'UDOCKER': ['armel'],
          'uname': ['arm'], 'file': [' ARM', '32-bit', 'LSB', 'EABI5'],
-         'readelf': [' ARM', 'little', 'Version5 EABI'], 'arch/var': ['arm/v5']},
+         'readelf': [' ARM', 'little', 'Version5 EABI'],
+         'elf': ['machine=40;'], 'arch/var': ['arm/v5']},
         {'docker': ['arm/v6'], 'qemu': ['arm'], 'UDOCKER': ['armel'],
          'uname': ['arm'], 'file': [' ARM', '32-bit', 'LSB', 'EABI5'],
-         'readelf': [' ARM', 'little', 'Version5 EABI'], 'arch/var': ['arm/v6']},
+         'readelf': [' ARM', 'little', 'Version5 EABI'],
+         'elf': ['machine=40;'], 'arch/var': ['arm/v6']},
         {'docker': ['arm'], 'qemu': ['arm'], 'UDOCKER': ['armel'],
          'uname': ['arm'], 'file': [' ARM', '32-bit', 'LSB', 'EABI5'],
-         'readelf': [' ARM', 'little', 'Version5 EABI'], 'arch/var': ['arm']},
+         'readelf': [' ARM', 'little', 'Version5 EABI'],
+         'elf': ['machine=40;'], 'arch/var': ['arm']},
         {'docker': ['ppc64le'], 'qemu': ['ppc64le'], 'UDOCKER': ['ppc64le'],
          'uname': ['ppc64le'], 'file': ['64-bit PowerPC', 'LSB'],
-         'readelf': ['PowerPC64', 'little endian'], 'arch/var': ['ppc64le']},
+         'readelf': ['PowerPC64', 'little endian'],
+         'elf': ['machine=21;', 'little endian'], 'arch/var': ['ppc64le']},
         {'docker': ['ppc64'], 'qemu': ['ppc64'], 'UDOCKER': ['ppc64'],
          'uname': ['ppc64'], 'file': ['PowerPC', '64-bit'],
-         'readelf': ['PowerPC', 'ELF64'], 'arch/var': ['ppc64']},
+         'readelf': ['PowerPC', 'ELF64'],
+         'elf': ['machine=21;', 'big endian'], 'arch/var': ['ppc64']},
         {'docker': ['ppc'], 'qemu': ['ppc'], 'UDOCKER': ['ppc'],
          'uname': ['ppc'], 'file': ['PowerPC', '32-bit'],
-         'readelf': ['PowerPC', 'ELF32'], 'arch/var': ['ppc']},
+         'readelf': ['PowerPC', 'ELF32'],
+         'elf': ['machine=20;'], 'arch/var': ['ppc']},
         {'docker': ['mipsle'], 'qemu': ['mipsel'], 'UDOCKER': ['mipsle'],
          'uname': ['mips'], 'file': ['mips', '32-bit', 'LSB executable'],
-         'readelf': ['mips', 'ELF32', 'little endian'], 'arch/var': ['mipsle']},
+         'readelf': ['mips', 'ELF32', 'little endian'],
+         'elf': ['machine=8;', 'ELF32', 'little endian'], 'arch/var': ['mipsle']},
         {'docker': ['mips'], 'qemu': ['mips'], 'UDOCKER': ['mips'],
          'uname': ['mips'], 'file': ['mips', '32-bit', 'MSB'],
-         'readelf': ['mips', 'ELF32', 'big endian'], 'arch/var': ['mips']},
+         'readelf': ['mips', 'ELF32', 'big endian'],
+         'elf': ['machine=8;', 'ELF32', 'big endian'], 'arch/var': ['mips']},
         {'docker': ['mips64le'], 'qemu': ['mips64el'], 'UDOCKER': ['mips64le'],
          'uname': ['mips64'], 'file': ['mips', '64-bit', 'LSB executable'],
-         'readelf': ['mips', 'ELF64', 'little endian'], 'arch/var': ['mips64']},
+         'readelf': ['mips', 'ELF64', 'little endian'],
+         'elf': ['machine=8;', 'ELF64', 'little endian'], 'arch/var': ['mips64']},
         {'docker': ['mips64'], 'qemu': ['mips64'], 'UDOCKER': ['mips64'],
          'uname': ['mips64'], 'file': ['mips', '64-bit', 'MSB'],
-         'readelf': ['mips', 'ELF64', 'big endian'], 'arch/var': ['mips64']},
+         'readelf': ['mips', 'ELF64', 'big endian'],
+         'elf': ['machine=8;', 'ELF64', 'big endian'], 'arch/var': ['mips64']},
         {'docker': ['riscv64'], 'qemu': ['riscv64'], 'UDOCKER': ['riscv64'],
          'uname': ['riscv64'], 'file': ['riscv', '64-bit'],
-         'readelf': ['riscv', 'ELF64'], 'arch/var':['riscv64']},
+         'readelf': ['riscv', 'ELF64'],
+         'elf': ['machine=243;', 'ELF64'], 'arch/var':['riscv64']},
         {'docker': ['s390x'], 'qemu': ['s390x'], 'UDOCKER': ['s390x'],
          'uname': ['s390x'], 'file': ['IBM S/390', '64-bit', 'MSB'],
-         'readelf': ['IBM S/390', 'ELF64', 'big endian'], 'arch/var': ['s390x']}
+         'readelf': ['IBM S/390', 'ELF64', 'big endian'],
+         'elf': ['machine=22;', 'ELF64'], 'arch/var': ['s390x']}
     ]
 
     # binaries from which to get architecture information using
@@ -90,15 +104,37 @@ class ArchInfo(object):
                       "/lib/ld-linux.so.2", "/lib/ld-linux.so.3",
                       "/usr/bin/coreutils", "/bin/coreutils", ]
 
+    _elf_types = {1: "REL", 2: "EXEC", 3: "DYN", 4: "CORE"}
+
     def get_binaries_list(self):
         """Return list of binary files"""
         return self._binaries_list
 
+    def elf_description(self, elf):
+        """
+        Describe the ELF header data read by ElfHeader in a string
+        that can be matched by get_arch() with source type "elf"
+        """
+        description = "ELF%d %s endian machine=%d; osabi=%d; %s" % \
+            (elf["class"], elf["endian"], elf["machine"], elf["osabi"],
+             self._elf_types.get(elf["type"], "NONE"))
+        if elf["dynamic"]:
+            description += " dynamic"
+        if elf["machine"] == 40:
+            if elf["flags"] & 0xff000000 == 0x05000000:
+                description += " Version5 EABI"
+            if elf["flags"] & 0x400:
+                description += " hard-float"
+        if elf["interpreter"]:
+            description += " interpreter " + elf["interpreter"]
+        return description
+
     def get_arch(self, source_type, arch_info, target_type="UDOCKER"):
         """
         Return (docker_arch, qemu_arch, udocker_arch) by source type
-        source can be "uname", "file" or "readelf"
-        arch_info is data previously produced by uname, file or readelf
+        source can be "uname", "file", "readelf" or "elf"
+        arch_info is data previously produced by uname, file, readelf
+        or elf_description()
         target_type can be docker, qemu, UDOCKER or ALL
         """
         if "ASCII" in arch_info or "Error:" in arch_info:
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Read the headers of ELF binaries without external tools"""
+
+import struct
+
+
+class ElfHeader(object):
+    """Parse the ELF header and program headers of a file in process,
+    avoiding the fork of patchelf, readelf or file just to find if a
+    file is an ELF executable or library, its architecture and which
+    loader it requests.
+    """
+
+    ET_EXEC = 2
+    ET_DYN = 3
+    PT_LOAD = 1
+    PT_DYNAMIC = 2
+    PT_INTERP = 3
+    DT_STRTAB = 5
+    DT_RPATH = 15
+    DT_RUNPATH = 29
+    max_phnum = 4096
+    max_interp = 4096
+    max_dynamic = 65536
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.elf_class = 0
+        self._order = "<"
+
+    def _unpack(self, fmt, data, offset=0):
+        """Unpack a field with the byte order of the file"""
+        return struct.unpack_from(self._order + fmt, data, offset)[0]
+
+    def _program_headers(self, filep, header):
+        """Read the program headers as (p_type, p_offset, p_vaddr,
+        p_filesz)
+        """
+        if self.elf_class == 64:
+            (phoff, phentsize, phnum) = (self._unpack("Q", header, 32),
+                                         self._unpack("H", header, 54),
+                                         self._unpack("H", header, 56))
+            fields = (("I", 0), ("Q", 8), ("Q", 16), ("Q", 32))
+        else:
+            (phoff, phentsize, phnum) = (self._unpack("I", header, 28),
+                                         self._unpack("H", header, 42),
+                                         self._unpack("H", header, 44))
+            fields = (("I", 0), ("I", 4), ("I", 8), ("I", 16))
+        if not phoff or phnum > self.max_phnum or phentsize < 32:
+            return []
+        filep.seek(phoff)
+        data = filep.read(phentsize * phnum)
+        p_headers = []
+        for offset in range(0, len(data) - phentsize + 1, phentsize):
+            p_headers.append(tuple([self._unpack(fmt, data, offset + pos)
+                                    for (fmt, pos) in fields]))
+        return p_headers
+
+    def _read_string(self, filep, offset):
+        """Read a null terminated string"""
+        filep.seek(offset)
+        return filep.read(self.max_interp).split(b"\x00")[0].decode(
+            "utf-8", "replace")
+
+    def _rpath(self, filep, p_headers, dynamic):
+        """Read the DT_RUNPATH or else the DT_RPATH from the dynamic
+        section, the string table is found through the PT_LOAD segments
+        """
+        (dummy, p_offset, dummy, p_filesz) = dynamic
+        (fmt, entsize) = (("q", 16), ("i", 8))[self.elf_class == 32]
+        filep.seek(p_offset)
+        data = filep.read(min(p_filesz, self.max_dynamic))
+        tags = {}
+        for offset in range(0, len(data) - entsize + 1, entsize):
+            d_tag = self._unpack(fmt, data, offset)
+            if not d_tag:
+                break
+            tags.setdefault(d_tag, self._unpack(fmt.upper(), data,
+                                                offset + entsize // 2))
+        d_val = tags.get(self.DT_RUNPATH, tags.get(self.DT_RPATH))
+        if d_val is None or self.DT_STRTAB not in tags:
+            return ""
+        strtab = tags[self.DT_STRTAB]
+        for (p_type, p_offset, p_vaddr, p_filesz) in p_headers:
+            if p_type == self.PT_LOAD and \
+                    p_vaddr <= strtab < p_vaddr + p_filesz:
+                return self._read_string(filep,
+                                         strtab - p_vaddr + p_offset + d_val)
+        return ""
+
+    def read(self):
+        """Get the ELF class, byte order, OS ABI, type, machine, flags,
+        loader pathname, run path and if the file is dynamically linked,
+        returns None if the file is not ELF
+        """
+        try:
+            with open(self.filename, "rb") as filep:
+                header = filep.read(64)
+                if len(header) < 52 or header[0:4] != b"\x7fELF":
+                    return None
+                self.elf_class = {1: 32, 2: 64}.get(bytearray(header)[4])
+                endian = {1: "little", 2: "big"}.get(bytearray(header)[5])
+                if not (self.elf_class and endian):
+                    return None
+                if self.elf_class == 64 and len(header) < 64:
+                    return None
+                self._order = ("<", ">")[endian == "big"]
+                elf = {"class": self.elf_class, "endian": endian,
+                       "osabi": bytearray(header)[7],
+                       "type": self._unpack("H", header, 16),
+                       "machine": self._unpack("H", header, 18),
+                       "flags": self._unpack("I", header, (36, 48)[
+                           self.elf_class == 64]),
+                       "interpreter": "", "rpath": "", "dynamic": False, }
+                p_headers = self._program_headers(filep, header)
+                for p_header in p_headers:
+                    if p_header[0] == self.PT_DYNAMIC and not elf["dynamic"]:
+                        elf["dynamic"] = True
+                        elf["rpath"] = self._rpath(filep, p_headers, p_header)
+                    elif p_header[0] == self.PT_INTERP:
+                        elf["interpreter"] = self._read_string(filep,
+                                                               p_header[1])
+                return elf
+        except (IOError, OSError, struct.error):
+            return None
+
+    def is_dynamic(self):
+        """Is the file a dynamically linked ELF executable or library"""
+        elf = self.read()
+        return bool(elf and elf["type"] in (self.ET_EXEC, self.ET_DYN) and
+                    (elf["dynamic"] or elf["interpreter"]))
@@ -5,13 +5,17 @@ import re
 import os
 import sys
 import time
+import json
+import multiprocessing
 
 from udocker.genstr import is_genstr
 from udocker.msg import Msg
 from udocker.config import Config
 from udocker.helper.hostinfo import HostInfo
+from udocker.helper.elfheader import ElfHeader
 from udocker.utils.uprocess import Uprocess
 from udocker.utils.fileutil import FileUtil
+from udocker.utils.parallel import run_parallel
 
 
 class ElfPatcher(object):
@@ -20,9 +24,6 @@ class ElfPatcher(object):
     BIN = 1
     LIB = 2
     LOADER = 4
-    ABORT_ON_ERROR = 8
-    ONE_SUCCESS = 16
-    ONE_OUTPUT = 32
 
     def __init__(self, localrepo, container_id):
         self.localrepo = localrepo
@@ -36,6 +37,7 @@ class ElfPatcher(object):
         self._container_ld_libdirs = self._container_dir + "/ld.lib.dirs"
         self._container_patch_time = self._container_dir + "/patch.time"
         self._container_patch_path = self._container_dir + "/patch.path"
+        self._container_patch_files = self._container_dir + "/patch.files"
         self._shlib = re.compile(r"^lib\S+\.so(\.\d+)*$")
         self._uid = HostInfo.uid
 
@@ -72,13 +74,12 @@ class ElfPatcher(object):
             cmd_out.append(arg)
         return cmd_out
 
-    def _walk_fs(self, cmd, root_path, action=BIN):
-        """Execute a shell command over each executable file in a given
-        dir_path, action can be ABORT_ON_ERROR, return upon first success
-        ONE_SUCCESS, or return upon the first non empty output. #f is the
-        placeholder for the filename.
+    def _find_elf_files(self, root_path, action=BIN, skip=None):
+        """Find the dynamically linked ELF executables (BIN) and the
+        ELF shared libraries (LIB) owned by the user in a given
+        root_path, the ELF headers are read in process, files with a
+        pathname relative to the container ROOT in skip are ignored
         """
-        status = ""
         for dir_path, dummy, files in os.walk(root_path):
             for f_name in files:
                 try:
@@ -86,41 +87,119 @@ class ElfPatcher(object):
                     if os.path.islink(f_path):
                         continue
 
-                    if os.stat(f_path).st_uid != self._uid:
-                        if action & self.ABORT_ON_ERROR:
-                            return ""
+                    if skip and f_path[len(self._container_root):] in skip:
+                        continue
 
+                    if os.stat(f_path).st_uid != self._uid:
                         continue
 
                     if ((action & self.BIN and os.access(f_path, os.X_OK)) or
                             (action & self.LIB and self._shlib.match(f_name))):
-                        out = Uprocess().get_output(self._replace(cmd, f_path))
-                        if out:
-                            status = out
-
-                    if action & self.ABORT_ON_ERROR and status is None:
-                        return ""
-
-                    if action & self.ONE_SUCCESS and status is not None:
-                        return status
-
-                    if action & self.ONE_OUTPUT and status:
-                        return status
+                        if ElfHeader(f_path).is_dynamic():
+                            yield f_path
 
                 except OSError:
                     pass
 
-        return status
+    def _get_workers(self):
+        """Number of concurrent patchelf processes"""
+        workers = int(Config.conf['patchelf_workers'])
+        if workers < 1:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        return workers
+
+    def _run_files(self, cmd, files):
+        """Execute a shell command over each file concurrently, #f is
+        the placeholder for the filename, returns the files for which
+        the command succeeded
+        """
+        Msg().out("Info: patching", len(set(files)), "files", l=Msg.VER)
+        results = run_parallel(
+            lambda f_path: Uprocess().get_output(self._replace(cmd, f_path)),
+            files, self._get_workers())
+        return [f_path for f_path in results if results[f_path] is not None]
+
+    def _file_stat(self, f_path):
+        """Identify the content of a file by its inode and mtime"""
+        try:
+            fstat = os.stat(f_path)
+        except OSError:
+            return None
+        return [fstat.st_ino,
+                getattr(fstat, "st_mtime_ns", int(fstat.st_mtime * 1e9))]
+
+    def _is_unchanged(self, f_name, entry):
+        """Is the file relative to ROOT the same recorded in the index"""
+        return self._file_stat(self._container_root + f_name) == \
+            [entry.get("ino"), entry.get("mtime")]
+
+    def _is_patched(self, elf, prefix):
+        """Do the ELF loader or run path point inside the prefix"""
+        return bool(elf) and (elf["interpreter"].startswith(prefix + '/') or
+                              prefix + '/' in elf["rpath"])
+
+    def _load_patch_index(self):
+        """Load the index of patched files with pathnames relative to
+        ROOT, returns None if the container has no index
+        """
+        try:
+            index = json.loads(
+                FileUtil(self._container_patch_files).getdata('r'))
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(index, dict):
+            return None
+        return dict([(f_name, entry if isinstance(entry, dict) else {})
+                     for (f_name, entry) in index.items()])
+
+    def _save_patch_index(self, index):
+        """Save the index of patched files"""
+        return bool(FileUtil(self._container_patch_files).putdata(
+            json.dumps(index, sort_keys=True), 'w'))
+
+    def _index_files(self, root_path, index):
+        """Find the files that are new or changed since they were
+        indexed, returns the files to be patched with their original
+        loader and run path, files already patched are indexed
+        """
+        originals = []
+        for f_path in self._find_elf_files(root_path, self.BIN | self.LIB,
+                                           index):
+            elf = ElfHeader(f_path).read()
+            if not elf:
+                continue
+            orig = {"interpreter": elf["interpreter"], "rpath": elf["rpath"]}
+            if self._is_patched(elf, self._container_root):
+                if orig["interpreter"].startswith(self._container_root):
+                    orig["interpreter"] = \
+                        orig["interpreter"][len(self._container_root):]
+                orig["rpath"] = \
+                    orig["rpath"].replace(self._container_root + '/', '/')
+                self._index_entry(index, f_path, orig)
+            else:
+                originals.append((f_path, orig))
+        return originals
+
+    def _index_entry(self, index, f_path, orig):
+        """Add a patched file to the index"""
+        fstat = self._file_stat(f_path)
+        if fstat:
+            orig.update({"ino": fstat[0], "mtime": fstat[1]})
+            index[f_path[len(self._container_root):]] = orig
 
     def guess_elf_loader(self):
-        """Search for executables and try to read the ld.so pathname"""
-        patchelf_exec = self.select_patchelf()
-        cmd = [patchelf_exec, "-q", "--print-interpreter", "#f"]
+        """Search for executables and read the ld.so pathname"""
         for d_name in ("/bin", "/usr/bin", "/lib64"):
-            elf_loader = self._walk_fs(cmd, self._container_root + d_name,
-                                       self.ONE_OUTPUT | self.BIN)
-            if elf_loader and ".so" in elf_loader:
-                return elf_loader
+            for f_path in self._find_elf_files(self._container_root + d_name,
+                                               self.BIN):
+                elf = ElfHeader(f_path).read()
+                if elf and elf["interpreter"]:
+                    if ".so" in elf["interpreter"]:
+                        return elf["interpreter"]
+                    break
         return ""
 
     def get_original_loader(self):
@@ -163,14 +242,26 @@ class ElfPatcher(object):
             return "0"
 
     def patch_binaries(self):
-        """Set all executables and libs to the ld.so absolute pathname"""
+        """Set all executables and libs to the ld.so absolute pathname,
+        files unchanged since they were patched are skipped
+        """
         if not self.check_container_path():
             self.restore_binaries()
         last_time = '0'
         patchelf_exec = self.select_patchelf()
         elf_loader = self.get_container_loader()
         cmd = [patchelf_exec, "--set-root-prefix", self._container_root, "#f"]
-        self._walk_fs(cmd, self._container_root, self.BIN | self.LIB)
+        index = dict([(f_name, entry) for (f_name, entry) in
+                      (self._load_patch_index() or {}).items()
+                      if self._is_unchanged(f_name, entry)])
+        Msg().out("Info: unchanged patched files:", len(index), l=Msg.VER)
+        originals = self._index_files(self._container_root, index)
+        patched = self._run_files(cmd, [f_path for (f_path, dummy)
+                                        in originals])
+        for (f_path, orig) in originals:
+            if f_path in patched:
+                self._index_entry(index, f_path, orig)
+        self._save_patch_index(index)
         newly_set = self.guess_elf_loader()
         if newly_set == elf_loader:
             try:
@@ -183,22 +274,41 @@ class ElfPatcher(object):
                     futil_path.putdata(self._container_dir, 'w'))
         return False
 
-    def restore_binaries(self):
-        """Restore all executables and libs to the original ld.so pathname"""
+    def restore_binaries(self, scan=False):
+        """Restore all executables and libs to the original ld.so pathname,
+        only the indexed files are restored unless scan is True then the
+        files patched at run time in F4 mode are also searched
+        """
         patchelf_exec = self.select_patchelf()
         elf_loader = self.get_original_loader()
         last_path = self.get_patch_last_path()
         if last_path:
-            cmd = [patchelf_exec, "--restore-root-prefix",
-                   last_path + "/ROOT", "#f"]
+            prefix = last_path + "/ROOT"
+        else:
+            prefix = self._container_root
+        cmd = [patchelf_exec, "--restore-root-prefix", prefix, "#f"]
+        index = self._load_patch_index()
+        if index is None:
+            files = list(self._find_elf_files(self._container_root,
+                                              self.BIN | self.LIB))
         else:
-            cmd = [patchelf_exec, "--restore-root-prefix",
-                   self._container_root, "#f"]
-        self._walk_fs(cmd, self._container_root, self.BIN | self.LIB)
+            files = []
+            for f_name in sorted(index):
+                f_path = self._container_root + f_name
+                if (self._is_unchanged(f_name, index[f_name]) or
+                        self._is_patched(ElfHeader(f_path).read(), prefix)):
+                    files.append(f_path)
+            if scan:
+                for f_path in self._find_elf_files(self._container_root,
+                                                   self.BIN | self.LIB, index):
+                    if self._is_patched(ElfHeader(f_path).read(), prefix):
+                        files.append(f_path)
+        self._run_files(cmd, files)
         newly_set = self.guess_elf_loader()
         if newly_set == elf_loader:
             FileUtil(self._container_patch_path).remove()
             FileUtil(self._container_patch_time).remove()
+            FileUtil(self._container_patch_files).remove()
         return newly_set == elf_loader
 
     def patch_ld(self, output_elf=None):
@@ -4,17 +4,99 @@
 import os
 import re
 import pwd
+import json
 import platform
+import threading
 
 from udocker.genstr import is_genstr
+from udocker.config import Config
 from udocker.utils.uprocess import Uprocess
 from udocker.helper.archinfo import ArchInfo
 
 
 class HostInfo(ArchInfo):
-    """Get information from the host system"""
+    """Get information from the host system, host facts that require
+    forks or file reads are memoized for the process and optionally
+    kept in a cache file valid until the kernel or boot id change
+    """
     uid = os.getuid()
     gid = os.getgid()
+    boot_id_file = "/proc/sys/kernel/random/boot_id"
+    _facts = {}                 # host facts memoized for the process
+    _facts_lock = threading.Lock()
+    _facts_file = None          # cache file merged into the memo
+
+    def _cache_file(self):
+        """Pathname of the host facts cache file, empty if disabled"""
+        cache_file = Config.conf['hostinfo_cache']
+        if not cache_file or cache_file.startswith("/"):
+            return cache_file
+        return Config.conf['topdir'] + "/" + cache_file
+
+    def _fingerprint(self):
+        """Identify the running host kernel and boot"""
+        try:
+            with open(self.boot_id_file, "r") as filep:
+                boot_id = filep.read().strip()
+        except (IOError, OSError):
+            boot_id = ""
+        return {"kernel": platform.release(), "boot_id": boot_id, }
+
+    def _load_facts(self, cache_file):
+        """Merge the cache file into the memo if from this boot"""
+        try:
+            if os.stat(cache_file).st_uid != self.uid:
+                return
+            with open(cache_file, "r") as filep:
+                data = json.load(filep)
+            fingerprint = self._fingerprint()
+            if fingerprint["boot_id"] and \
+                    data["fingerprint"] == fingerprint:
+                for (key, value) in data["facts"].items():
+                    HostInfo._facts.setdefault(key, value)
+        except (IOError, OSError, ValueError, KeyError, TypeError,
+                AttributeError):
+            pass
+
+    def _save_facts(self, cache_file):
+        """Write the memo to the cache file"""
+        fingerprint = self._fingerprint()
+        if not (fingerprint["boot_id"] and
+                os.path.isdir(os.path.dirname(cache_file))):
+            return False
+        tmp_file = cache_file + "." + str(os.getpid())
+        try:
+            with open(tmp_file, "w") as filep:
+                json.dump({"fingerprint": fingerprint,
+                           "facts": HostInfo._facts, }, filep)
+            os.rename(tmp_file, cache_file)
+            return True
+        except (IOError, OSError, ValueError, TypeError):
+            try:
+                os.remove(tmp_file)
+            except (IOError, OSError):
+                pass
+        return False
+
+    def fact(self, key, probe, *args):
+        """Get a host fact calling probe(*args) only the first time,
+        a probe returning None failed and is not memoized
+        """
+        cache_file = self._cache_file()
+        with HostInfo._facts_lock:
+            if cache_file and HostInfo._facts_file != cache_file:
+                HostInfo._facts_file = cache_file
+                self._load_facts(cache_file)
+            if key in HostInfo._facts:
+                return HostInfo._facts[key]
+        value = probe(*args)
+        if value is None:
+            return None
+        with HostInfo._facts_lock:
+            HostInfo._facts[key] = value
+            if cache_file:
+                self._save_facts(cache_file)
+        return value
 
     def username(self):
         """Get username"""
@@ -25,21 +107,21 @@ class HostInfo(ArchInfo):
 
     def arch(self, target="UDOCKER"):
         """Get the host system architecture"""
-        machine = platform.machine()
+        machine = self.fact("machine", platform.machine)
         arch = self.get_arch("uname", machine, target)
         return arch[0] if arch[0] else ""
 
     def osversion(self):
         """Get operating system"""
         try:
-            return platform.system().lower()
+            return self.fact("system", platform.system).lower()
         except (NameError, AttributeError):
             return ""
 
     def oskernel(self):
         """Get operating system"""
         try:
-            return platform.release()
+            return self.fact("release", platform.release)
         except (NameError, AttributeError):
             return "6.1.1"
 
@@ -121,10 +203,36 @@ class HostInfo(ArchInfo):
             arg_list = [arg]
         elif isinstance(arg, list):
             arg_list = arg
-        out = Uprocess().get_output([executable] + arg_list + ["--help"])
-        if out and search_option in re.split(r"[=|\*\[\]\n,; ]+", out):
-            return True
-        return False
+        cmd_id = self._cmd_id(executable)
+        if not cmd_id:
+            return False
+        cmd = [executable] + arg_list + ["--help"]
+        options = self.fact("help:" + cmd_id + " " + " ".join(cmd[1:]),
+                            self._cmd_options, cmd)
+        return bool(options) and search_option in options
+
+    def _cmd_id(self, executable):
+        """Identify an executable by pathname, inode, size and mtime
+        so that options are probed again when it is replaced
+        """
+        if not executable.startswith("/"):
+            path = Config.conf['root_path'] + ":" + os.getenv("PATH", "")
+            executable = Uprocess().find_inpath(executable, path)
+        try:
+            fstat = os.stat(executable)
+        except (IOError, OSError):
+            return ""
+        return "%s:%d:%d:%d" % (executable, fstat.st_ino, fstat.st_size,
+                                int(fstat.st_mtime))
+
+    def _cmd_options(self, cmd):
+        """Split the help output of a command into words, returns None
+        if the command failed
+        """
+        out = Uprocess().get_output(cmd)
+        if out is None:
+            return None
+        return re.split(r"[=|\*\[\]\n,; ]+", out)
 
     def termsize(self):
         """Get guest operating system terminal size"""
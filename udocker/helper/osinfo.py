@@ -8,6 +8,8 @@ import json
 from udocker.utils.uprocess import Uprocess
 from udocker.utils.fileutil import FileUtil
 from udocker.helper.archinfo import ArchInfo
+from udocker.helper.elfheader import ElfHeader
+from udocker.helper.hostinfo import HostInfo
 
 
 class OSInfo(ArchInfo):
@@ -17,7 +19,9 @@ class OSInfo(ArchInfo):
         self._root_dir = root_dir
 
     def get_filetype(self, filename):
-        """Get architecture information from binary using file and readelf"""
+        """Get architecture information from binary reading the ELF
+        header in process, other files are identified with file
+        """
         if not filename.startswith(self._root_dir):
             filename = self._root_dir + '/' + filename
         if os.path.islink(filename):
@@ -26,9 +30,9 @@ class OSInfo(ArchInfo):
                 f_path = os.path.dirname(filename) + '/' + f_path
             return self.get_filetype(f_path)
         if os.path.isfile(filename):
-            filetype = Uprocess().get_output(["readelf", "-h", filename])
-            if filetype:
-                return ("readelf", filetype)
+            elf = ElfHeader(filename).read()
+            if elf:
+                return ("elf", self.elf_description(elf))
             filetype = Uprocess().get_output(["file", filename])
             if filetype and ":" in filetype:
                 return ("file", filetype.split(":", 1)[1])
@@ -104,6 +108,12 @@ class OSInfo(ArchInfo):
 
     def arch(self, target="UDOCKER"):
         """Get container / directory tree arechitecture"""
+        if self._root_dir == "/":
+            return HostInfo().fact("osarch:" + target, self._arch, target)
+        return self._arch(target)
+
+    def _arch(self, target="UDOCKER"):
+        """Get directory tree architecture from metadata or binaries"""
         architecture = self.arch_from_metadata(target)
         if not architecture:
             architecture = self.arch_from_binaries(target)
@@ -162,6 +172,13 @@ class OSInfo(ArchInfo):
 
     def osdistribution(self):
         """Get guest operating system distribution"""
+        if self._root_dir == "/":
+            return tuple(HostInfo().fact("osdistribution",
+                                         self._osdistribution_version))
+        return self._osdistribution_version()
+
+    def _osdistribution_version(self):
+        """Get distribution and major.minor version"""
         (distribution, version) = self._osdistribution()
         if version.count(".") >= 2:
             version = ".".join(version.split(".")[0:2])
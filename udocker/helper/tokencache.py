@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Cache of registry bearer tokens"""
+
+import os
+import time
+import json
+import hashlib
+import threading
+
+from udocker.helper.hostinfo import HostInfo
+from udocker.utils.fileutil import FileUtil
+
+
+class TokenCache(object):
+    """Keep registry bearer tokens until they expire so that they can
+    be reused across repositories and across udocker invocations.
+    Tokens are keyed by realm, service, scope and login credential.
+    The optional cache file is private to the user as the keystore.
+    """
+
+    default_expires = 60     # docker token spec default in seconds
+    expire_margin = 10       # refresh tokens this early in seconds
+
+    def __init__(self, cache_file=""):
+        self.cache_file = cache_file
+        self.tokens = {}
+        self.challenges = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def key(self, realm, service, scope, credential=""):
+        """Cache key for a token request"""
+        if credential:
+            credential = \
+                hashlib.sha256(credential.encode("utf-8")).hexdigest()[:16]
+        return "|".join((realm, service, scope, credential))
+
+    def _verify_file(self):
+        """Only use a cache file owned by the user and not shared"""
+        cache_uid = FileUtil(self.cache_file).uid()
+        if cache_uid == -1:
+            return True
+        if cache_uid != HostInfo.uid:
+            return False
+        return not os.stat(self.cache_file).st_mode & 0o077
+
+    def _read_file(self):
+        """Read cache file content"""
+        try:
+            if self._verify_file():
+                with open(self.cache_file, "r") as filep:
+                    data = json.load(filep)
+                if isinstance(data, dict):
+                    return data
+        except (IOError, OSError, ValueError):
+            pass
+        return {}
+
+    def _load(self):
+        """Merge the cache file into memory on first use"""
+        if self._loaded or not self.cache_file:
+            return
+        self._loaded = True
+        data = self._read_file()
+        now = time.time()
+        for (key, entry) in data.get("tokens", {}).items():
+            try:
+                if entry["expires"] > now and key not in self.tokens:
+                    self.tokens[key] = entry
+            except (KeyError, TypeError):
+                continue
+        for (registry, challenge) in data.get("challenges", {}).items():
+            self.challenges.setdefault(registry, challenge)
+
+    def _save(self):
+        """Write valid entries to the cache file"""
+        if not self.cache_file or not self._verify_file():
+            return False
+        now = time.time()
+        data = {"tokens": {}, "challenges": self.challenges, }
+        for (key, entry) in self.tokens.items():
+            if entry["expires"] > now:
+                data["tokens"][key] = entry
+        tmp_file = self.cache_file + ".%d" % os.getpid()
+        oldmask = None
+        try:
+            oldmask = os.umask(0o77)
+            with open(tmp_file, "w") as filep:
+                json.dump(data, filep)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError):
+            FileUtil(tmp_file).remove()
+            return False
+        finally:
+            if oldmask is not None:
+                os.umask(oldmask)
+        return True
+
+    def get(self, key):
+        """Get a valid token from the cache"""
+        with self._lock:
+            self._load()
+            entry = self.tokens.get(key)
+            if not entry:
+                return ""
+            if entry["expires"] <= time.time():
+                del self.tokens[key]
+                return ""
+            return entry["token"]
+
+    def put(self, key, token, expires_in=None):
+        """Store a token valid for expires_in seconds"""
+        try:
+            expires_in = int(expires_in)
+        except (ValueError, TypeError):
+            expires_in = self.default_expires
+        expires_in -= self.expire_margin
+        if not token or expires_in <= 0:
+            return False
+        with self._lock:
+            self._load()
+            self.tokens[key] = {"token": token,
+                                "expires": time.time() + expires_in, }
+            self._save()
+        return True
+
+    def invalidate(self, key):
+        """Remove a token rejected by the registry"""
+        with self._lock:
+            self._load()
+            if self.tokens.pop(key, None):
+                self._save()
+
+    def get_challenge(self, registry):
+        """Get the realm and service last used by a registry"""
+        with self._lock:
+            self._load()
+            return self.challenges.get(registry, {})
+
+    def put_challenge(self, registry, realm, service):
+        """Remember the realm and service used by a registry"""
+        challenge = {"realm": realm, "service": service, }
+        with self._lock:
+            self._load()
+            if self.challenges.get(registry) != challenge:
+                self.challenges[registry] = challenge
+                self._save()
@@ -4,6 +4,7 @@
 import re
 
 from udocker.utils.uprocess import Uprocess
+from udocker.utils.parallel import run_parallel
 
 try:
     import hashlib
@@ -14,6 +15,9 @@ except ImportError:
 class ChkSUM(object):
     """Checksumming for files"""
 
+    read_size = 1024 * 1024     # read buffer size for hashlib
+    workers = 4                 # default threads in hash_many()
+
     def __init__(self):
         self._algorithms = {}
         try:
@@ -30,10 +34,15 @@ class ChkSUM(object):
 
     def _hashlib(self, algorithm, filename):
         """hash calculation using hashlib"""
+        buf = bytearray(self.read_size)
+        view = memoryview(buf)
         try:
             with open(filename, "rb") as filep:
-                for chunk in iter(lambda: filep.read(4096), b""):
-                    algorithm.update(chunk)
+                while True:
+                    size = filep.readinto(buf)
+                    if not size:
+                        break
+                    algorithm.update(view[:size])
 
             return algorithm.hexdigest()
         except (IOError, OSError):
@@ -76,9 +85,29 @@ class ChkSUM(object):
         """Call the actual implementation selected in __init__"""
         return self._algorithms["sha512"](filename)
 
+    def hasher(self, algorithm):
+        """Incremental hash object for algorithm, None if unavailable"""
+        if algorithm not in self._algorithms:
+            return None
+        try:
+            return hashlib.new(algorithm)
+        except (NameError, ValueError):
+            return None
+
     def hash(self, filename, algorithm):
         """Compute hash algorithm for file"""
         if algorithm in self._algorithms:
             return self._algorithms[algorithm](filename)
 
         return ""
+
+    def hash_many(self, filenames, algorithm, workers=None):
+        """Compute hash algorithm for several files concurrently,
+        hashlib releases the GIL while hashing large buffers.
+        Returns a dictionary with the hash of each file.
+        """
+        if not workers:
+            workers = self.workers
+        return run_parallel(lambda filename: self.hash(filename, algorithm),
+                            filenames, workers)
+        return results
@@ -4,11 +4,14 @@
 import os
 import sys
 import json
+import time
+import socket
 
 from udocker.genstr import is_genstr
 from udocker.config import Config
 from udocker.msg import Msg
 from udocker.utils.fileutil import FileUtil
+from udocker.utils.chksum import ChkSUM
 from udocker.utils.uprocess import Uprocess
 
 try:
@@ -16,10 +19,19 @@ try:
 except ImportError:
     pass
 
+try:
+    import ssl
+except ImportError:
+    pass
+
 if sys.version_info[0] >= 3:
     from io import BytesIO as strio
+    import http.client as httpclient
+    from urllib.parse import urlsplit, urljoin
 else:
     from StringIO import StringIO as strio
+    import httplib as httpclient
+    from urlparse import urlsplit, urljoin
 
 
 class CurlHeader(object):
@@ -77,6 +89,114 @@ class CurlHeader(object):
         return str(self.data)
 
 
+class DigestWriter(object):
+    """Write downloaded data to a file while computing its digest
+    so that the file does not need to be read again to verify it
+    """
+
+    def __init__(self, filep, algorithm):
+        self.filep = filep
+        self.algorithm = algorithm
+        self._hasher = ChkSUM().hasher(algorithm)
+
+    def seed(self, filename):
+        """Hash the data already in a file that is being resumed"""
+        if self._hasher is None:
+            return
+        try:
+            with open(filename, "rb") as filep:
+                for chunk in iter(lambda: filep.read(1024 * 1024), b""):
+                    self._hasher.update(chunk)
+        except (IOError, OSError):
+            self._hasher = None
+
+    def write(self, data):
+        """Write data and update the digest"""
+        self.filep.write(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+
+    def digest(self):
+        """Digest in the algorithm:hexdigest format or empty string"""
+        if self._hasher is None:
+            return ""
+        return self.algorithm + ":" + self._hasher.hexdigest()
+
+
+class CurlMultiEngine(object):
+    """Transfer engine for PyCurl built on top of pycurl.CurlMulti.
+    Easy handles are kept in a pool and reused after each transfer,
+    this allows libcurl to keep connections alive and reuse them
+    across requests to the same server. Several transfers can also
+    be driven concurrently from a single thread via perform().
+    """
+
+    def __init__(self, pool_size=8):
+        self._multi = pycurl.CurlMulti()
+        self._pool = []
+        self._pool_size = pool_size
+
+    def acquire(self):
+        """Get an easy handle from the pool or create a new one"""
+        if self._pool:
+            return self._pool.pop()
+        return pycurl.Curl()
+
+    def release(self, pyc):
+        """Reset an easy handle and return it to the pool"""
+        try:
+            pyc.reset()
+        except (pycurl.error, AttributeError):
+            pyc.close()
+            return
+        if len(self._pool) < self._pool_size:
+            self._pool.append(pyc)
+        else:
+            pyc.close()
+
+    def _read_info(self, results):
+        """Collect the completion status of finished transfers"""
+        while True:
+            (num_queued, ok_list, err_list) = self._multi.info_read()
+            for pyc in ok_list:
+                results[id(pyc)] = (0, "")
+            for (pyc, errno, errstr) in err_list:
+                results[id(pyc)] = (errno, errstr)
+            if not num_queued:
+                break
+
+    def perform(self, handles):
+        """Perform the transfers for a list of easy handles
+        Returns a list of (curl errno, curl error string) in the same
+        order as the handles, errno is 0 for successful transfers.
+        """
+        results = {}
+        for pyc in handles:
+            self._multi.add_handle(pyc)
+        try:
+            num_active = len(handles)
+            while num_active:
+                while True:
+                    (ret, num_active) = self._multi.perform()
+                    if ret != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+                self._read_info(results)
+                if num_active:
+                    self._multi.select(1.0)
+            self._read_info(results)
+        finally:
+            for pyc in handles:
+                self._multi.remove_handle(pyc)
+        return [results.get(id(pyc), (0, "")) for pyc in handles]
+
+    def close(self):
+        """Close all easy handles and the multi handle"""
+        for pyc in self._pool:
+            pyc.close()
+        self._pool = []
+        self._multi.close()
+
+
 class GetURL(object):
     """File downloader using PyCurl or a curl cli executable"""
 
@@ -99,6 +219,10 @@ class GetURL(object):
             self._geturl = GetURLpyCurl()
             self.cache_support = True
             Msg().out("Debug: using pycurl", l=Msg.DBG)
+        elif GetURLhttpClient().is_available() and not self._curl_exec:
+            self._geturl = GetURLhttpClient()
+            self.cache_support = True
+            Msg().out("Debug: using python http client", l=Msg.DBG)
         elif GetURLexeCurl().is_available():
             self._geturl = GetURLexeCurl()
             Msg().out("Debug: using curl executable", self._geturl._curl_exec, l=Msg.DBG)
@@ -121,6 +245,13 @@ class GetURL(object):
     def set_proxy(self, http_proxy):
         """Specify a socks http proxy"""
         self.http_proxy = http_proxy
+        if (isinstance(self._geturl, GetURLhttpClient) and
+                not self._geturl.is_proxy_supported(http_proxy) and
+                GetURLexeCurl().is_available()):
+            self._geturl = GetURLexeCurl()
+            self._geturl.insecure = self.insecure
+            self.cache_support = False
+            Msg().out("Debug: proxy requires curl executable", l=Msg.DBG)
         self._geturl.http_proxy = http_proxy
 
     def get(self, *args, **kwargs):
@@ -158,6 +289,8 @@ class GetURLpyCurl(GetURL):
     def __init__(self):
         GetURL.__init__(self)
         self._url = None
+        self._engine = None
+        self._writer = None
 
     def is_available(self):
         """Can we use this approach for download"""
@@ -185,6 +318,8 @@ class GetURLpyCurl(GetURL):
         pyc.setopt(pyc.CONNECTTIMEOUT, self.ctimeout)
         pyc.setopt(pyc.TIMEOUT, self.timeout)
         pyc.setopt(pyc.PROXY, self.http_proxy)
+        if hasattr(pyc, "TCP_KEEPALIVE"):
+            pyc.setopt(pyc.TCP_KEEPALIVE, 1)
         if Msg.level >= Msg.VER:
             pyc.setopt(pyc.VERBOSE, True)
         else:
@@ -235,7 +370,13 @@ class GetURLpyCurl(GetURL):
             except(IOError, OSError):
                 Msg().err("Error: opening download file: %s" % output_file)
                 raise
-            pyc.setopt(pyc.WRITEDATA, filep)
+            if "digest" in kwargs and kwargs["digest"]:
+                self._writer = DigestWriter(filep, kwargs["digest"])
+                if openflags == "ab":
+                    self._writer.seed(output_file)
+                pyc.setopt(pyc.WRITEFUNCTION, self._writer.write)
+            else:
+                pyc.setopt(pyc.WRITEDATA, filep)
         else:
             filep = None
             output_file = ""
@@ -243,22 +384,33 @@ class GetURLpyCurl(GetURL):
         hdr.data["X-ND-CURLSTATUS"] = 0
         return(output_file, filep)
 
+    def _get_engine(self):
+        """Multi handle engine shared by all requests of this object"""
+        if self._engine is None:
+            self._engine = CurlMultiEngine()
+        return self._engine
+
     def get(self, *args, **kwargs):
         """http get implementation using the PyCurl"""
         hdr = CurlHeader()
         buf = strio()
-        pyc = pycurl.Curl()
+        engine = self._get_engine()
+        pyc = engine.acquire()
         self._set_defaults(pyc, hdr)
+        self._writer = None
         try:
             (output_file, filep) = \
                     self._mkpycurl(pyc, hdr, buf, *args, **kwargs)
             Msg().out("Debug: curl url", self._url, l=Msg.DBG)
             Msg().out("Debug: curl arg ", kwargs, l=Msg.DBG)
-            pyc.perform()     # call pyculr
+            (errno, errstr) = engine.perform([pyc])[0]     # call pyculr
         except(IOError, OSError):
+            engine.release(pyc)
             return (None, None)
         except pycurl.error as error:
-            errno, errstr = error.args
+            (errno, errstr) = error.args
+        engine.release(pyc)
+        if errno:
             hdr.data["X-ND-CURLSTATUS"] = errno
             if not hdr.data["X-ND-HTTPSTATUS"]:
                 hdr.data["X-ND-HTTPSTATUS"] = errstr
@@ -271,6 +423,9 @@ class GetURLpyCurl(GetURL):
             pass
         elif "ofile" in kwargs:
             filep.close()
+            if (self._writer and not errno and status_code in (200, 206) and
+                    self._writer.digest()):
+                hdr.data["X-ND-DIGEST"] = self._writer.digest()
             if status_code == 206 and "resume" in kwargs:
                 pass
             elif status_code == 416 and "resume" in kwargs:
@@ -413,3 +568,258 @@ class GetURLexeCurl(GetURL):
         FileUtil(self._files["error_file"]).remove()
         FileUtil(self._files["header_file"]).remove()
         return (hdr, buf)
+
+
+class GetURLhttpClient(GetURL):
+    """Downloader implementation using the python http client library.
+    Used when PyCurl is not available to avoid forking a curl process
+    per request. Connections are kept open per host and reused across
+    requests, data is written directly to the output file.
+    """
+
+    def __init__(self):
+        GetURL.__init__(self)
+        self._url = None
+        self._conns = {}
+        self._conn_key = None
+
+    def is_available(self):
+        """Can we use this approach for download"""
+        try:
+            dummy = httpclient.HTTPSConnection
+            dummy = ssl.create_default_context
+        except (NameError, AttributeError):
+            return False
+        return self.is_proxy_supported(self.http_proxy)
+
+    def is_proxy_supported(self, http_proxy):
+        """Only http proxies are supported, socks proxies are not"""
+        return (not http_proxy) or http_proxy.startswith("http://")
+
+    def _select_implementation(self):
+        """Override the parent class method"""
+        return
+
+    def _ssl_context(self):
+        """Create SSL context with or without verification"""
+        context = ssl.create_default_context()
+        if self.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _get_conn(self, urlp, proxy):
+        """Get a persistent connection for scheme, host and port"""
+        self._conn_key = (urlp.scheme, urlp.netloc, proxy)
+        if self._conn_key in self._conns:
+            return self._conns[self._conn_key]
+        if proxy:
+            host = urlsplit(proxy).netloc
+        else:
+            host = urlp.netloc
+        if urlp.scheme == "https":
+            conn = httpclient.HTTPSConnection(host,
+                                              context=self._ssl_context())
+            if proxy:
+                conn.set_tunnel(urlp.netloc)
+        elif urlp.scheme == "http":
+            conn = httpclient.HTTPConnection(host)
+        else:
+            raise httpclient.HTTPException("Unsupported protocol")
+        self._conns[self._conn_key] = conn
+        return conn
+
+    def _close_conn(self):
+        """Close and forget the connection used by the last request"""
+        conn = self._conns.pop(self._conn_key, None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        """Close all persistent connections"""
+        for conn in self._conns.values():
+            conn.close()
+        self._conns = {}
+
+    def _mkheaders(self, url, **kwargs):
+        """Prepare request headers according to invocation options"""
+        headers = {}
+        if self.agent:
+            headers["User-Agent"] = self.agent
+        if "post" in kwargs:
+            headers["Content-Type"] = "application/json"
+        if "ofile" in kwargs and "resume" in kwargs and kwargs["resume"]:
+            resume_from = FileUtil(kwargs["ofile"]).size()
+            if resume_from > 0:
+                headers["Range"] = "bytes=%d-" % resume_from
+        for header_item in kwargs.get("header", []):
+            if str(header_item).startswith("Authorization: Bearer"):
+                if "Signature=" in url:
+                    continue
+                if "redirect" in kwargs:
+                    continue
+            pair = str(header_item).split(":", 1)
+            if len(pair) != 2:
+                continue
+            (key, value) = (pair[0].strip(), pair[1].strip())
+            if key in headers:
+                headers[key] += ", " + value
+            else:
+                headers[key] = value
+        return headers
+
+    def _request(self, method, url, body, **kwargs):
+        """Send a request over a persistent connection. If a reused
+        connection was meanwhile closed by the server the request is
+        retried once over a new connection.
+        """
+        urlp = urlsplit(url)
+        path = urlp.path if urlp.path else "/"
+        if urlp.query:
+            path += "?" + urlp.query
+        proxy = kwargs.get("proxy") or self.http_proxy
+        if not self.is_proxy_supported(proxy):
+            raise httpclient.HTTPException("Unsupported proxy " + proxy)
+        if proxy and urlp.scheme == "http":
+            path = url
+        headers = self._mkheaders(url, **kwargs)
+        timeout = kwargs.get("timeout", self.timeout)
+        if "ofile" in kwargs:
+            timeout = self.download_timeout
+        for retry in (True, False):
+            conn = self._get_conn(urlp, proxy)
+            reused = conn.sock is not None
+            try:
+                if not reused:
+                    conn.timeout = kwargs.get("ctimeout", self.ctimeout)
+                    if Msg.level >= Msg.VER or kwargs.get("v"):
+                        conn.set_debuglevel(1)
+                    conn.connect()
+                conn.sock.settimeout(timeout)
+                conn.request(method, path, body, headers)
+                return conn.getresponse()
+            except (IOError, OSError, httpclient.HTTPException):
+                self._close_conn()
+                if not (reused and retry):
+                    raise
+        return None
+
+    def _urlopen(self, hdr, **kwargs):
+        """Perform the request and follow redirects if requested"""
+        method = "GET"
+        body = None
+        if "post" in kwargs:
+            method = "POST"
+            body = json.dumps(kwargs["post"])
+        if "nobody" in kwargs and kwargs["nobody"]:
+            method = "HEAD"
+        max_redirects = 0
+        if "follow" in kwargs and kwargs["follow"]:
+            max_redirects = 10
+        url = self._url
+        while True:
+            response = self._request(method, url, body, **kwargs)
+            location = response.getheader("location")
+            if not (max_redirects and location and
+                    300 <= response.status <= 308):
+                break
+            response.read()
+            max_redirects -= 1
+            url = urljoin(url, location)
+        http_version = "HTTP/1.0" if response.version == 10 else "HTTP/1.1"
+        hdr.write("%s %d %s" % (http_version, response.status,
+                                response.reason))
+        for (key, value) in response.getheaders():
+            hdr.write("%s: %s" % (key, value))
+        return response
+
+    def _copy(self, response, filep, timeout):
+        """Copy the response body to a file or buffer"""
+        deadline = time.time() + timeout
+        while True:
+            data = response.read(1024 * 1024)
+            if not data:
+                break
+            filep.write(data)
+            if time.time() > deadline:
+                raise socket.timeout("Operation timed out")
+
+    def _readbody(self, response, hdr, buf, **kwargs):
+        """Read the response body into the output file or buffer"""
+        if hdr.sizeonly and "location" not in hdr.data:
+            self._close_conn()          # header only, do not read data
+            return
+        if "ofile" in kwargs and response.status in (200, 206):
+            openflags = "wb"
+            if response.status == 206:
+                openflags = "ab"
+            try:
+                filep = open(kwargs["ofile"], openflags)
+            except (IOError, OSError):
+                Msg().err("Error: opening download file:", kwargs["ofile"])
+                self._close_conn()
+                hdr.data["X-ND-CURLSTATUS"] = 23
+                return
+            writer = filep
+            if "digest" in kwargs and kwargs["digest"]:
+                writer = DigestWriter(filep, kwargs["digest"])
+                if openflags == "ab":
+                    writer.seed(kwargs["ofile"])
+            try:
+                self._copy(response, writer, self.download_timeout)
+            finally:
+                filep.close()
+            if writer is not filep and writer.digest():
+                hdr.data["X-ND-DIGEST"] = writer.digest()
+        else:
+            self._copy(response, buf, kwargs.get("timeout", self.timeout))
+
+    def _curl_error(self, error):
+        """Translate an exception into a curl error code and message"""
+        if isinstance(error, socket.timeout):
+            return (28, "Operation timed out")
+        if isinstance(error, socket.gaierror):
+            return (6, "Could not resolve host")
+        if isinstance(error, ssl.SSLError):
+            return (35, "SSL connect error: %s" % str(error))
+        if isinstance(error, httpclient.HTTPException):
+            return (56, "Failure when receiving data: %s" % str(error))
+        return (7, "Failed to connect: %s" % str(error))
+
+    def get(self, *args, **kwargs):
+        """http get implementation using the python http client"""
+        hdr = CurlHeader()
+        buf = strio()
+        self._url = str(args[0])
+        if "sizeonly" in kwargs:
+            hdr.sizeonly = True
+        hdr.data["X-ND-CURLSTATUS"] = 0
+        Msg().out("Debug: http url", self._url, l=Msg.DBG)
+        Msg().out("Debug: http arg ", kwargs, l=Msg.DBG)
+        try:
+            response = self._urlopen(hdr, **kwargs)
+            self._readbody(response, hdr, buf, **kwargs)
+        except (IOError, OSError, httpclient.HTTPException) as error:
+            self._close_conn()
+            (errno, errstr) = self._curl_error(error)
+            hdr.data["X-ND-CURLSTATUS"] = errno
+            if not hdr.data["X-ND-HTTPSTATUS"]:
+                hdr.data["X-ND-HTTPSTATUS"] = errstr
+        status_code = self.get_status_code(hdr.data["X-ND-HTTPSTATUS"])
+        if "header" in kwargs:
+            hdr.data["X-ND-HEADERS"] = kwargs["header"]
+        if status_code == 401:  # needs authentication
+            pass
+        elif 300 <= status_code <= 308:  # redirect
+            pass
+        elif "ofile" in kwargs:
+            if status_code == 206 and "resume" in kwargs:
+                pass
+            elif status_code == 416 and "resume" in kwargs:
+                kwargs["resume"] = False
+                (hdr, buf) = self.get(self._url, **kwargs)
+            elif status_code != 200:
+                Msg().err("Error: in download: " + str(
+                    hdr.data["X-ND-HTTPSTATUS"]))
+                FileUtil(kwargs["ofile"]).remove()
+        return (hdr, buf)
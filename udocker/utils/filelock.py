@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Advisory locking of repository files between processes"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from udocker.msg import Msg
+
+
+class FileLock(object):
+    """Advisory lock on a lock file shared by all udocker processes
+    using the same repository. POSIX record locks from fcntl.lockf()
+    are used as these are also enforced across NFS clients by the
+    NFS lock manager. POSIX locks are owned by the process, therefore
+    threads of the same process are serialized with a threading lock
+    and the lock is reentrant for the thread holding it, nested
+    acquisitions keep the type of the outermost lock.
+    When the lock file cannot be created, such as in a read-only
+    repository, only the threads of the process are serialized.
+    """
+
+    _guard = threading.Lock()
+    _held = {}                  # lock file -> [RLock, file, count]
+
+    def __init__(self, lockfile, shared=False):
+        self.lockfile = lockfile
+        self.shared = shared
+        with FileLock._guard:
+            self._entry = FileLock._held.setdefault(
+                lockfile, [threading.RLock(), None, 0])
+
+    def _open(self):
+        """Open the lock file creating it and its directory"""
+        try:
+            lockdir = os.path.dirname(self.lockfile)
+            if not os.path.isdir(lockdir):
+                os.makedirs(lockdir)
+        except (IOError, OSError):
+            pass
+        try:
+            filep = open(self.lockfile, "a+")
+        except (IOError, OSError):
+            Msg().out("Debug: cannot create lock:", self.lockfile,
+                      l=Msg.DBG)
+            return None
+        try:
+            os.utime(self.lockfile, None)   # last use for gc
+        except (IOError, OSError):
+            pass
+        return filep
+
+    def _lockf(self, filep):
+        """Lock the file waiting if it is held by another process"""
+        mode = (fcntl.LOCK_EX, fcntl.LOCK_SH)[bool(self.shared)]
+        try:
+            fcntl.lockf(filep.fileno(), mode | fcntl.LOCK_NB)
+            return True
+        except (IOError, OSError):
+            pass
+        Msg().out("Info: waiting for lock:", self.lockfile, l=Msg.INF)
+        try:
+            fcntl.lockf(filep.fileno(), mode)
+            return True
+        except (IOError, OSError):
+            Msg().out("Debug: cannot lock:", self.lockfile, l=Msg.DBG)
+            return False
+
+    def acquire(self):
+        """Acquire the lock, blocks until available"""
+        self._entry[0].acquire()
+        self._entry[2] += 1
+        if self._entry[2] == 1 and fcntl is not None:
+            filep = self._open()
+            if filep and not self._lockf(filep):
+                filep.close()
+                filep = None
+            self._entry[1] = filep
+        return True
+
+    def release(self):
+        """Release the lock"""
+        self._entry[2] -= 1
+        if not self._entry[2] and self._entry[1]:
+            try:
+                fcntl.lockf(self._entry[1].fileno(), fcntl.LOCK_UN)
+            except (IOError, OSError):
+                pass
+            self._entry[1].close()
+            self._entry[1] = None
+        self._entry[0].release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -13,6 +13,7 @@ from udocker.helper.unique import Unique
 from udocker.helper.hostinfo import HostInfo
 from udocker.utils.uprocess import Uprocess
 from udocker.utils.uvolume import Uvolume
+from udocker.utils.parallel import run_parallel
 
 
 class FileUtil(object):
@@ -359,6 +360,91 @@ class FileUtil(object):
         except (IOError, OSError, TypeError):
             return -1
 
+    def _du_usage(self, fstat):
+        """Disk space used by a file from its stat"""
+        blocks = getattr(fstat, "st_blocks", None)
+        if blocks is None:
+            return fstat.st_size
+        return blocks * 512
+
+    def _du_listdir(self, directory):
+        """List a directory as (pathname, lstat) tuples"""
+        entries = []
+        try:
+            if hasattr(os, "scandir"):
+                for entry in os.scandir(directory):
+                    try:
+                        entries.append((entry.path,
+                                        entry.stat(follow_symlinks=False)))
+                    except OSError:
+                        pass
+            else:
+                for name in os.listdir(directory):
+                    try:
+                        pathname = directory + '/' + name
+                        entries.append((pathname, os.lstat(pathname)))
+                    except OSError:
+                        pass
+        except (IOError, OSError):
+            pass
+        return entries
+
+    def _du_walk(self, directory, dev, links):
+        """Disk usage of the entries below a directory in the device
+        dev, files with several hardlinks are recorded in links by
+        inode instead so that they are counted only once
+        """
+        usage = 0
+        pending = [directory]
+        while pending:
+            for (pathname, fstat) in self._du_listdir(pending.pop()):
+                if fstat.st_dev != dev:
+                    continue
+                if stat.S_ISDIR(fstat.st_mode):
+                    pending.append(pathname)
+                elif fstat.st_nlink > 1:
+                    links[fstat.st_ino] = self._du_usage(fstat)
+                    continue
+                usage += self._du_usage(fstat)
+        return usage
+
+    def disk_usage(self, workers=1):
+        """Disk usage in bytes of a directory tree as in du -s -x,
+        the top level directories can be walked concurrently
+        """
+        try:
+            rstat = os.lstat(self.filename)
+        except (IOError, OSError, TypeError):
+            return -1
+        usage = self._du_usage(rstat)
+        if not stat.S_ISDIR(rstat.st_mode):
+            return usage
+        links = {}
+        if workers <= 1:
+            usage += self._du_walk(self.filename, rstat.st_dev, links)
+            return usage + sum(links.values())
+        subdirs = []
+        for (pathname, fstat) in self._du_listdir(self.filename):
+            if fstat.st_dev != rstat.st_dev:
+                continue
+            if stat.S_ISDIR(fstat.st_mode):
+                subdirs.append(pathname)
+            elif fstat.st_nlink > 1:
+                links[fstat.st_ino] = self._du_usage(fstat)
+                continue
+            usage += self._du_usage(fstat)
+
+        def _du_subdir(subdir):
+            """Walk a top level directory"""
+            sublinks = {}
+            return (self._du_walk(subdir, rstat.st_dev, sublinks), sublinks)
+
+        results = run_parallel(_du_subdir, subdirs, workers)
+        for (subusage, sublinks) in results.values():
+            usage += subusage
+            links.update(sublinks)
+        return usage + sum(links.values())
+
     def getdata(self, mode="rb", size=-1):
         """Read file content to a buffer"""
         try:
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Single pass extraction of image layers using python tarfile"""
+
+import os
+import re
+import tarfile
+
+from udocker.msg import Msg
+from udocker.utils.fileutil import FileUtil
+
+
+class LayerExtractor(object):
+    """Extract image layers into a directory reading each layer once.
+    Whiteouts are applied while the layer is streamed, permissions are
+    set when files are created so that the next layer can always be
+    extracted, devices are not created and dev/* is skipped as with
+    the tar executable in ContainerStructure._untar_layers().
+    """
+
+    exclude_regex = re.compile(r"(^|/)(dev|etc/udev/devices)/.")
+
+    def __init__(self, destdir):
+        self.destdir = os.path.realpath(destdir)
+        self.umask = os.umask(0o022)
+        os.umask(self.umask)
+        self._layer_paths = set()
+
+    def is_supported(self, tarf):
+        """Can this tar file be read by tarfile, compressions such as
+        zstd are not supported and must use the tar executable
+        """
+        if tarf == '-':
+            return False
+        try:
+            with tarfile.open(tarf, "r|*"):
+                return True
+        except (IOError, OSError, tarfile.TarError, EOFError):
+            return False
+
+    def _member_path(self, name):
+        """Normalized relative pathname of a tar member or empty string
+        if the name would escape the destination directory
+        """
+        name = name.replace("\\", "/")
+        components = [comp for comp in name.split("/")
+                      if comp and comp != "."]
+        if not components or ".." in components:
+            return ""
+        return "/".join(components)
+
+    def _is_inside(self, pathname):
+        """Check that the real location is within the destination"""
+        realpath = os.path.realpath(pathname)
+        return (realpath == self.destdir or
+                realpath.startswith(self.destdir + "/"))
+
+    def _remove(self, pathname):
+        """Remove a file, link or directory tree in the destination"""
+        if os.path.isdir(pathname) and not os.path.islink(pathname):
+            FileUtil(pathname).remove(recursive=True)
+        elif os.path.lexists(pathname):
+            try:
+                os.unlink(pathname)
+            except (IOError, OSError):
+                FileUtil(pathname).remove()
+
+    def _whiteout(self, relpath):
+        """Remove files from lower layers hidden by a whiteout entry"""
+        (dirname, basename) = os.path.split(relpath)
+        dirpath = os.path.join(self.destdir, dirname)
+        if not (os.path.isdir(dirpath) and self._is_inside(dirpath)):
+            return
+        if basename == ".wh..wh..opq":
+            names = os.listdir(dirpath)
+        else:
+            names = [basename[len(".wh."):], ]
+        for name in names:
+            if os.path.join(dirname, name) in self._layer_paths:
+                continue        # created by this layer, not a lower one
+            self._remove(os.path.join(dirpath, name))
+
+    def _prepare(self, member, targetpath):
+        """Create parent directories and remove an existing entry
+        that cannot be overwritten by the new member
+        """
+        parent = os.path.dirname(targetpath)
+        if not self._is_inside(parent):
+            raise OSError("path outside of destination: " + member.name)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        if os.path.islink(targetpath) or (
+                os.path.lexists(targetpath) and
+                not (member.isdir() and os.path.isdir(targetpath))):
+            self._remove(targetpath)
+
+    def _copy_data(self, tar, member, targetpath):
+        """Write the content of a regular file"""
+        source = tar.extractfile(member)
+        with open(targetpath, "wb") as filep:
+            while True:
+                data = source.read(1024 * 1024)
+                if not data:
+                    break
+                filep.write(data)
+
+    def _extract_member(self, tar, member, relpath):
+        """Create a single tar member in the destination directory"""
+        targetpath = os.path.join(self.destdir, relpath)
+        if member.ischr() or member.isblk():
+            return True
+        self._prepare(member, targetpath)
+        mode = member.mode & 0o777 & ~self.umask
+        if member.isdir():
+            if not os.path.isdir(targetpath):
+                os.mkdir(targetpath, 0o700)
+            os.chmod(targetpath, mode | 0o700)
+        elif member.issym():
+            os.symlink(member.linkname, targetpath)
+        elif member.islnk():
+            linkpath = self._member_path(member.linkname)
+            if not linkpath:
+                return False
+            linkpath = os.path.join(self.destdir, linkpath)
+            if not self._is_inside(linkpath):
+                return False
+            os.link(linkpath, targetpath)
+        elif member.isfifo():
+            os.mkfifo(targetpath, mode | 0o600)
+        elif member.isfile():
+            self._copy_data(tar, member, targetpath)
+            os.chmod(targetpath, mode | 0o600)
+            os.utime(targetpath, (member.mtime, member.mtime))
+        return True
+
+    def extract(self, tarf):
+        """Extract one layer tar file, returns False on errors"""
+        status = True
+        verbose = Msg.level >= Msg.VER
+        self._layer_paths = set()
+        try:
+            with tarfile.open(tarf, "r|*") as tar:
+                for member in tar:
+                    relpath = self._member_path(member.name)
+                    if not relpath:
+                        continue
+                    basename = os.path.basename(relpath)
+                    if basename.startswith(".wh."):
+                        self._whiteout(relpath)
+                        continue
+                    if self.exclude_regex.search(relpath):
+                        continue
+                    try:
+                        if not self._extract_member(tar, member, relpath):
+                            raise OSError("invalid link " + member.linkname)
+                    except (IOError, OSError) as error:
+                        Msg().err("Error: extracting:", member.name,
+                                  str(error), l=Msg.VER)
+                        status = False
+                        continue
+                    self._layer_paths.add(relpath)
+                    if verbose:
+                        Msg().out(relpath, l=Msg.VER)
+        except (IOError, OSError, tarfile.TarError, EOFError) as error:
+            Msg().err("Error: reading layer:", tarf, str(error))
+            status = False
+        self._layer_paths = set()
+        return status
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Run a function over several items with a pool of threads"""
+
+import sys
+import threading
+
+# if Python 3
+if sys.version_info[0] >= 3:
+    import queue
+else:
+    import Queue as queue
+
+
+def run_parallel(func, items, workers):
+    """Call func(item) for each distinct item using up to workers
+    daemon threads, with one worker or less the items are processed
+    in the calling thread. Items are started in the given order.
+    Returns a dictionary with the result of each item.
+    """
+    results = {}
+    pending = queue.Queue()
+    for item in items:
+        if item not in results:
+            results[item] = None
+            pending.put(item)
+    results.clear()
+
+    def _worker():
+        """Process items until the queue is empty"""
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            results[item] = func(item)
+
+    threads = []
+    if workers > 1:
+        for dummy in range(min(workers, pending.qsize())):
+            thread = threading.Thread(target=_worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if not threads:
+        _worker()
+    return results